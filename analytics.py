@@ -0,0 +1,455 @@
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+import archive
+import roster
+import storage
+
+# Columnar snapshot of the service table for trend queries that span years
+# (year over year, one festival against the last). Reports read and parse
+# every row of their range with pandas; here each column that trends group
+# or sum by is kept as a flat little-endian array in its own file under
+# storage.analytics_dir(), and loaded with numpy.memmap, so a query over
+# ten years touches a few megabytes that are usually already in the page
+# cache and is answered with vectorized masks and bincounts.
+#
+# The snapshot is append-only. It remembers the last sync_log seq it has
+# read (see sync.py) and an update appends only the services logged after
+# it, so keeping it current costs as much as the new sales. A rebuild
+# writes a new generation of files and then switches meta.json to it, so
+# arrays a reader has already mapped are never truncated. Text columns are
+# stored as small integer codes whose values are listed in meta.json; days
+# are the temple's local days (roster.UTC_OFFSET) counted from 1970-01-01,
+# the same days as the daily rollups.
+#
+# numpy is imported inside the functions that use it, as reports.py does
+# with pandas, so importing this module does not slow the kiosk's start.
+
+# 2: local days instead of UTC days
+FORMAT_VERSION = 2
+
+# Column name: numpy dtype of its file
+COLUMNS = {
+    'day': '<i4',
+    'service_type': '<i2',
+    'payment_method': '<i1',
+    'invoice_type': '<i1',
+    'frequency': '<i1',
+    'amount': '<f8',
+}
+
+# Stored as an index into meta['codes'][column]
+CODED = ('payment_method', 'invoice_type', 'frequency')
+
+# Columns a trend can be split by
+SPLITS = ('service_type', 'payment_method', 'invoice_type', 'frequency')
+
+BUCKETS = ('day', 'week', 'month', 'year')
+
+# A trend query brings the snapshot up to date at most this often
+REFRESH_SECONDS = 10
+
+# 1970-01-05 was a Monday; weeks start on Mondays
+_MONDAY = 4
+
+# Local day of a created_at, in days since 1970-01-01
+EPOCH_DAY = ("CAST(julianday(date(substr({column}, 1, 19), '" + roster.DAY_MODIFIER + "')) "
+             "- 2440587.5 AS INTEGER)")
+
+SELECT_ROWS = (
+    "SELECT " + EPOCH_DAY.format(column='created_at') + ", "
+    "service_type, payment_method, invoice_type, frequency, amount FROM service"
+)
+
+SELECT_LOGGED = (
+    "SELECT l.seq, s.id IS NOT NULL, " + EPOCH_DAY.format(column='s.created_at') + ", "
+    "s.service_type, s.payment_method, s.invoice_type, s.frequency, s.amount "
+    "FROM sync_log l LEFT JOIN service s ON s.id = l.service_id "
+    "WHERE l.seq > ? ORDER BY l.seq LIMIT ?"
+)
+
+# Rows read from the database per round trip
+FETCH_SIZE = 50000
+
+
+def _epoch_day(value):
+    return (value - date(1970, 1, 1)).days
+
+
+class Snapshot:
+    """The columnar snapshot of one database, loaded lazily and kept current"""
+
+    def __init__(self, db_path=None, directory=None):
+        self.db_path = db_path
+        self.directory = directory or storage.analytics_dir(db_path)
+        self.meta = None
+        self.arrays = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # -- files ---------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _column_path(self, meta, column):
+        return self._path(f"{column}.{meta['generation']}.bin")
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Serialize writers across threads and processes (e.g. the CLI next to the server)"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self._path('lock'), 'w') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json')) as handle:
+                meta = json.load(handle)
+        except FileNotFoundError:
+            return None
+        return meta if meta.get('format') == FORMAT_VERSION else None
+
+    def _write_meta(self, meta):
+        # Written last and renamed into place: the row count in meta.json is
+        # what readers trust, so a crash mid-append leaves a valid snapshot
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(temp_path, self._path('meta.json'))
+
+    def _map(self, meta):
+        import numpy as np
+        arrays = {}
+        for column, dtype in COLUMNS.items():
+            if meta['rows']:
+                # A plain ndarray view on the mapping; memmap's own indexing is slower
+                arrays[column] = np.asarray(np.memmap(self._column_path(meta, column), dtype=dtype,
+                                                      mode='r', shape=(meta['rows'],)))
+            else:
+                arrays[column] = np.empty(0, dtype=dtype)
+        return arrays
+
+    def _encode(self, rows, codes):
+        """Column arrays for rows of (day, service_type, payment_method, invoice_type, frequency, amount)"""
+        import numpy as np
+        columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+        arrays = {}
+        for (column, dtype), values in zip(COLUMNS.items(), columns):
+            if column in CODED:
+                known = codes.setdefault(column, [])
+                index = {value: number for number, value in enumerate(known)}
+                coded = []
+                for value in values:
+                    value = value or ''
+                    if value not in index:
+                        index[value] = len(known)
+                        known.append(value)
+                    coded.append(index[value])
+                values = coded
+            arrays[column] = np.asarray(values, dtype=dtype)
+        return arrays
+
+    def _append(self, meta, arrays):
+        """Append column arrays to the files and record the new row count"""
+        rows = meta['rows']
+        for column, dtype in COLUMNS.items():
+            with open(self._column_path(meta, column), 'ab') as handle:
+                # Drop whatever an interrupted append left past the known rows
+                handle.truncate(rows * arrays[column].itemsize)
+                handle.write(arrays[column].tobytes())
+        meta['rows'] = rows + len(arrays['day'])
+
+    # -- building ------------------------------------------------------
+
+    def build(self):
+        """Rebuild the snapshot from every service, archived years included (hold _exclusive)"""
+        previous = self._read_meta()
+        generation = previous['generation'] + 1 if previous else 1
+        meta = {'format': FORMAT_VERSION, 'generation': generation, 'rows': 0, 'seq': 0, 'codes': {}}
+        for column in COLUMNS:
+            open(self._column_path(meta, column), 'wb').close()
+
+        conn = storage.connect_readonly(self.db_path)
+        try:
+            archived = archive.archives(conn)
+            # Archives first, read from their own files one at a time (SQLite
+            # can only attach ten or so at once)
+            for year, file_name in sorted(archived.items()):
+                archived_conn = storage.connect_readonly(archive.archive_path(file_name, self.db_path))
+                try:
+                    self._copy(archived_conn.execute(SELECT_ROWS), meta)
+                finally:
+                    archived_conn.close()
+            # The hot rows and the log position they correspond to, read in
+            # one transaction so no sale falls between the two
+            conn.execute("BEGIN")
+            meta['seq'] = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_log").fetchone()[0]
+            # Rows of an archived year still here are from an interrupted
+            # archive run and are already counted from the archive
+            where, params = '', []
+            if archived:
+                where = " WHERE " + " AND ".join(
+                    "NOT (created_at >= ? AND created_at < ?)" for _ in archived
+                )
+                for year in archived:
+                    params.extend(archive._stamp(bound) for bound in archive.year_bounds(year))
+            self._copy(conn.execute(SELECT_ROWS + where, params), meta)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        meta['built_at'] = meta['updated_at'] = datetime.utcnow().isoformat()
+        self._write_meta(meta)
+        # Readers still holding the old generation keep their mapping
+        for name in os.listdir(self.directory):
+            if name.endswith('.bin') and not name.endswith(f".{generation}.bin"):
+                os.remove(self._path(name))
+        return meta
+
+    def _copy(self, cursor, meta):
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            self._append(meta, self._encode(rows, meta['codes']))
+
+    def update(self):
+        """
+        Append the services logged since the last update, or build the snapshot if there is none.
+
+        Returns:
+            int: Rows added
+        """
+        with self._exclusive():
+            meta = self._read_meta()
+            if meta is None:
+                meta = self.build()
+                added = meta['rows']
+            else:
+                added = self._update(meta)
+            # Also picks up rows another process (the CLI) appended or rebuilt
+            if self.meta is None or (meta['generation'], meta['rows']) != (
+                    self.meta['generation'], self.meta['rows']):
+                self.arrays = self._map(meta)
+            self.meta = meta
+            self.checked_at = time.monotonic()
+            return added
+
+    def _update(self, meta):
+        conn = storage.connect_readonly(self.db_path)
+        added = 0
+        try:
+            # A database restored from a backup older than the snapshot
+            if conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_log").fetchone()[0] < meta['seq']:
+                return self._rebuild(meta)
+            while True:
+                logged = conn.execute(SELECT_LOGGED, (meta['seq'], FETCH_SIZE)).fetchall()
+                if not logged:
+                    break
+                if not all(present for _, present, *_ in logged):
+                    # Logged services already moved to an archive
+                    return self._rebuild(meta)
+                self._append(meta, self._encode([row for _, _, *row in logged], meta['codes']))
+                meta['seq'] = logged[-1][0]
+                added += len(logged)
+        finally:
+            conn.close()
+        if added:
+            meta['updated_at'] = datetime.utcnow().isoformat()
+            self._write_meta(meta)
+        return added
+
+    def _rebuild(self, meta):
+        """Replace meta with a fresh build; returns the change in rows"""
+        before = meta['rows']
+        meta.clear()
+        meta.update(self.build())
+        return meta['rows'] - before
+
+    def current(self):
+        """(meta, arrays), updated first if the last check is older than REFRESH_SECONDS"""
+        if self.meta is None or time.monotonic() - self.checked_at > REFRESH_SECONDS:
+            self.update()
+        with self._lock:
+            return self.meta, self.arrays
+
+    # -- queries -------------------------------------------------------
+
+    def trend(self, start, end, by='month', split=None, filters=None):
+        """
+        Count and amount per bucket over [start, end), optionally split by a column.
+
+        Args:
+            start, end (date): Period; end is exclusive
+            by (str): One of BUCKETS
+            split (str): One of SPLITS, or None for one series
+            filters (dict): {column in SPLITS: value} rows must match
+
+        Returns:
+            dict: buckets (first day of each), series [{key, count[], amount[]}] and total
+        """
+        import numpy as np
+        if by not in BUCKETS:
+            raise ValueError(f"by must be one of {', '.join(BUCKETS)}")
+        if split is not None and split not in SPLITS:
+            raise ValueError(f"split must be one of {', '.join(SPLITS)}")
+        if end <= start:
+            raise ValueError("end must be after start")
+
+        meta, arrays = self.current()
+        first, last = _epoch_day(start), _epoch_day(end)
+        day = arrays['day']
+        mask = (day >= first) & (day < last)
+        for column, value in (filters or {}).items():
+            if column not in SPLITS:
+                raise ValueError(f"Cannot filter by {column}")
+            if column in CODED:
+                known = meta['codes'].get(column, [])
+                value = known.index(value) if value in known else -1
+            mask &= arrays[column] == int(value)
+
+        days = day[mask]
+        origin = _bucket([first], by)[0]
+        size = int(_bucket([last - 1], by)[0] - origin) + 1
+        if len(days):
+            # Bucket each distinct day once and look rows up by day, rather
+            # than converting every row's date
+            low = int(days.min())
+            lookup = _bucket(np.arange(low, int(days.max()) + 1), by) - origin
+            buckets = lookup[days - low]
+        else:
+            buckets = np.empty(0, dtype=np.int64)
+        amounts = arrays['amount'][mask]
+
+        if split is None:
+            keys, groups = [None], 1
+            index = buckets
+        else:
+            codes = arrays[split][mask].astype(np.int64)
+            groups = int(codes.max()) + 1 if len(codes) else 1
+            index = buckets * groups + codes
+        counts = np.bincount(index, minlength=size * groups).reshape(size, groups)
+        sums = np.bincount(index, weights=amounts, minlength=size * groups).reshape(size, groups)
+
+        if split is not None:
+            present = np.flatnonzero(counts.sum(axis=0))
+            if split in CODED:
+                keys = [meta['codes'][split][code] for code in present]
+            else:
+                keys = [int(code) for code in present]
+        else:
+            present = [0]
+        series = [
+            {'key': key, 'count': counts[:, code].tolist(), 'amount': sums[:, code].round(2).tolist()}
+            for key, code in zip(keys, present)
+        ]
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'by': by,
+            'split': split,
+            'buckets': _labels(start, size, by),
+            'series': series,
+            'total': {'count': int(counts.sum()), 'amount': round(float(sums.sum()), 2)},
+        }
+
+    def info(self):
+        meta = self._read_meta()
+        if meta is None:
+            return {'rows': 0, 'seq': 0, 'bytes': 0}
+        size = sum(os.path.getsize(self._column_path(meta, column)) for column in COLUMNS)
+        return {'rows': meta['rows'], 'seq': meta['seq'], 'bytes': size, 'generation': meta['generation'],
+                'builtAt': meta.get('built_at'), 'updatedAt': meta.get('updated_at')}
+
+
+def _bucket(days, by):
+    """Bucket number of each epoch day: days, Monday weeks, months or years since 1970"""
+    import numpy as np
+    days = np.asarray(days, dtype=np.int64)
+    if by == 'day':
+        return days
+    if by == 'week':
+        return (days - _MONDAY) // 7
+    unit = 'M' if by == 'month' else 'Y'
+    return days.astype('datetime64[D]').astype(f'datetime64[{unit}]').astype(np.int64)
+
+
+def _labels(start, size, by):
+    """First day of each of `size` buckets from the one holding start"""
+    if by == 'day':
+        return [(start + timedelta(days=offset)).isoformat() for offset in range(size)]
+    if by == 'week':
+        monday = start - timedelta(days=start.weekday())
+        return [(monday + timedelta(weeks=offset)).isoformat() for offset in range(size)]
+    labels = []
+    year, month = start.year, start.month if by == 'month' else 1
+    for _ in range(size):
+        labels.append(date(year, month, 1).isoformat())
+        if by == 'year':
+            year += 1
+        else:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return labels
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get(db_path=None):
+    """Shared per-process snapshot of a database (the configured one by default)"""
+    path = storage.database_path(db_path)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(path)
+        if snapshot is None:
+            snapshot = _snapshots[path] = Snapshot(path)
+        return snapshot
+
+
+def main():
+    from app import app, init_db
+
+    parser = argparse.ArgumentParser(description="Build or update the columnar analytics snapshot")
+    parser.add_argument('command', choices=('build', 'update', 'info', 'trend'))
+    parser.add_argument('--start', type=date.fromisoformat, help="trend: first day")
+    parser.add_argument('--end', type=date.fromisoformat, help="trend: day after the last")
+    parser.add_argument('--by', choices=BUCKETS, default='month')
+    parser.add_argument('--split', choices=SPLITS)
+    args = parser.parse_args()
+
+    init_db()
+    snapshot = get()
+    started = time.perf_counter()
+    if args.command == 'build':
+        with snapshot._exclusive():
+            meta = snapshot.build()
+        print(f"Built {meta['rows']} rows up to seq {meta['seq']} in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'update':
+        added = snapshot.update()
+        print(f"Added {added} rows in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'info':
+        print(json.dumps(snapshot.info(), indent=2))
+    else:
+        if not args.start or not args.end:
+            parser.error("trend needs --start and --end")
+        snapshot.update()
+        started = time.perf_counter()
+        result = snapshot.trend(args.start, args.end, args.by, args.split)
+        elapsed = (time.perf_counter() - started) * 1000
+        for series in result['series']:
+            print(series['key'] if series['key'] is not None else 'all')
+            for label, count, amount in zip(result['buckets'], series['count'], series['amount']):
+                print(f"  {label}  {count:>8}  {amount:>14,.2f}")
+        print(f"{result['total']['count']} services, {result['total']['amount']:,.2f} in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,150 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, Response, redirect, url_for, flash, jsonify, send_file
 from flask_login import login_user, login_required, logout_user, current_user
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import text
 
 from extensions import db, login_manager
-from models import User, Service, ServiceType, SERVICE_PRICES, PaymentMethod, InvoiceType, Frequency
-from reports import generate_monthly_report
+import storage
+import metrics
+import assets
+from models import User, Service, PaymentMethod, InvoiceType, Frequency
+from sequences import allocate, format_invoice_number
+from validation import validate_sale, validate_service_data
+from reports import generate_monthly_report, report_basename
+from migrations import run_migrations, MIGRATIONS
+import rollups
+import devotees
+import roster
+import catalog
+import report_cache
+from jobs import JobQueue, JobQueueFull
+from exports import export_range, check_format as check_export_format
+import receipts
+from spooler import PrintSpooler, PrintQueueFull, open_sink
+import sync
+import analytics
+import listing
+from group_commit import GroupCommitter, WriteQueueFull, WriteTimeout
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///temple.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Database path, pool and SQLite PRAGMAs (see storage.DEFAULTS)
+storage.configure(app)
+
+
+def load_secret_key():
+    """
+    The session signing key: TEMPLE_SECRET_KEY, else one kept in a file next to the database.
+
+    A key made up per process would log every counter out on each restart
+    and would differ between servers sharing the database.
+    """
+    if os.environ.get('TEMPLE_SECRET_KEY'):
+        return os.environ['TEMPLE_SECRET_KEY']
+    path = os.path.join(os.path.dirname(storage.database_path()), '.secret_key')
+    try:
+        # O_EXCL: if two servers start at once, exactly one writes the key
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'rb') as handle:
+            key = handle.read()
+        if key:
+            return key
+        # The winner has not written it yet
+        time.sleep(0.1)
+        with open(path, 'rb') as handle:
+            return handle.read()
+    key = os.urandom(32)
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(key)
+    return key
+
+
+app.config['SECRET_KEY'] = load_secret_key()
+# Invoice numbers reserved per worker at a time; 0 allocates one per sale
+app.config['INVOICE_BLOCK_SIZE'] = int(os.environ.get('INVOICE_BLOCK_SIZE', 0))
+# Largest batch the bulk token endpoint accepts in one transaction
+app.config['MAX_BULK_TOKENS'] = int(os.environ.get('MAX_BULK_TOKENS', 100))
+# Days ahead of today whose puja rosters are kept precomputed
+app.config['ROSTER_DAYS'] = int(os.environ.get('ROSTER_DAYS', roster.DEFAULT_DAYS))
+# Least recently used cached reports are evicted above this size
+app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Oldest range exports are deleted above this size
+app.config['EXPORTS_MAX_BYTES'] = int(os.environ.get('EXPORTS_MAX_BYTES', 500 * 1024 * 1024))
+# Receipt printer: tcp://host[:port], file:///directory or a device path such
+# as /dev/usb/lp0; empty leaves printing to the browser's print dialog
+app.config['PRINTER'] = os.environ.get('PRINTER', '')
+# escpos for thermal printers, pdf for everything else
+app.config['PRINT_FORMAT'] = os.environ.get('PRINT_FORMAT', 'escpos')
+# This kiosk's id (e.g. K1), put in front of its invoice numbers; empty on
+# the central node and on a temple with a single counter
+app.config['DEVICE_ID'] = os.environ.get('DEVICE_ID', '')
+sync.check_device_id(app.config['DEVICE_ID'])
+# Central node this kiosk pushes its sales to; empty disables pushing
+app.config['SYNC_URL'] = os.environ.get('SYNC_URL', '')
+# Shared secret; kiosks send it and the central node only accepts pushes with it
+app.config['SYNC_TOKEN'] = os.environ.get('SYNC_TOKEN', '')
+app.config['SYNC_INTERVAL'] = float(os.environ.get('SYNC_INTERVAL', 30))
+app.config['SYNC_BATCH_SIZE'] = int(os.environ.get('SYNC_BATCH_SIZE', 500))
+# 1 hands sales to one writer thread that commits those arriving together in
+# one transaction (see group_commit.py); 0 commits each sale in its request
+app.config['GROUP_COMMIT'] = int(os.environ.get('GROUP_COMMIT', 0))
+# A batch is committed after this long or once it holds GROUP_COMMIT_MAX_BATCH sales
+app.config['GROUP_COMMIT_WAIT_MS'] = float(os.environ.get('GROUP_COMMIT_WAIT_MS', 5))
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 32))
+# Seconds a sale waits for its batch's commit before the request gives up
+app.config['GROUP_COMMIT_TIMEOUT'] = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 30))
 
 # Initialize extensions
 db.init_app(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+# Per-route latency, per-request SQL and the slow query log (see metrics.DEFAULTS)
+metrics.init_app(app)
+
+# Fingerprinted, precompressed static files and the asset_url() template helper
+assets.init_app(app)
+
+# Template rendering is timed as a phase of the request
+render_template = metrics.phase('render')(render_template)
+
+# Background report jobs; one worker keeps report work off the counter's back
+report_jobs = JobQueue(app,
+                       workers=int(os.environ.get('REPORT_JOB_WORKERS', 1)),
+                       max_pending=int(os.environ.get('REPORT_JOB_MAX_PENDING', 8)))
+
+# Server-side printing; sales queue their receipt and return without waiting
+print_spooler = PrintSpooler(
+    open_sink(app.config['PRINTER']), app.config['PRINT_FORMAT'],
+    batch_size=int(os.environ.get('PRINT_BATCH_SIZE', 20)),
+    max_attempts=int(os.environ.get('PRINT_MAX_ATTEMPTS', 5))
+) if app.config['PRINTER'] else None
+
+# Offline kiosks push their new sales whenever the central node is reachable
+sync_agent = sync.SyncAgent(
+    app, app.config['SYNC_URL'], app.config['SYNC_TOKEN'],
+    app.config['SYNC_INTERVAL'], app.config['SYNC_BATCH_SIZE']
+) if app.config['SYNC_URL'] else None
+
+# Single writer for sales when GROUP_COMMIT is on; prepare_sale and
+# write_sale are looked up at call time, they are defined further down
+group_committer = GroupCommitter(
+    app, lambda service_type, data: prepare_sale(service_type, data),
+    lambda service: write_sale(service),
+    batch_size=app.config['GROUP_COMMIT_MAX_BATCH'],
+    batch_wait=app.config['GROUP_COMMIT_WAIT_MS'] / 1000
+) if app.config['GROUP_COMMIT'] else None
+
+# Set by serve.py when a shutdown starts; /health then answers 503
+draining = threading.Event()
+started_at = time.monotonic()
 
 @login_manager.user_loader
+@metrics.phase('load_user')
 def load_user(user_id):
     return User.query.get(int(user_id))
 
@@ -26,6 +152,57 @@ def load_user(user_id):
 def index():
     return render_template('index.html')
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once the server answers and the schema is current"""
+    try:
+        version = db.session.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'status': 'error'}), 503
+    
+    if (version or 0) < MIGRATIONS[-1][0]:
+        return jsonify({'message': 'Database migrations are pending', 'status': 'error'}), 503
+    return jsonify({'status': 'ready', 'schemaVersion': version}), 200
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness probe: the database answers and the server is not shutting down"""
+    checks = {'database': 'ok', 'draining': draining.is_set(),
+              'reportJobs': report_jobs.active_count(),
+              'uptimeSeconds': round(time.monotonic() - started_at, 1)}
+    if print_spooler:
+        checks['printJobsPending'] = print_spooler.pending()
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception as e:
+        db.session.rollback()
+        checks['database'] = str(e)
+    healthy = checks['database'] == 'ok' and not checks['draining']
+    return jsonify({'status': 'ok' if healthy else 'error', **checks}), 200 if healthy else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, SQL and report timings in the Prometheus text format"""
+    pool = db.engine.pool
+    gauges = [
+        ('temple_db_pool_checked_out', "Database connections currently in use", 'gauge', pool.checkedout()),
+        ('temple_report_jobs_active', "Report jobs queued or running", 'gauge', report_jobs.active_count()),
+    ]
+    if print_spooler:
+        gauges += [
+            ('temple_print_jobs_pending', "Print jobs waiting for the printer", 'gauge', print_spooler.pending()),
+            ('temple_print_receipts_per_minute', "Receipts printed per minute over the last minute",
+             'gauge', print_spooler.receipts_per_minute()),
+        ]
+    if sync_agent:
+        gauges.append(('temple_sync_pending_rows', "Services not yet pushed to the central node",
+                       'gauge', sync_agent.stats()['pendingRows']))
+    if group_committer:
+        gauges.append(('temple_group_commit_pending_sales', "Sales waiting for the group commit writer",
+                       'gauge', group_committer.pending()))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -51,18 +228,143 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Convert ServiceType enum to a dict for template use
-    service_types_dict = {
-        service_type.value: {
-            'name': service_type.name,
-            'value': service_type.value
-        }
-        for service_type in ServiceType
-    }
+    # Services and today's prices from the cached catalog snapshot
+    snapshot = catalog.get()
     
     return render_template('dashboard.html', 
-                         service_types=service_types_dict, 
-                         service_prices=SERVICE_PRICES)
+                         service_types=snapshot.service_types, 
+                         service_prices=snapshot.current_prices())
+
+def build_service(service_type, data, invoice_number=None):
+    """Build an unsaved Service from a request body (numbered later by save_service when not given)"""
+    service = Service(
+        service_type=service_type,
+        invoice_type=data.get('invoiceType'),
+        frequency=data.get('frequency', 'SINGLE'),
+        payment_method=data.get('paymentMethod'),
+        devotee_name=data.get('devoteeName'),
+        contact_number=data.get('devoteeContactNum'),
+        gothram=data.get('gothram'),
+        puja_details=data.get('pujaDetails'),
+        service_name=catalog.get().names[service_type],
+        invoice_number=invoice_number,
+        valid_till=Service.calculate_valid_till(data.get('frequency', 'SINGLE')),
+        amount=Service.calculate_amount(service_type, data.get('frequency', 'SINGLE'))
+    )
+    
+    # Set address fields if provided
+    if data.get('address'):
+        addr = data['address']
+        service.address1 = addr.get('address1')
+        service.address2 = addr.get('address2')
+        service.address3 = addr.get('address3')
+        service.address4 = addr.get('address4')
+        service.city = addr.get('city')
+        service.district = addr.get('district')
+        service.state = addr.get('state')
+        service.pincode = addr.get('pincode')
+    
+    return service
+
+def prepare_sale(service_type, data):
+    """Build a sale for the group commit writer, before its batch writes anything"""
+    # A sale that cannot be written would fail the whole batch's commit
+    validate_sale(service_type, data)
+    service = build_service(service_type, data)
+    if app.config['INVOICE_BLOCK_SIZE']:
+        # A new block is reserved on a connection of its own, which would wait
+        # on the write lock the batch's transaction holds once it has written
+        service.invoice_number = Service.generate_invoice_number(
+            service.invoice_type, app.config['INVOICE_BLOCK_SIZE']
+        )
+    return service
+
+def save_service(service):
+    """Number a built sale (unless prepare_sale did) and add it to the session with its rollup, devotee and roster updates"""
+    if service.invoice_number is None:
+        service.invoice_number = Service.generate_invoice_number(
+            service.invoice_type, app.config['INVOICE_BLOCK_SIZE']
+        )
+    db.session.add(service)
+    
+    # Keep the daily rollups and devotee directory in step within the same transaction
+    rollups.record_service(db.session, service)
+    devotees.record_service(db.session, service)
+    roster.record_service(db.session, service)
+    return service
+
+def write_sale(service):
+    """Group commit writer: save a prepared sale and return its sale_result"""
+    save_service(service)
+    db.session.flush()
+    return sale_result(service)
+
+def service_address(service):
+    """Address block for print payloads, or None when no address was given"""
+    return {
+        'address1': service.address1,
+        'address2': service.address2,
+        'address3': service.address3,
+        'address4': service.address4,
+        'city': service.city,
+        'district': service.district,
+        'state': service.state,
+        'pincode': service.pincode
+    } if service.address1 else None
+
+def service_print_data(service):
+    """Print payload in the shape updatePrintPreview in dashboard.html expects"""
+    return {
+        'invoiceType': service.invoice_type,
+        'invoiceNumber': service.invoice_number,
+        'serviceName': catalog.get().display_names[service.service_type],
+        'gothram': service.gothram,
+        'devoteeName': service.devotee_name,
+        'pujaDetails': service.puja_details,
+        'address': service_address(service),
+        'amount': service.amount,
+        'validTill': service.valid_till.isoformat()
+    }
+
+def sale_result(service):
+    """What create_service answers with, read while the sale's session is open"""
+    return {'id': service.id, 'printData': service_print_data(service)}
+
+def spool(print_data):
+    """Queue a committed sale's receipt; the sale stands even if the printer queue is full"""
+    try:
+        return print_spooler.submit(print_data).id
+    except PrintQueueFull as e:
+        app.logger.warning("Not printed: %s", e)
+        return None
+
+@app.route('/temple-management/services', methods=['GET'])
+@login_required
+def list_services():
+    """
+    Services newest first, one page at a time.
+
+    Query: optional start/end (YYYY-MM-DD, end exclusive) and filters
+    invoiceNumber, serviceType, paymentMethod, invoiceType, devoteeId,
+    devoteeContactNum; fields (comma separated, see listing.FIELDS); limit;
+    cursor (nextCursor of the previous page).
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else None
+        if start and end and end <= start:
+            raise ValueError("end must be after start")
+        limit = int(request.args.get('limit', listing.DEFAULT_LIMIT))
+        if not 1 <= limit <= listing.MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {listing.MAX_LIMIT}")
+        fields = listing.parse_fields(request.args.get('fields'))
+        cursor = listing.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        filters = {name: request.args[name] for name in listing.FILTERS if request.args.get(name)}
+        services, next_cursor = listing.page(db.session, filters, fields, start, end, cursor, limit)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+
+    return jsonify({'status': 'success', 'services': services, 'nextCursor': next_cursor}), 200
 
 @app.route('/temple-management/services', methods=['POST'])
 @login_required
@@ -71,63 +373,293 @@ def create_service():
         service_type = int(request.args.get('serviceType'))
         data = request.get_json()
         
-        # Create service
-        service = Service(
-            service_type=service_type,
-            invoice_type=data.get('invoiceType'),
-            frequency=data.get('frequency', 'SINGLE'),
-            payment_method=data.get('paymentMethod'),
-            devotee_name=data.get('devoteeName'),
-            contact_number=data.get('devoteeContactNum'),
-            gothram=data.get('gothram'),
-            puja_details=data.get('pujaDetails'),
-            service_name=ServiceType(service_type).name,
-            invoice_number=Service.generate_invoice_number(data.get('invoiceType')),
-            valid_till=Service.calculate_valid_till(data.get('frequency', 'SINGLE')),
-            amount=Service.calculate_amount(service_type, data.get('frequency', 'SINGLE'))
-        )
-        
-        # Set address fields if provided
-        if data.get('address'):
-            addr = data['address']
-            service.address1 = addr.get('address1')
-            service.address2 = addr.get('address2')
-            service.address3 = addr.get('address3')
-            service.address4 = addr.get('address4')
-            service.city = addr.get('city')
-            service.district = addr.get('district')
-            service.state = addr.get('state')
-            service.pincode = addr.get('pincode')
-        
-        db.session.add(service)
-        db.session.commit()
+        if group_committer:
+            # Turn a bad request away before it can join a batch
+            validate_sale(service_type, data)
+            # Hand this request's pooled connection back first; waiting
+            # requests holding them all would leave none for the writer
+            db.session.close()
+            # Returns once the batch holding this sale is committed
+            sale = group_committer.submit(service_type, data).result(app.config['GROUP_COMMIT_TIMEOUT'])
+        else:
+            service = save_service(build_service(service_type, data))
+            db.session.commit()
+            sale = sale_result(service)
+        print_data = sale['printData']
         
         # Prepare response with print data
         response_data = {
             'message': 'Service created successfully',
-            'id': service.invoice_number,
-            'amount': service.amount,
-            'validTill': service.valid_till.isoformat(),
-            'serviceName': ServiceType(service_type).name.replace('_', ' ').title(),
+            'id': print_data['invoiceNumber'],
+            'amount': print_data['amount'],
+            'validTill': print_data['validTill'],
+            'serviceName': catalog.get().display_names[service_type],
             'devoteeName': data.get('devoteeName'),
             'gothram': data.get('gothram'),
             'pujaDetails': data.get('pujaDetails'),
-            'address': {
-                'address1': service.address1,
-                'address2': service.address2,
-                'address3': service.address3,
-                'address4': service.address4,
-                'city': service.city,
-                'district': service.district,
-                'state': service.state,
-                'pincode': service.pincode
-            } if service.address1 else None
+            'address': print_data['address']
         }
+        if print_spooler:
+            response_data['printJob'] = spool(print_data)
         
         return jsonify(response_data), 200
+    except (WriteQueueFull, WriteTimeout) as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 503
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': str(e)}), 400
 
+@app.route('/temple-management/services/bulk', methods=['POST'])
+@login_required
+def create_services_bulk():
+    """
+    Issue several tokens, across service types, in one transaction.
+    
+    Body: the usual service fields shared by every token, plus
+    items: [{serviceType, quantity, ...per-item field overrides}]
+    """
+    try:
+        data = request.get_json() or {}
+        shared = {key: value for key, value in data.items() if key != 'items'}
+        
+        # Expand and validate every item before anything is written
+        issues = []
+        for item in data.get('items') or []:
+            service_type = int(item.get('serviceType'))
+            quantity = int(item.get('quantity', 1))
+            if quantity < 1:
+                raise ValueError("quantity must be at least 1")
+            
+            item_data = dict(shared, invoiceType='TOKEN')
+            item_data.update({key: value for key, value in item.items()
+                              if key not in ('serviceType', 'quantity')})
+            if item_data['invoiceType'] != 'TOKEN':
+                raise ValueError("Bulk issuance only issues TOKEN invoices")
+            validate_service_data(service_type, item_data)
+            issues.extend([(service_type, item_data)] * quantity)
+        
+        if not issues:
+            raise ValueError("No tokens requested")
+        if len(issues) > app.config['MAX_BULK_TOKENS']:
+            raise ValueError(f"At most {app.config['MAX_BULK_TOKENS']} tokens can be issued at once")
+        
+        # One contiguous block of token numbers for the whole batch
+        prefix = Service.invoice_prefix('TOKEN')
+        ordinals = allocate(db.session, prefix, len(issues))
+        services = [
+            build_service(service_type, item_data, format_invoice_number(prefix, ordinal))
+            for (service_type, item_data), ordinal in zip(issues, ordinals)
+        ]
+        
+        # One insert batch, one rollup upsert per touched key, one commit
+        rollups.record_services(db.session, services)
+        devotees.record_services(db.session, services)
+        db.session.bulk_save_objects(services)
+        roster.record_services(db.session, services)
+        db.session.commit()
+        
+        print_data = [service_print_data(service) for service in services]
+        return jsonify({
+            'message': f'{len(services)} tokens issued successfully',
+            'status': 'success',
+            'count': len(services),
+            'amount': sum(service.amount for service in services),
+            'printData': print_data,
+            'printJob': spool(print_data) if print_spooler else None
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+
+@app.route('/print/<invoice_number>', methods=['GET'])
+@login_required
+def render_receipt(invoice_number):
+    """Render a sale's token or receipt as ESC/POS (format=escpos) or PDF (the default)"""
+    fmt = request.args.get('format', 'pdf')
+    if fmt not in receipts.FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(receipts.FORMATS)}",
+                        'status': 'error'}), 400
+    service = Service.query.filter_by(invoice_number=invoice_number).first()
+    if not service:
+        return jsonify({'message': 'Unknown invoice number', 'status': 'error'}), 404
+    
+    mimetype, extension = receipts.FORMATS[fmt]
+    return Response(receipts.render(service_print_data(service), fmt), mimetype=mimetype, headers={
+        'Content-Disposition': f'inline; filename="{invoice_number}.{extension}"'
+    })
+
+@app.route('/print/jobs', methods=['POST'])
+@login_required
+def submit_print_jobs():
+    """Send sales to the receipt printer again; body: {invoiceNumbers: [...]}"""
+    if not print_spooler:
+        return jsonify({'message': 'No printer is configured', 'status': 'error'}), 503
+    invoice_numbers = (request.get_json() or {}).get('invoiceNumbers') or []
+    services = Service.query.filter(Service.invoice_number.in_(invoice_numbers)).all()
+    if not services:
+        return jsonify({'message': 'Unknown invoice numbers', 'status': 'error'}), 404
+    
+    try:
+        jobs = [print_spooler.submit(service_print_data(service)) for service in services]
+    except PrintQueueFull as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 503
+    return jsonify({'jobs': [job.to_dict() for job in jobs]}), 202
+
+@app.route('/print/jobs/<job_id>', methods=['GET'])
+@login_required
+def print_job_status(job_id):
+    """Return whether a print job has printed, is still queued or failed"""
+    job = print_spooler.get(job_id) if print_spooler else None
+    if not job:
+        return jsonify({'message': 'Unknown print job', 'status': 'error'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/print/status', methods=['GET'])
+@login_required
+def print_status():
+    """Printer, queue length and throughput in receipts per minute"""
+    if not print_spooler:
+        return jsonify({'printer': None, 'status': 'disabled'}), 200
+    return jsonify(dict(print_spooler.stats(), status='enabled')), 200
+
+@app.route('/sync/push', methods=['POST'])
+def receive_sync_batch():
+    """Central node: apply a batch of a kiosk's new sales (see sync.py)"""
+    if not app.config['SYNC_TOKEN']:
+        return jsonify({'message': 'Sync is not enabled on this server', 'status': 'error'}), 404
+    if not sync.check_token(request.headers.get(sync.TOKEN_HEADER), app.config['SYNC_TOKEN']):
+        return jsonify({'message': 'Invalid sync token', 'status': 'error'}), 403
+    try:
+        batch = sync.decode_batch(request.get_data(), request.headers.get('Content-Encoding'))
+        result = sync.receive(db.session, batch, app.config['DEVICE_ID'])
+        db.session.commit()
+        return jsonify({'status': 'success', **result}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+
+@app.route('/sync/status', methods=['GET'])
+@login_required
+def sync_status():
+    """This kiosk's push progress and, on a central node, the devices heard from"""
+    peers = db.session.execute(text(
+        "SELECT device_id, last_seq, rows, last_push_at FROM sync_peer ORDER BY device_id"
+    )).fetchall()
+    return jsonify({
+        'status': 'success',
+        'deviceId': app.config['DEVICE_ID'],
+        'push': sync_agent.stats() if sync_agent else None,
+        'devices': [
+            {'deviceId': device_id, 'lastSeq': last_seq, 'rows': rows, 'lastPushAt': last_push_at}
+            for device_id, last_seq, rows, last_push_at in peers
+        ]
+    }), 200
+
+@app.route('/devotees/lookup', methods=['GET'])
+@login_required
+def lookup_devotees():
+    """Autocomplete devotees by name or phone prefix for the service form"""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', devotees.DEFAULT_LIMIT, type=int)
+    
+    rows = devotees.lookup(db.session, query, limit)
+    return jsonify({
+        'query': query,
+        'devotees': [{
+            'id': row['id'],
+            'devoteeName': row['name'],
+            'devoteeContactNum': row['contact_number'],
+            'gothram': row['gothram'],
+            'address': {field: row[field] for field in devotees.ADDRESS_FIELDS}
+                       if row['address1'] else None,
+            'visits': row['visit_count']
+        } for row in rows]
+    }), 200
+
+@app.route('/roster', methods=['GET'])
+@login_required
+def puja_roster():
+    """Pujas due on a day (default today) grouped by service, as JSON or a printable page"""
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() \
+            if request.args.get('date') else roster.today()
+    except ValueError:
+        return jsonify({'message': 'date must be YYYY-MM-DD', 'status': 'error'}), 400
+    
+    # Keep the coming days precomputed; usually nothing is left to build
+    roster.ensure(db.session, roster.today(), app.config['ROSTER_DAYS'])
+    groups = roster.roster(db.session, day)
+    db.session.commit()
+    
+    services = [{
+        'serviceType': service_type,
+        'serviceName': catalog.get().display_names.get(service_type, str(service_type)),
+        'pujas': [{
+            'invoiceNumber': puja['invoice_number'],
+            'frequency': puja['frequency'],
+            'devoteeName': puja['devotee_name'],
+            'gothram': puja['gothram'],
+            'pujaDetails': puja['puja_details'],
+            'contactNumber': puja['contact_number'],
+            'validTill': str(puja['valid_till']).replace(' ', 'T')
+        } for puja in pujas]
+    } for service_type, pujas in groups.items()]
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'date': day.isoformat(),
+            'count': sum(len(service['pujas']) for service in services),
+            'services': services
+        }), 200
+    return render_template('roster.html', day=day, services=services)
+
+@app.route('/catalog', methods=['GET'])
+@login_required
+def service_catalog():
+    """Services with today's price and their full price history"""
+    snapshot = catalog.get()
+    current = snapshot.current_prices()
+    return jsonify({
+        'version': snapshot.version,
+        'services': [{
+            'serviceType': service_type,
+            'name': service['name'],
+            'displayName': service['display_name'],
+            'active': service['active'],
+            'price': current.get(service_type),
+            'prices': [{
+                'price': price,
+                'effectiveFrom': effective_from.isoformat()
+            } for effective_from, price in zip(*snapshot.prices.get(service_type, ((), ())))]
+        } for service_type, service in snapshot.services.items()]
+    }), 200
+
+@app.route('/catalog/prices', methods=['POST'])
+@login_required
+def set_service_price():
+    """Schedule a price change: {serviceType, price, effectiveFrom (optional, UTC)}"""
+    if current_user.role != 'admin':
+        return jsonify({'message': 'Only admins can change prices', 'status': 'error'}), 403
+    
+    data = request.get_json() or {}
+    try:
+        effective_from = datetime.fromisoformat(data['effectiveFrom']) if data.get('effectiveFrom') else None
+        effective_from = catalog.set_price(db.session, int(data.get('serviceType')),
+                                           float(data.get('price')), effective_from)
+        db.session.commit()
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+    
+    # This process picks the change up immediately, others within catalog.CHECK_SECONDS
+    catalog.invalidate()
+    return jsonify({
+        'message': 'Price updated',
+        'status': 'success',
+        'version': catalog.get().version,
+        'effectiveFrom': effective_from.isoformat()
+    }), 200
+
 @app.route('/reports/monthly', methods=['GET'])
 @login_required
 def monthly_report():
@@ -137,23 +669,196 @@ def monthly_report():
     month = request.args.get('month', datetime.now().month, type=int)
     
     try:
-        # Generate the report
-        report_file = generate_monthly_report(year, month)
+        # Serve from the report cache, building only if the data changed
+        report_file, etag = report_cache.get_report(
+            db.session, generate_monthly_report, year, month,
+            max_bytes=app.config['REPORT_CACHE_MAX_BYTES']
+        )
         
-        # Get the filename from the path
-        filename = os.path.basename(report_file)
+        # Download under the plain report name, not the versioned cache name
+        filename = f"{report_basename(year, month)}.xlsx"
         
-        # Send the file as an attachment
-        return send_file(report_file, as_attachment=True, download_name=filename)
+        # Send the file as an attachment; werkzeug answers If-None-Match with 304.
+        # Always revalidated: late kiosk sales can still change a closed month
+        response = send_file(report_file, as_attachment=True, download_name=filename,
+                             etag=etag, conditional=True, max_age=None)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
     except Exception as e:
         flash(f'Error generating report: {str(e)}', 'danger')
         return redirect(url_for('dashboard'))
 
+def build_report_job(year, month):
+    """Work function for a background monthly report job"""
+    def work(job):
+        report_file, etag = report_cache.get_report(
+            db.session,
+            lambda y, m, output_file: generate_monthly_report(y, m, output_file, progress=job.update),
+            year, month, max_bytes=app.config['REPORT_CACHE_MAX_BYTES']
+        )
+        return report_file, etag, f"{report_basename(year, month)}.xlsx"
+    return work
+
+def build_export_job(start, end, fmt):
+    """Work function for a background range export job"""
+    def work(job):
+        job.update(0.0, 'Exporting services')
+        export_file = export_range(start, end, fmt, max_bytes=app.config['EXPORTS_MAX_BYTES'])
+        return export_file, None, os.path.basename(export_file)
+    return work
+
+@app.route('/reports/jobs', methods=['POST'])
+@login_required
+def submit_report_job():
+    """Queue a monthly report in the background and return its job id"""
+    year = request.args.get('year', datetime.now().year, type=int)
+    month = request.args.get('month', datetime.now().month, type=int)
+    
+    try:
+        job = report_jobs.submit(('monthly', year, month, 'xlsx'), build_report_job(year, month))
+    except JobQueueFull as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 503
+    
+    return jsonify(dict(job.to_dict(),
+                        statusUrl=url_for('report_job_status', job_id=job.id),
+                        downloadUrl=url_for('download_report_job', job_id=job.id))), 202
+
+@app.route('/reports/jobs/<job_id>', methods=['GET'])
+@login_required
+def report_job_status(job_id):
+    """Return the status and progress of a report job"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'message': 'Unknown report job', 'status': 'error'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/reports/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_report_job(job_id):
+    """Download the report produced by a finished job"""
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({'message': 'Unknown report job', 'status': 'error'}), 404
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 409
+    
+    report_file, etag, download_name = job.result
+    if not os.path.exists(report_file):
+        # Evicted since the job finished
+        return jsonify({'message': 'This file has been deleted; submit the job again', 'status': 'error'}), 410
+    return send_file(report_file, as_attachment=True, download_name=download_name,
+                     etag=etag if etag else True)
+
+@app.route('/reports/exports', methods=['POST'])
+@login_required
+def submit_export_job():
+    """Queue a streaming export for a date range, e.g. a festival season or financial year"""
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d')
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d')
+        fmt = request.args.get('format', 'xlsx')
+        if end <= start:
+            raise ValueError("Give start < end as YYYY-MM-DD")
+        check_export_format(fmt)
+        job = report_jobs.submit(('export', start, end, fmt), build_export_job(start, end, fmt))
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+    except JobQueueFull as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 503
+    
+    return jsonify(dict(job.to_dict(),
+                        statusUrl=url_for('report_job_status', job_id=job.id),
+                        downloadUrl=url_for('download_report_job', job_id=job.id))), 202
+
+@app.route('/reports/cache', methods=['DELETE'])
+@login_required
+def invalidate_report_cache():
+    """Drop cached reports for one month (year & month given) or all months"""
+    if current_user.role != 'admin':
+        return jsonify({'message': 'Only admins can clear the report cache', 'status': 'error'}), 403
+    
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    removed = report_cache.invalidate(year, month)
+    return jsonify({'message': f'Removed {removed} cached reports', 'status': 'success'}), 200
+
+@app.route('/reports/totals', methods=['GET'])
+@login_required
+def report_totals():
+    """Return today's, this week's or a month's totals from the daily rollups"""
+    period = request.args.get('period', 'today')
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    
+    try:
+        start, end = rollups.period_bounds(period, year, month)
+        result = rollups.totals(db.session, start, end)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+    
+    names = catalog.get().names
+    return jsonify({
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': result['count'],
+        'amount': result['amount'],
+        'byServiceType': {
+            names.get(int(key), key): value for key, value in result['service_type'].items()
+        },
+        'byPaymentMethod': result['payment_method'],
+        'byInvoiceType': result['invoice_type']
+    }), 200
+
+@app.route('/reports/trends', methods=['GET'])
+@login_required
+def report_trends():
+    """
+    Counts and amounts per day, week, month or year from the analytics snapshot.
+
+    Query: period=YYYY-MM-DD:YYYY-MM-DD (end exclusive), repeated to compare
+    periods side by side, e.g. this Dasara against last; by=day|week|month|year;
+    split=service_type|payment_method|invoice_type|frequency; optional
+    serviceType and paymentMethod filters.
+    """
+    try:
+        periods = []
+        for period in request.args.getlist('period') or []:
+            start, _, end = period.partition(':')
+            periods.append((datetime.strptime(start, '%Y-%m-%d').date(),
+                            datetime.strptime(end, '%Y-%m-%d').date()))
+        if not periods:
+            raise ValueError("Give at least one period=YYYY-MM-DD:YYYY-MM-DD")
+        filters = {}
+        if request.args.get('serviceType'):
+            filters['service_type'] = int(request.args['serviceType'])
+        if request.args.get('paymentMethod'):
+            filters['payment_method'] = request.args['paymentMethod']
+        by = request.args.get('by', 'month')
+        split = request.args.get('split') or None
+
+        snapshot = analytics.get()
+        results = [snapshot.trend(start, end, by, split, filters) for start, end in periods]
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': 'error'}), 400
+
+    if split == 'service_type':
+        names = catalog.get().names
+        for result in results:
+            for series in result['series']:
+                series['key'] = names.get(series['key'], series['key'])
+    return jsonify({'status': 'success', 'periods': results,
+                    'snapshotUpdatedAt': snapshot.meta.get('updated_at')}), 200
+
 def init_db():
     with app.app_context():
         # Create all tables
         db.create_all()
         
+        # Bring existing databases up to the current schema version
+        run_migrations(db.engine)
+        
         # Create admin user if not exists
         if not User.query.filter_by(username='admin').first():
             admin = User(username='admin', role='admin')
@@ -168,6 +873,20 @@ def init_db():
             
             db.session.commit()
 
+def shutdown(timeout=10.0):
+    """Finish queued receipts and stop background work; called by serve.py after the last request"""
+    if group_committer:
+        group_committer.shutdown(timeout=timeout)
+    if print_spooler:
+        print_spooler.shutdown(timeout=timeout)
+    if sync_agent:
+        sync_agent.shutdown(timeout=timeout)
+    # Report jobs are rebuilt on request; do not hold up a restart for one
+    report_jobs.shutdown(wait=False)
+    with app.app_context():
+        db.engine.dispose()
+
 if __name__ == '__main__':
+    # Development server with the debugger; use serve.py in production
     init_db()  # Initialize database and create tables
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='127.0.0.1', port=5000, debug=True)
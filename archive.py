@@ -0,0 +1,420 @@
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+from sqlalchemy import text
+import storage
+from roster import MAX_VALIDITY_DAYS
+
+# Yearly archives. Once a year is closed, its service rows are moved out of
+# the hot database into archive/temple-<year>.db (see storage.ARCHIVE_DIR),
+# so temple.db only holds the current year or two however long the temple
+# has been running; backups of a closed year's file are taken once. The
+# service_archive table in the hot database lists the archived years. Daily
+# rollups and the devotee directory stay in the hot database; they are small
+# and already include the archived years.
+#
+# Reads that may reach into the past open their connection through
+# connect_range(): it attaches the archives overlapping the range and
+# creates a TEMP view named `service` over them and main.service, which
+# shadows the table for unqualified names, so report and export queries run
+# unchanged. Ranges that do not touch an archived year get a plain
+# connection.
+#
+# Invoice numbers stay unique across files: a year is only archived when
+# none of its numbers already exist in another archive, each archive has
+# the same UNIQUE index as the service table, and invoice sequences seed
+# past the highest archived number (sequences._seed_value). Service ids
+# stay unique too: the hot table is AUTOINCREMENT, and its high-water mark
+# in sqlite_sequence is raised past the archive's ids before rows are
+# deleted, so an emptied table does not start handing out archived ids again.
+
+FILE_NAME = "temple-{year}.db"
+
+LIST_ARCHIVES = "SELECT year, file_name FROM service_archive ORDER BY year"
+
+# Keep the hot service table's next id above :max_id
+RESERVE_IDS = [
+    "UPDATE main.sqlite_sequence SET seq = MAX(seq, :max_id) WHERE name = 'service'",
+    "INSERT INTO main.sqlite_sequence (name, seq) SELECT 'service', :max_id "
+    "WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = 'service')",
+]
+
+
+def _stamp(when):
+    # created_at is stored as fixed-width text; compare against the same form
+    return when.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def year_bounds(year):
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+def is_closed(year, now=None):
+    """A year can be archived once every subscription sold in it has expired"""
+    return (now or datetime.utcnow()) >= year_bounds(year)[1] + timedelta(days=MAX_VALIDITY_DAYS)
+
+
+def archive_path(file_name, db_path=None):
+    return os.path.join(storage.archive_dir(db_path), file_name)
+
+
+def _has_archive_table(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'service_archive'"
+    ).fetchone() is not None
+
+
+def archives(conn):
+    """{year: file name} of the archived years, over a sqlite3 connection"""
+    if not _has_archive_table(conn):
+        return {}
+    return dict(conn.execute(LIST_ARCHIVES).fetchall())
+
+
+def hot_start(conn):
+    """First day whose services are all in the hot database (SQLAlchemy connection)"""
+    last = conn.execute(text("SELECT MAX(year) FROM service_archive")).scalar()
+    return date(last + 1, 1, 1) if last else date(1, 1, 1)
+
+
+def reserve_archived_ids(conn):
+    """Raise the hot table's id high-water mark past every archived id (SQLAlchemy connection)"""
+    max_id = 0
+    for _, file_name in conn.execute(text(LIST_ARCHIVES)):
+        archived = storage.connect_readonly(archive_path(file_name))
+        try:
+            max_id = max(max_id, archived.execute("SELECT COALESCE(MAX(id), 0) FROM service").fetchone()[0])
+        finally:
+            archived.close()
+    for statement in RESERVE_IDS:
+        conn.execute(text(statement), {'max_id': max_id})
+
+
+def _columns(conn, schema):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(service)")]
+
+
+def _union_view(conn, aliases):
+    """
+    CREATE TEMP VIEW service over main.service and the attached archives.
+
+    Columns follow main.service; columns added after an archive was written
+    read as NULL from it. A row that is in both the hot database and an
+    archive (an archive run interrupted before its delete) is read from the
+    archive only.
+    """
+    columns = _columns(conn, 'main')
+    not_archived = ' '.join(
+        f"AND NOT EXISTS (SELECT 1 FROM {alias}.service a "
+        f"WHERE a.invoice_number = main.service.invoice_number)"
+        for alias in aliases
+    )
+    selects = [f"SELECT {', '.join(columns)} FROM main.service WHERE 1 {not_archived}"]
+    for alias in aliases:
+        available = set(_columns(conn, alias))
+        selects.append("SELECT " + ', '.join(
+            column if column in available else f"NULL AS {column}" for column in columns
+        ) + f" FROM {alias}.service")
+    conn.execute("CREATE TEMP VIEW service AS " + " UNION ALL ".join(selects))
+
+
+def connect_range(start, end, db_path=None):
+    """
+    Open a read-only connection on which `service` holds every service
+    created in [start, end), wherever it is stored.
+
+    Only the archives of years the range overlaps are attached, so a month
+    costs at most one. SQLite pushes the created_at range into each branch
+    of the view and merges them in index order.
+
+    Raises:
+        ValueError: If the range spans more archived years than SQLite can attach
+    """
+    def prepare(conn):
+        archived = archives(conn)
+        years = [year for year in archived
+                 if year_bounds(year)[0] < end and start < year_bounds(year)[1]]
+        if not years:
+            return
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(years) > limit:
+            raise ValueError(f"A range can span at most {limit} archived years; split it up")
+        aliases = []
+        for year in years:
+            uri = f"file:{quote(archive_path(archived[year], db_path))}?mode=ro"
+            conn.execute("ATTACH DATABASE ? AS ?", (uri, f"archive_{year}"))
+            aliases.append(f"archive_{year}")
+        _union_view(conn, aliases)
+
+    return storage.connect_readonly(db_path, prepare=prepare)
+
+
+def last_invoice_number(conn, pattern, db_path=None):
+    """
+    Highest invoice number matching a GLOB pattern in any archive, or None.
+
+    Args:
+        conn: SQLAlchemy connection or session of the hot database
+        pattern (str): See sequences.number_pattern()
+    """
+    last = None
+    for (file_name,) in conn.execute(text("SELECT file_name FROM service_archive")):
+        archive = storage.connect_readonly(archive_path(file_name, db_path))
+        try:
+            number = archive.execute(
+                "SELECT MAX(invoice_number) FROM service WHERE invoice_number GLOB ?", (pattern,)
+            ).fetchone()[0]
+        finally:
+            archive.close()
+        if number and (last is None or number > last):
+            last = number
+    return last
+
+
+def _create_schema(conn, path):
+    """Give an archive file the service table and indexes of the hot database"""
+    ddl = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE tbl_name = 'service' AND sql IS NOT NULL "
+        # Not the sync change log trigger; an archive has no change log
+        "AND type IN ('table', 'index') ORDER BY type = 'index'"
+    )]
+    archive = sqlite3.connect(path, isolation_level=None)
+    try:
+        # A closed year is written a few times and then only read: one file,
+        # no WAL, and read-only connections can open it without write access
+        archive.execute("PRAGMA journal_mode = DELETE")
+        for statement in ddl:
+            for keyword in ("CREATE TABLE ", "CREATE UNIQUE INDEX ", "CREATE INDEX "):
+                if statement.startswith(keyword):
+                    statement = keyword + "IF NOT EXISTS " + statement[len(keyword):]
+                    break
+            archive.execute(statement)
+        # Columns the hot table gained since this archive was first written
+        existing = set(_columns(archive, 'main'))
+        for _, name, kind, *_ in conn.execute("PRAGMA main.table_info(service)"):
+            if name not in existing:
+                archive.execute(f"ALTER TABLE service ADD COLUMN {name} {kind}")
+    finally:
+        archive.close()
+
+
+def _check_unique(conn, year, archived, db_path):
+    """Refuse to archive a year whose invoice numbers are already in another archive"""
+    start, end = year_bounds(year)
+    for other, file_name in archived.items():
+        if other == year:
+            continue
+        conn.execute("ATTACH DATABASE ? AS other", (archive_path(file_name, db_path),))
+        try:
+            duplicate = conn.execute(
+                "SELECT s.invoice_number FROM main.service s "
+                "JOIN other.service o ON o.invoice_number = s.invoice_number "
+                "WHERE s.created_at >= ? AND s.created_at < ? LIMIT 1",
+                (_stamp(start), _stamp(end))
+            ).fetchone()
+        finally:
+            conn.execute("DETACH DATABASE other")
+        if duplicate:
+            raise ValueError(f"Invoice {duplicate[0]} of {year} is already archived in {file_name}")
+
+
+def _check_pushed(conn, year, sync_targets):
+    """Refuse to archive a year whose services a kiosk has not pushed yet"""
+    # sync.push reads the change log joined to main.service, so a logged
+    # service that is archived first would never reach the central node
+    targets = {target for target, in conn.execute("SELECT target FROM sync_state")}
+    targets.update(target for target in sync_targets if target)
+    if not targets:
+        return
+    pushed = dict(conn.execute("SELECT target, pushed_seq FROM sync_state").fetchall())
+    start, end = year_bounds(year)
+    for target in sorted(targets):
+        unpushed = conn.execute(
+            "SELECT COUNT(*) FROM sync_log l JOIN main.service s ON s.id = l.service_id "
+            "WHERE l.seq > ? AND s.created_at >= ? AND s.created_at < ?",
+            (pushed.get(target, 0), _stamp(start), _stamp(end))
+        ).fetchone()[0]
+        if unpushed:
+            raise ValueError(f"{unpushed} services of {year} have not been pushed to {target} yet; "
+                             f"run `python sync.py push` first")
+
+
+def archive_year(year, db_path=None, now=None, sync_targets=()):
+    """
+    Move a closed year's services from the hot database into its archive.
+
+    Rows are copied into the archive and committed there first, then deleted
+    from the hot database in a second transaction, so an interruption at any
+    point loses nothing and a re-run picks up where it stopped. Services of
+    the year that arrive later (e.g. synced late) are merged in by running
+    this again. On a kiosk the year must have been pushed in full to every
+    central node it syncs with (sync_targets and those in sync_state).
+
+    Returns:
+        int: Services moved by this run
+    """
+    if not is_closed(year, now):
+        raise ValueError(f"{year} is not closed yet; it can be archived from "
+                         f"{year_bounds(year)[1] + timedelta(days=MAX_VALIDITY_DAYS):%Y-%m-%d}")
+    start, end = year_bounds(year)
+    params = (_stamp(start), _stamp(end))
+    file_name = FILE_NAME.format(year=year)
+    path = archive_path(file_name, db_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = storage.connect(db_path)
+    try:
+        archived = archives(conn)
+        _check_unique(conn, year, archived, db_path)
+        _check_pushed(conn, year, sync_targets)
+        _create_schema(conn, path)
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        columns = _columns(conn, 'main')
+        values = ', '.join(columns)
+        in_year = ("FROM main.service s WHERE s.created_at >= ? AND s.created_at < ? "
+                   "AND NOT EXISTS (SELECT 1 FROM archive.service a WHERE a.invoice_number = s.invoice_number)")
+
+        conn.execute("BEGIN IMMEDIATE")
+        moved = conn.execute(
+            f"INSERT INTO archive.service ({values}) SELECT {values} {in_year} "
+            f"AND NOT EXISTS (SELECT 1 FROM archive.service a WHERE a.id = s.id)", params
+        ).rowcount
+        # Rows whose id an earlier run already used get a new id in the archive
+        without_id = ', '.join(column for column in columns if column != 'id')
+        moved += conn.execute(
+            f"INSERT INTO archive.service ({without_id}) SELECT {without_id} {in_year}", params
+        ).rowcount
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN IMMEDIATE")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM archive.service").fetchone()[0]
+        for statement in RESERVE_IDS:
+            conn.execute(statement, {'max_id': max_id})
+        conn.execute(
+            "DELETE FROM main.puja_roster WHERE service_id IN "
+            "(SELECT id FROM main.service WHERE created_at >= ? AND created_at < ?)", params
+        )
+        conn.execute("DELETE FROM main.roster_day WHERE day >= ? AND day < ?",
+                     (start.date().isoformat(), end.date().isoformat()))
+        conn.execute(
+            "DELETE FROM main.service WHERE created_at >= ? AND created_at < ? AND invoice_number IN "
+            "(SELECT invoice_number FROM archive.service)", params
+        )
+        rows, amount = conn.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM archive.service").fetchone()
+        conn.execute(
+            "INSERT INTO main.service_archive (year, file_name, rows, amount, archived_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (year) DO UPDATE SET "
+            "rows = excluded.rows, amount = excluded.amount, archived_at = excluded.archived_at",
+            (year, file_name, rows, amount, _stamp(datetime.utcnow()))
+        )
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE archive")
+    finally:
+        conn.close()
+    return moved
+
+
+def closed_years(db_path=None, now=None):
+    """Closed years that still have services in the hot database"""
+    conn = storage.connect_readonly(db_path)
+    try:
+        first = conn.execute("SELECT MIN(created_at) FROM service").fetchone()[0]
+    finally:
+        conn.close()
+    if first is None:
+        return []
+    return [year for year in range(int(first[:4]), (now or datetime.utcnow()).year)
+            if is_closed(year, now)]
+
+
+def vacuum(db_path=None):
+    """Give the space freed by archiving back to the file system"""
+    conn = storage.connect(db_path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def verify(db_path=None):
+    """
+    Check the archives against the service_archive table and each other.
+
+    Returns:
+        list: Problems found, as messages
+    """
+    conn = storage.connect_readonly(db_path)
+    try:
+        archived = archives(conn)
+        recorded = {year: rows for year, rows in conn.execute("SELECT year, rows FROM service_archive")} \
+            if archived else {}
+    finally:
+        conn.close()
+
+    problems = []
+    seen = {}
+    for year, file_name in archived.items():
+        path = archive_path(file_name, db_path)
+        if not os.path.exists(path):
+            problems.append(f"{year}: {path} is missing")
+            continue
+        archive = storage.connect_readonly(path)
+        try:
+            rows = archive.execute("SELECT COUNT(*) FROM service").fetchone()[0]
+            outside = archive.execute(
+                "SELECT COUNT(*) FROM service WHERE created_at < ? OR created_at >= ?",
+                tuple(_stamp(bound) for bound in year_bounds(year))
+            ).fetchone()[0]
+            numbers = [number for (number,) in archive.execute("SELECT invoice_number FROM service")]
+        finally:
+            archive.close()
+        if rows != recorded.get(year):
+            problems.append(f"{year}: {rows} services in {file_name}, {recorded.get(year)} recorded")
+        if outside:
+            problems.append(f"{year}: {outside} services in {file_name} are from another year")
+        for number in numbers:
+            if number in seen:
+                problems.append(f"Invoice {number} is in both {seen[number]} and {year}")
+            seen[number] = year
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move closed years into yearly archive files")
+    parser.add_argument('command', choices=['run', 'year', 'list', 'verify'])
+    parser.add_argument('year', type=int, nargs='?', help="Year to archive (for `year`)")
+    parser.add_argument('--vacuum', action='store_true', help="Shrink the hot database afterwards")
+    args = parser.parse_args()
+
+    from app import app, init_db
+    # Archiving needs the service_archive table and a current schema
+    init_db()
+    with app.app_context():
+        if args.command in ('run', 'year'):
+            if args.command == 'year' and args.year is None:
+                parser.error("year needs the year to archive")
+            years = [args.year] if args.command == 'year' else closed_years()
+            for year in years:
+                try:
+                    print(f"{year}: {archive_year(year, sync_targets=[app.config['SYNC_URL']])} services archived")
+                except ValueError as e:
+                    parser.exit(1, f"{year}: not archived: {e}\n")
+            if args.vacuum:
+                vacuum()
+        if args.command == 'verify':
+            problems = verify()
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} problems")
+            if problems:
+                raise SystemExit(1)
+        conn = storage.connect_readonly()
+        try:
+            for year, rows, amount in conn.execute("SELECT year, rows, amount FROM service_archive ORDER BY year"):
+                print(f"{year}: {rows} services, {amount:,.2f} in {storage.archive_dir()}")
+            print(f"Hot database: {conn.execute('SELECT COUNT(*) FROM service').fetchone()[0]} services, "
+                  f"{os.path.getsize(storage.database_path()) / 2**20:.1f} MB")
+        finally:
+            conn.close()
@@ -0,0 +1,277 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import urllib.request
+from flask import abort, request, send_from_directory, url_for
+
+# Static asset pipeline. `python assets.py build` copies everything under
+# static/ into static/dist with a content hash in each file name, plus gzip
+# and brotli variants of the text files, and writes static/dist/manifest.json.
+# Pages link assets through asset_url(), which resolves to /assets/<hashed
+# name>; those URLs never change content, so they are served with a one year
+# immutable Cache-Control and the counter browser does not ask for them
+# again. Without a build, asset_url() falls back to the plain /static URL.
+#
+# Bootstrap and its icons still come from the CDN (base.html): their files
+# are not in the tree yet. `python assets.py vendor`, run once with internet,
+# fetches the pinned versions into static/vendor and records their SHA-256 in
+# static/vendor/vendor.lock.json; commit both, then point base.html's tags at
+# asset_url('vendor/...'). From then on build refuses to run while a locked
+# file is missing or differs from the lock.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+VENDOR_LOCK_PATH = os.path.join(STATIC_DIR, 'vendor', 'vendor.lock.json')
+
+# Vendored files (path under static/) and where they are fetched from;
+# the versions are the ones base.html used to load from the CDN
+VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.8.1/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff',
+}
+
+# Only text formats are worth compressing; images and fonts already are
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+
+# A compressed variant is kept only if it is at least this much smaller
+MIN_SAVING = 0.05
+
+CACHE_SECONDS = 365 * 24 * 3600
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+SOURCE_MAP = re.compile(r"\n?/[*/]# sourceMappingURL=[^\s*]+(?: \*/)?")
+
+# Logical path -> hashed path, and hashed path -> available encodings
+_manifest = {'files': {}, 'encodings': {}}
+_served = set()
+
+
+def fingerprint(path, content):
+    """vendor/bootstrap/bootstrap.min.css -> vendor/bootstrap/bootstrap.min.<hash>.css"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _source_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != DIST_DIR)
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/')
+            if not name.startswith('.') and path != os.path.relpath(VENDOR_LOCK_PATH, STATIC_DIR):
+                yield path
+
+
+def _rewrite_css(path, content, files):
+    """Point relative url()s in a stylesheet at the fingerprinted files"""
+    base = os.path.dirname(path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'^(?:[a-z]+:|/|#)', target):
+            return match.group(0)
+        relative = target.split('?')[0].split('#')[0]
+        resolved = os.path.normpath(os.path.join(base, relative)).replace(os.sep, '/')
+        if resolved not in files:
+            return match.group(0)
+        hashed = os.path.relpath(files[resolved], base or '.').replace(os.sep, '/')
+        return f"url({quote}{hashed}{quote})"
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _compress(path, content):
+    """Write .gz and, with the brotli package installed, .br variants next to path"""
+    encodings = []
+    variants = [('gzip', '.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    try:
+        import brotli
+        variants.insert(0, ('br', '.br', lambda data: brotli.compress(data, quality=11)))
+    except ImportError:
+        pass
+    for encoding, suffix, compress in variants:
+        compressed = compress(content)
+        if len(compressed) <= len(content) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as handle:
+                handle.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def check_vendor():
+    """
+    Problems with the vendored files: missing, or not matching vendor.lock.json.
+
+    Nothing is checked before the first `vendor` writes the lock file.
+
+    Returns:
+        list: One message per problem; empty when every file is in place
+    """
+    if not os.path.exists(VENDOR_LOCK_PATH):
+        return []
+    with open(VENDOR_LOCK_PATH) as handle:
+        lock = json.load(handle)
+    problems = []
+    for path in VENDOR:
+        target = os.path.join(STATIC_DIR, path)
+        if path not in lock:
+            problems.append(f"{path} is not in {os.path.basename(VENDOR_LOCK_PATH)}")
+        elif not os.path.exists(target):
+            problems.append(f"{path} is missing")
+        else:
+            with open(target, 'rb') as handle:
+                if hashlib.sha256(handle.read()).hexdigest() != lock[path]['sha256']:
+                    problems.append(f"{path} does not match its SHA-256 in {os.path.basename(VENDOR_LOCK_PATH)}")
+    return problems
+
+
+def build():
+    """
+    Fingerprint and precompress everything under static/ into static/dist.
+
+    Returns:
+        dict: The manifest that was written
+
+    Raises:
+        ValueError: If a vendored file is missing or altered
+    """
+    problems = check_vendor()
+    if problems:
+        raise ValueError("; ".join(problems) + ". Run `python assets.py vendor` where there is "
+                         "internet and commit static/vendor")
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    # Stylesheets last, so the files their url()s point at are hashed already
+    paths = sorted(_source_files(), key=lambda path: path.endswith('.css'))
+    files, encodings = {}, {}
+    for path in paths:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as handle:
+            content = handle.read()
+        if path.endswith(('.css', '.js')):
+            # Source maps are not vendored; the comment only causes a 404
+            content = SOURCE_MAP.sub('', content.decode('utf-8')).encode('utf-8')
+        if path.endswith('.css'):
+            content = _rewrite_css(path, content, files)
+
+        hashed = fingerprint(path, content)
+        target = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as handle:
+            handle.write(content)
+        files[path] = hashed
+        if path.endswith(COMPRESSIBLE):
+            encodings[hashed] = _compress(target, content)
+
+    manifest = {'files': files, 'encodings': encodings}
+    with open(MANIFEST_PATH, 'w') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
+
+
+def vendor():
+    """
+    Download the VENDOR files into static/.
+
+    The SHA-256 of every file is recorded in static/vendor/vendor.lock.json;
+    a later download of the same URL that does not match is refused.
+    """
+    lock = {}
+    if os.path.exists(VENDOR_LOCK_PATH):
+        with open(VENDOR_LOCK_PATH) as handle:
+            lock = json.load(handle)
+    for path, url in VENDOR.items():
+        with urllib.request.urlopen(url, timeout=30) as response:
+            content = response.read()
+        digest = hashlib.sha256(content).hexdigest()
+        locked = lock.get(path)
+        if locked and locked['url'] == url and locked['sha256'] != digest:
+            raise ValueError(f"{url} does not match the SHA-256 in {VENDOR_LOCK_PATH}")
+        target = os.path.join(STATIC_DIR, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as handle:
+            handle.write(content)
+        lock[path] = {'url': url, 'sha256': digest}
+        print(f"{path}: {len(content)} bytes")
+    with open(VENDOR_LOCK_PATH, 'w') as handle:
+        json.dump(lock, handle, indent=2, sort_keys=True)
+
+
+def load_manifest():
+    """Read static/dist/manifest.json if a build exists"""
+    global _manifest, _served
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as handle:
+            _manifest = json.load(handle)
+    else:
+        _manifest = {'files': {}, 'encodings': {}}
+    _served = set(_manifest['files'].values())
+    return _manifest
+
+
+def asset_url(path):
+    """URL of a static file: fingerprinted when built, else /static"""
+    hashed = _manifest['files'].get(path)
+    if hashed:
+        return url_for('asset', filename=hashed)
+    return url_for('static', filename=path)
+
+
+def serve(filename):
+    """Serve a fingerprinted file, precompressed when the browser accepts it"""
+    if filename not in _served:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    available = _manifest['encodings'].get(filename, ())
+    encoding = next((encoding for encoding in available if request.accept_encodings[encoding]), None)
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+
+    response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype,
+                                   max_age=CACHE_SECONDS, etag=True)
+    if encoding:
+        response.content_encoding = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Register /assets/<hashed name> and the asset_url() template helper"""
+    load_manifest()
+    for problem in check_vendor():
+        app.logger.warning("Vendored asset %s", problem)
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor, fingerprint and precompress static assets")
+    parser.add_argument('command', choices=['vendor', 'build'])
+    args = parser.parse_args()
+
+    if args.command == 'vendor':
+        vendor()
+    else:
+        try:
+            manifest = build()
+        except ValueError as e:
+            parser.exit(1, f"Build failed: {e}\n")
+        compressed = sum(1 for encodings in manifest['encodings'].values() if encodings)
+        print(f"{len(manifest['files'])} assets built into {DIST_DIR} ({compressed} precompressed)")
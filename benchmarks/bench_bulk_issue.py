@@ -0,0 +1,72 @@
+"""
+Token throughput: one request per token versus the bulk endpoint.
+
+Drives the Flask app in-process through its test client against a scratch
+database, so the numbers include routing, validation, invoice allocation,
+rollups and the commit, but not the network.
+
+    python -m benchmarks.bench_bulk_issue --tokens 2000 --batch-sizes 5 20 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db
+from benchmarks.harness import use_database
+
+ITEM_MIX = [{'serviceType': 1}, {'serviceType': 2}]
+
+
+def logged_in_client():
+    client = app.test_client()
+    client.post('/login', data={'username': 'clerk', 'password': 'clerk123'})
+    return client
+
+
+def single_issue(client, tokens):
+    for i in range(tokens):
+        item = ITEM_MIX[i % len(ITEM_MIX)]
+        response = client.post(f"/temple-management/services?serviceType={item['serviceType']}",
+                               json={'invoiceType': 'TOKEN', 'paymentMethod': 'CASH'})
+        assert response.status_code == 200, response.get_json()
+
+
+def bulk_issue(client, tokens, batch_size):
+    for _ in range(0, tokens, batch_size):
+        # Split each batch across the service types, like a family's mixed order
+        items = [dict(item, quantity=batch_size // len(ITEM_MIX)) for item in ITEM_MIX]
+        items[0]['quantity'] += batch_size % len(ITEM_MIX)
+        response = client.post('/temple-management/services/bulk',
+                               json={'paymentMethod': 'CASH', 'items': items})
+        assert response.status_code == 200, response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[5, 20, 100])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    use_database(os.path.join(workdir, 'temple.db'))
+    init_db()
+    client = logged_in_client()
+
+    started = time.perf_counter()
+    single_issue(client, args.tokens)
+    baseline = args.tokens / (time.perf_counter() - started)
+    print(f"{'single':>10}: {baseline:8.0f} tokens/s")
+
+    for batch_size in args.batch_sizes:
+        started = time.perf_counter()
+        bulk_issue(client, args.tokens, batch_size)
+        rate = args.tokens / (time.perf_counter() - started)
+        print(f"{f'bulk x{batch_size}':>10}: {rate:8.0f} tokens/s ({rate / baseline:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Devotee autocomplete latency against a large directory.
+
+Fills a scratch database with synthetic services and times the backfill
+of the devotee directory from them. The directory is then topped up to
+--devotees entries through the same upsert the counter uses (invoice
+numbers cap how many services datagen can make), and keystroke-by-keystroke
+lookups for names and phone numbers are replayed, reporting latency
+percentiles per kind.
+
+    python -m benchmarks.bench_devotee_lookup --rows 250000 --devotees 300000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import devotees
+from app import app
+from benchmarks.datagen import create_schema, populate, devotee_name
+from benchmarks.harness import percentile
+from extensions import db
+
+
+def keystrokes(text, shortest=1):
+    """Every prefix of text from `shortest` characters up, as typed at the counter"""
+    return [text[:length] for length in range(shortest, len(text) + 1)]
+
+
+def add_devotees(conn, start, count):
+    """Insert devotees numbered [start, start + count) straight into the directory"""
+    seen = datetime(2025, 1, 1)
+    rows = []
+    for number in range(start, start + count):
+        row = {field: None for field in devotees.DETAIL_FIELDS}
+        name = devotee_name(number)
+        row.update(name=name, name_key=devotees.name_key(name),
+                   contact_number=f"9{number:09d}", phone_key=f"9{number:09d}",
+                   gothram=f"Gothram {number % 97}", visits=1, seen=seen)
+        rows.append(row)
+    conn.execute(text(devotees.UPSERT), rows)
+
+
+def sample_queries(rng, count, population):
+    queries = {'name': [], 'surname': [], 'phone': []}
+    for _ in range(count):
+        number = rng.randrange(population)
+        name = devotee_name(number)
+        queries['name'].extend(keystrokes(name[:12]))
+        queries['surname'].extend(keystrokes(name.split()[-1], 2))
+        queries['phone'].extend(keystrokes(f"9{number:09d}", 3))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=250000)
+    parser.add_argument('--devotees', type=int, default=300000, help="Directory size for the lookups")
+    parser.add_argument('--queries', type=int, default=300, help="Names and phones typed per kind")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    db_path = os.path.join(workdir, 'temple.db')
+    create_schema(db_path)
+    populate(db_path, args.rows, datetime(2022, 1, 1), datetime(2025, 1, 1))
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            started = time.perf_counter()
+            count = devotees.backfill(conn)
+            print(f"backfill: {count} devotees from {args.rows} services "
+                  f"in {time.perf_counter() - started:.1f} s")
+            # datagen numbers its devotees below 200000; extra ones start there
+            extra = max(0, args.devotees - count)
+            add_devotees(conn, 200000, extra)
+            conn.execute(text("ANALYZE devotee"))
+            print(f"directory: {count + extra} devotees")
+
+        with db.engine.connect() as conn:
+            queries = sample_queries(random.Random(7), args.queries, 200000 + extra)
+            for kind, typed in queries.items():
+                timings = []
+                for query in typed:
+                    started = time.perf_counter()
+                    devotees.lookup(conn, query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(f"{kind:>8}: {len(timings):6d} lookups  p50 {statistics.median(timings):6.3f} ms  "
+                      f"p99 {percentile(timings, 0.99):6.3f} ms  max {max(timings):6.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
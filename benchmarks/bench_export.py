@@ -0,0 +1,44 @@
+"""
+Peak-memory check for streaming range exports.
+
+Exports ranges of increasing size in a fresh process each and prints wall
+time and peak RSS; with the chunked reader and write-only writers the RSS
+column should stay roughly flat as the row count grows.
+
+    python -m benchmarks.bench_export --sizes 10000 1000000 5000000 --formats xlsx csv
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exports
+from benchmarks.datagen import create_schema, populate
+from benchmarks.harness import run_isolated
+
+START, END = datetime(2024, 4, 1), datetime(2025, 4, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--formats', nargs='+', choices=exports.FORMATS, default=['xlsx', 'csv'])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    print(f"{'rows':>9} {'format':>8} {'seconds':>9} {'peak RSS':>9}")
+    for size in args.sizes:
+        db_path = os.path.join(workdir, f"export_{size}.db")
+        create_schema(db_path)
+        populate(db_path, size, START, END)
+        for fmt in args.formats:
+            output_file = os.path.join(workdir, f"export_{size}.{exports.EXTENSIONS[fmt]}")
+            elapsed, peak = run_isolated(exports.export_range, START, END, fmt, output_file, db_path)
+            print(f"{size:>9} {fmt:>8} {elapsed:>9.1f} {peak / 2**20:>7.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
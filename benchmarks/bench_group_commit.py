@@ -0,0 +1,91 @@
+"""
+Sale throughput and tail latency with and without group commit.
+
+Starts serve.py on an empty scratch database once per mode and drives it
+with the same counters as benchmarks.loadtest: first with every sale
+committing in its own request, then with GROUP_COMMIT=1, where one writer
+commits the sales that arrive together in one transaction. Reports sales
+per second, p50/p95/p99 latency, the error rate and, for group commit, the
+average batch size read back from /metrics. The gain depends on what an
+fsync costs: run it on the Pi's SD card, not a laptop SSD.
+
+    python -m benchmarks.bench_group_commit --counters 16 --duration 15 --json group_commit.json
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import serve
+from benchmarks.loadtest import drive, free_port, wait_until_ready
+
+
+def average_batch(base_url):
+    """Mean sales per group commit, from the server's /metrics"""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    total = re.search(r"^temple_group_commit_batch_sales_sum (\S+)$", text, re.M)
+    count = re.search(r"^temple_group_commit_batch_sales_count (\S+)$", text, re.M)
+    if not total or not float(count.group(1)):
+        return None
+    return float(total.group(1)) / float(count.group(1))
+
+
+def run_case(group_commit, args):
+    workdir = tempfile.mkdtemp(prefix='sscm-group-commit-')
+    # Read by app.py and storage.configure in the server process
+    os.environ['GROUP_COMMIT'] = str(int(group_commit))
+    os.environ['GROUP_COMMIT_WAIT_MS'] = str(args.wait_ms)
+    os.environ['GROUP_COMMIT_MAX_BATCH'] = str(args.max_batch)
+    os.environ['TEMPLE_SQLITE_SYNCHRONOUS'] = args.synchronous
+    port = free_port()
+    server = multiprocessing.Process(
+        target=serve, args=(os.path.join(workdir, 'temple.db'), port, args.threads), daemon=True
+    )
+    server.start()
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url)
+        result = drive(base_url, args.counters, args.duration, think_time=args.think_time)
+        result['average_batch'] = average_batch(base_url) if group_commit else 1.0
+        return result
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--counters', type=int, default=16, help="Concurrent counters")
+    parser.add_argument('--threads', type=int, default=16, help="Server worker threads")
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds per mode")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help="Mean seconds between a counter's sales (0: back to back)")
+    parser.add_argument('--wait-ms', type=float, default=5.0, help="GROUP_COMMIT_WAIT_MS")
+    parser.add_argument('--max-batch', type=int, default=32, help="GROUP_COMMIT_MAX_BATCH")
+    parser.add_argument('--synchronous', default='FULL', help="SQLITE_SYNCHRONOUS for both modes")
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for label, group_commit in (('per_request', False), ('group_commit', True)):
+        result = results[label] = run_case(group_commit, args)
+        latency = result['latency']
+        batch = f"  {result['average_batch']:.1f} sales/commit" if result['average_batch'] else ''
+        print(f"{label:<13}: {result['requests_per_second']:>8.1f} sales/s  p50 {latency['p50_ms']:>7.1f} ms  "
+              f"p95 {latency['p95_ms']:>7.1f} ms  p99 {latency['p99_ms']:>7.1f} ms  "
+              f"errors {result['error_rate']:.2%}{batch}")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'group_commit', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Concurrency check and latency benchmark for the invoice sequence allocator.
+
+Issues thousands of invoices from parallel threads against a scratch
+database, fails if any invoice number is issued twice, and prints the mean
+per-issue latency for each slice of the run so growth with table size shows up.
+
+    python -m benchmarks.bench_invoice_sequence --threads 8 --per-thread 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db
+from benchmarks.harness import use_database, latency_summary
+from extensions import db
+from models import Service
+
+
+def issue(invoice_type, block_size, latencies, numbers, errors, count):
+    with app.app_context():
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                service = Service(
+                    service_type=1,
+                    service_name='ABHISHEKAM',
+                    invoice_type=invoice_type,
+                    invoice_number=Service.generate_invoice_number(invoice_type, block_size),
+                    frequency='SINGLE',
+                    valid_till=Service.calculate_valid_till('SINGLE'),
+                    payment_method='CASH',
+                    amount=Service.calculate_amount(1, 'SINGLE')
+                )
+                db.session.add(service)
+                db.session.commit()
+                numbers.append(service.invoice_number)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(str(e))
+            latencies.append((time.perf_counter(), time.perf_counter() - start))
+        db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=500)
+    parser.add_argument('--block-size', type=int, default=0)
+    parser.add_argument('--slices', type=int, default=5)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    use_database(os.path.join(workdir, 'temple.db'))
+    init_db()
+
+    latencies, numbers, errors = [], [], []
+    threads = [
+        threading.Thread(
+            target=issue,
+            args=('TOKEN' if i % 2 == 0 else 'RECEIPT', args.block_size,
+                  latencies, numbers, errors, args.per_thread)
+        )
+        for i in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    duplicates = len(numbers) - len(set(numbers))
+    print(f"Issued {len(numbers)} invoices in {elapsed:.2f}s "
+          f"({len(numbers) / elapsed:.0f}/s), {len(errors)} errors, {duplicates} duplicates")
+
+    latencies.sort()
+    slice_size = max(1, len(latencies) // args.slices)
+    slices = []
+    for i in range(0, len(latencies), slice_size):
+        window = [latency for _, latency in latencies[i:i + slice_size]]
+        print(f"  issues {i:>6}-{i + len(window) - 1:<6} "
+              f"mean {sum(window) / len(window) * 1000:.2f} ms")
+        slices.append(sum(window) / len(window) * 1000)
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'invoice_sequence', params, {
+            'issued': len(numbers),
+            'errors': len(errors),
+            'duplicates': duplicates,
+            'issues_per_second': len(numbers) / elapsed,
+            'latency': latency_summary([latency for _, latency in latencies]),
+            'slice_mean_ms': slices,
+        })
+
+    if duplicates or errors:
+        for message in errors[:5]:
+            print(f"  error: {message}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
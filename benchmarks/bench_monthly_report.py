@@ -0,0 +1,128 @@
+"""
+Wall-time and peak-memory comparison of the monthly report pipelines.
+
+The legacy pipeline below is the five-scan, strftime()-filtered version that
+reports.py used before the single-scan rewrite; it is kept here only as the
+baseline. Each size is one month of data with the neighbouring months filled
+too, so the range predicate has something to skip.
+
+    python -m benchmarks.bench_monthly_report --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import reports
+from benchmarks.datagen import create_schema, populate
+from benchmarks.harness import run_isolated
+from models import ServiceType, PaymentMethod
+
+YEAR, MONTH = 2025, 3
+
+
+def legacy_report(conn, excel_file, year, month):
+    params = (str(year), str(month).zfill(2))
+    month_filter = "WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?"
+    with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
+        summary_df = pd.read_sql_query(
+            f"SELECT COUNT(*) as total_services, SUM(amount) as total_amount, "
+            f"COUNT(DISTINCT devotee_name) as unique_devotees FROM service {month_filter}",
+            conn, params=params)
+        service_breakdown = pd.read_sql_query(
+            f"SELECT service_type, COUNT(*) as count, SUM(amount) as total_amount FROM service "
+            f"{month_filter} GROUP BY service_type ORDER BY total_amount DESC", conn, params=params)
+        service_breakdown['service_name'] = service_breakdown['service_type'].apply(
+            lambda x: ServiceType(x).name.replace('_', ' ').title())
+        payment_breakdown = pd.read_sql_query(
+            f"SELECT payment_method, COUNT(*) as count, SUM(amount) as total_amount FROM service "
+            f"{month_filter} GROUP BY payment_method ORDER BY total_amount DESC", conn, params=params)
+        payment_breakdown['payment_name'] = payment_breakdown['payment_method'].apply(
+            lambda x: PaymentMethod(x).name.title())
+        summary_df.to_excel(writer, sheet_name='Summary', index=False, startrow=1)
+        service_breakdown[['service_name', 'count', 'total_amount']].to_excel(
+            writer, sheet_name='Summary', index=False, startrow=5)
+        payment_breakdown[['payment_name', 'count', 'total_amount']].to_excel(
+            writer, sheet_name='Summary', index=False, startrow=len(service_breakdown) + 8)
+
+        all_services = pd.read_sql_query(f"SELECT * FROM service {month_filter}", conn, params=params)
+        for service_type in all_services['service_type'].unique():
+            data = all_services[all_services['service_type'] == service_type].copy()
+            data['created_at'] = pd.to_datetime(data['created_at'])
+            data['payment_method'] = data['payment_method'].apply(lambda x: PaymentMethod(x).name.title())
+            data[['invoice_number', 'created_at', 'devotee_name', 'gothram', 'contact_number',
+                  'amount', 'payment_method', 'puja_details']].to_excel(
+                writer, sheet_name=ServiceType(service_type).name.replace('_', ' ').title()[:28], index=False)
+
+        all_services = pd.read_sql_query(f"SELECT * FROM service {month_filter}", conn, params=params)
+        for payment_method in all_services['payment_method'].unique():
+            data = all_services[all_services['payment_method'] == payment_method].copy()
+            data['created_at'] = pd.to_datetime(data['created_at'])
+            data['service_type'] = data['service_type'].apply(
+                lambda x: ServiceType(x).name.replace('_', ' ').title())
+            data[['invoice_number', 'created_at', 'service_type', 'devotee_name', 'amount',
+                  'puja_details']].to_excel(
+                writer, sheet_name=f"Payment_{PaymentMethod(payment_method).name.title()[:20]}", index=False)
+
+
+def single_scan_report(conn, excel_file, year, month):
+    services = reports.load_month(conn, year, month)
+    totals = reports.load_month_totals(conn, year, month)
+    with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
+        reports.create_summary_sheet(services, totals, writer, year, month)
+        reports.create_service_sheets(services, writer)
+        reports.create_payment_sheets(services, writer)
+
+
+def measure(pipeline, db_path, excel_file):
+    """Run a pipeline in a fresh process; return (seconds, peak RSS bytes)"""
+    return run_isolated(_run, pipeline, db_path, excel_file)
+
+
+def _run(pipeline, db_path, excel_file):
+    conn = sqlite3.connect(db_path)
+    pipeline(conn, excel_file, YEAR, MONTH)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    results = []
+    print(f"{'rows':>9} {'legacy s':>9} {'new s':>9} {'legacy RSS':>11} {'new RSS':>9}")
+    for size in args.sizes:
+        db_path = os.path.join(workdir, f"report_{size}.db")
+        create_schema(db_path)
+        ordinals = {'T': 0, 'R': 0}
+        # The month under test plus one month either side
+        populate(db_path, size // 2, datetime(2025, 2, 1), datetime(2025, 3, 1), 1, ordinals)
+        populate(db_path, size, datetime(2025, 3, 1), datetime(2025, 4, 1), 2, ordinals)
+        populate(db_path, size // 2, datetime(2025, 4, 1), datetime(2025, 5, 1), 3, ordinals)
+
+        legacy = measure(legacy_report, db_path, os.path.join(workdir, 'legacy.xlsx'))
+        single = measure(single_scan_report, db_path, os.path.join(workdir, 'single.xlsx'))
+        print(f"{size:>9} {legacy[0]:>9.2f} {single[0]:>9.2f} "
+              f"{legacy[1] / 2**20:>9.0f}MB {single[1] / 2**20:>7.0f}MB")
+        results.append({
+            'rows': size,
+            'legacy': {'seconds': legacy[0], 'peak_rss_bytes': legacy[1]},
+            'single_scan': {'seconds': single[0], 'peak_rss_bytes': single[1]},
+        })
+
+    if args.json:
+        from benchmarks.results import write_results
+        write_results(args.json, 'monthly_report', {'sizes': args.sizes}, {'sizes': results})
+
+
+if __name__ == '__main__':
+    main()
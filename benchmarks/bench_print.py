@@ -0,0 +1,121 @@
+"""
+Receipt rendering and print spooler throughput, in receipts per minute.
+
+Times rendering a token and a two-copy receipt as ESC/POS and as PDF, then
+pushes a burst of tokens through the spooler into a file sink and into a
+fake network printer on localhost. The fake printer takes --connect-delay
+seconds to accept each connection, like a real one waking up, which is the
+cost batching saves; the burst is run with batches of one and with the
+default batch size.
+
+    python -m benchmarks.bench_print --receipts 2000 --json print.json
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipts
+from spooler import FileSink, PrintSpooler, SocketSink
+
+TOKEN = {
+    'invoiceType': 'TOKEN', 'invoiceNumber': 'TA0001', 'serviceName': 'Archana',
+    'amount': 16, 'validTill': '2025-03-01T09:30:00',
+}
+RECEIPT = {
+    'invoiceType': 'RECEIPT', 'invoiceNumber': 'RA0001', 'serviceName': 'Abhishekam',
+    'gothram': 'Bharadwaja', 'devoteeName': 'Venkata Ramana Murthy', 'pujaDetails': 'Birthday',
+    'address': {'address1': '12-3-45, Temple Street', 'address2': 'Near Bus Stand', 'city': 'Tirupati',
+                'district': 'Tirupati', 'state': 'Andhra Pradesh', 'pincode': '524413'},
+    'amount': 1116, 'validTill': '2025-03-01T09:30:00',
+}
+
+
+class FakePrinter:
+    """A raw port 9100 listener that waits before reading each connection"""
+
+    def __init__(self, connect_delay):
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self._server = socket.socket()
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(16)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            connection, _ = self._server.accept()
+            time.sleep(self.connect_delay)
+            with connection:
+                while connection.recv(65536):
+                    pass
+            self.connections += 1
+
+
+def render_rate(data, fmt, seconds):
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        receipts.render(data, fmt)
+        count += 1
+    return count * 60 / (time.perf_counter() - started)
+
+
+def spool_rate(sink, count, **options):
+    spooler = PrintSpooler(sink, 'escpos', **options)
+    started = time.perf_counter()
+    jobs = [spooler.submit(TOKEN) for _ in range(count)]
+    spooler.shutdown()
+    elapsed = time.perf_counter() - started
+    printed = sum(1 for job in jobs if job.status == 'printed')
+    return printed * 60 / elapsed, printed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=2000, help="Tokens in the spooled burst")
+    parser.add_argument('--seconds', type=float, default=2.0, help="Time spent on each render case")
+    parser.add_argument('--connect-delay', type=float, default=0.02,
+                        help="Seconds the fake printer takes to accept a connection")
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {'render': {}, 'spool': {}}
+    for fmt in receipts.FORMATS:
+        for label, data in (('token', TOKEN), ('receipt', RECEIPT)):
+            rate = render_rate(data, fmt, args.seconds)
+            size = len(receipts.render(data, fmt))
+            results['render'][f"{fmt}_{label}"] = {'receipts_per_minute': rate, 'bytes': size}
+            print(f"render {fmt:>6} {label:<7}: {rate:>12,.0f} receipts/min ({size} bytes)")
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    cases = [
+        ('file', lambda: FileSink(os.path.join(workdir, 'file')), {}),
+        ('tcp_unbatched', None, {'batch_size': 1}),
+        ('tcp', None, {}),
+    ]
+    for label, make_sink, options in cases:
+        printer = None
+        if make_sink is None:
+            printer = FakePrinter(args.connect_delay)
+            sink = SocketSink('127.0.0.1', printer.port)
+        else:
+            sink = make_sink()
+        rate, printed = spool_rate(sink, args.receipts, **options)
+        results['spool'][label] = {'receipts_per_minute': rate, 'printed': printed}
+        detail = f", {printer.connections} connections" if printer else ''
+        print(f"spool {label:<14}: {rate:>12,.0f} receipts/min ({printed}/{args.receipts} printed{detail})")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {'receipts': args.receipts, 'seconds': args.seconds, 'connect_delay': args.connect_delay}
+        write_results(args.json, 'print', params, results)
+
+
+if __name__ == '__main__':
+    main()
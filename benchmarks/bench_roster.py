@@ -0,0 +1,106 @@
+"""
+Puja roster build time on a multi-year dataset.
+
+Times the "active on day D" interval query with the subscription window
+index, without it, and as the naive unbounded query the index replaces;
+then the cost of precomputing the roster for the next days, for the whole
+history, and of reading a precomputed day.
+
+    python -m benchmarks.bench_roster --rows 250000 --years 3
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import roster
+from benchmarks.datagen import create_schema, populate
+
+# The obvious interval query: everything bought before the day that is
+# still valid after it
+NAIVE_ACTIVE_ON_DAY = """
+SELECT id FROM service
+WHERE frequency IN ('WEEKLY', 'MONTHLY')
+  AND created_at < :day_end AND valid_till >= :day_end
+"""
+
+
+def time_queries(conn, query, days):
+    timings = []
+    for day in days:
+        started = time.perf_counter()
+        conn.execute(query, roster.day_params(day)).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=250000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=200, help="Days sampled per query variant")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    db_path = os.path.join(workdir, 'temple.db')
+    create_schema(db_path)
+    start = datetime(2022, 1, 1)
+    end = start + timedelta(days=365 * args.years)
+    populate(db_path, args.rows, start, end)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("ANALYZE")
+    subscriptions = conn.execute(
+        "SELECT COUNT(*) FROM service WHERE frequency IN ('WEEKLY', 'MONTHLY')"
+    ).fetchone()[0]
+    print(f"{args.rows} services over {args.years} years, {subscriptions} subscriptions")
+
+    rng = random.Random(3)
+    history = (end - start).days
+    days = [start.date() + timedelta(days=rng.randrange(history)) for _ in range(args.samples)]
+
+    for label, query in (('windowed + index', roster.ACTIVE_ON_DAY),
+                         ('naive + index', NAIVE_ACTIVE_ON_DAY)):
+        p50, worst = time_queries(conn, query, days)
+        print(f"{label:>18}: p50 {p50:7.3f} ms  max {worst:7.3f} ms per day")
+    conn.execute("DROP INDEX ix_service_subscription_window")
+    for label, query in (('windowed, no index', roster.ACTIVE_ON_DAY),
+                         ('naive, no index', NAIVE_ACTIVE_ON_DAY)):
+        p50, worst = time_queries(conn, query, days)
+        print(f"{label:>18}: p50 {p50:7.3f} ms  max {worst:7.3f} ms per day")
+    conn.execute("CREATE INDEX ix_service_subscription_window ON service (created_at, valid_till) "
+                  "WHERE frequency IN ('WEEKLY', 'MONTHLY')")
+    conn.close()
+
+    from app import app
+    from extensions import db
+    with app.app_context():
+        for label, first_day, count in (
+            (f"next {roster.DEFAULT_DAYS} days", end.date(), roster.DEFAULT_DAYS),
+            ("whole history", start.date(), history),
+        ):
+            with db.engine.begin() as conn:
+                started = time.perf_counter()
+                roster.rebuild(conn, first_day, first_day + timedelta(days=count))
+                elapsed = time.perf_counter() - started
+            print(f"build {label}: {elapsed * 1000:9.1f} ms ({elapsed * 1000 / count:.2f} ms/day)")
+
+        with db.engine.connect() as conn:
+            timings = []
+            for day in days:
+                started = time.perf_counter()
+                pujas = sum(len(rows) for rows in roster.roster(conn, day).values())
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"read precomputed day: p50 {statistics.median(timings):.3f} ms, "
+                  f"max {max(timings):.3f} ms ({pujas} pujas on the last day)")
+
+
+if __name__ == '__main__':
+    main()
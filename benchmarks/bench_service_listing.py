@@ -0,0 +1,86 @@
+"""
+Service listing page latency from the newest page to deep into history.
+
+Fills a scratch database with --rows services, then fetches one page at
+each --depths fraction of the table (0.5 is halfway back), both the way the
+listing endpoint does, continuing from a cursor, and with LIMIT/OFFSET.
+Keyset pages should cost the same at every depth while OFFSET pages grow
+with the rows skipped. A filtered listing (one service type) is timed too.
+
+    python -m benchmarks.bench_service_listing --rows 1000000 --json listing.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import listing
+from app import app
+from benchmarks.datagen import create_schema, populate
+from benchmarks.harness import latency_summary
+from extensions import db
+
+OFFSET_PAGE = ("SELECT created_at, id, invoice_number, invoice_type, service_type, payment_method, amount "
+               "FROM service ORDER BY created_at DESC, id DESC LIMIT :limit OFFSET :offset")
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return latency_summary(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--depths', type=float, nargs='+', default=[0, 0.1, 0.5, 0.9, 0.999])
+    parser.add_argument('--limit', type=int, default=listing.DEFAULT_LIMIT)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    db_path = os.path.join(workdir, 'temple.db')
+    create_schema(db_path)
+    populate(db_path, args.rows, datetime(2021, 1, 1), datetime(2025, 1, 1))
+
+    fields = list(listing.DEFAULT_FIELDS)
+    results = {}
+    with app.app_context():
+        for depth in args.depths:
+            offset = min(int(args.rows * depth), args.rows - args.limit - 1)
+            cursor = None
+            if offset:
+                # The cursor the previous page would have handed out
+                cursor = tuple(db.session.execute(
+                    text("SELECT created_at, id FROM service ORDER BY created_at DESC, id DESC "
+                         "LIMIT 1 OFFSET :offset"), {'offset': offset - 1}
+                ).one())
+            keyset = timed(lambda: listing.page(db.session, {}, fields, cursor=cursor, limit=args.limit),
+                           args.repeat)
+            filtered = timed(lambda: listing.page(db.session, {'serviceType': 1}, fields, cursor=cursor,
+                                                  limit=args.limit), args.repeat)
+            offset_page = timed(lambda: db.session.execute(
+                text(OFFSET_PAGE), {'limit': args.limit, 'offset': offset}).fetchall(), args.repeat)
+            results[f"depth_{depth}"] = {'offset_rows': offset, 'keyset': keyset,
+                                         'keyset_service_type': filtered, 'offset': offset_page}
+            print(f"row {offset:>9}: keyset p50 {keyset['p50_ms']:7.2f} ms   "
+                  f"one service type p50 {filtered['p50_ms']:7.2f} ms   "
+                  f"OFFSET p50 {offset_page['p50_ms']:8.2f} ms")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'service_listing', params, results)
+
+
+if __name__ == '__main__':
+    main()
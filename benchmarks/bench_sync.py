@@ -0,0 +1,118 @@
+"""
+Kiosk to central sync cost against the size of the kiosk's service table.
+
+For each --sizes value a kiosk database is filled with that many services,
+all marked as already pushed, then --new services are added and pushed to a
+central server started on an empty database. Reading the pending rows from
+the change log and the whole push should take about as long for every size,
+since only the new rows are read; bytes on the wire are reported against
+the uncompressed JSON.
+
+    python -m benchmarks.bench_sync --sizes 10000 200000 --new 2000 --json sync.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read by the central server's app at import
+os.environ.setdefault('SYNC_TOKEN', 'bench')
+
+import sync
+from app import app
+from benchmarks.datagen import create_schema, next_ordinals, populate
+from benchmarks.harness import serve, use_database
+from benchmarks.loadtest import free_port, wait_until_ready
+from extensions import db
+
+DEVICE_ID = 'K1'
+
+
+def run_case(workdir, size, new, batch_size):
+    kiosk_db = os.path.join(workdir, f"kiosk-{size}.db")
+    create_schema(kiosk_db)
+    populate(kiosk_db, size, datetime(2023, 1, 1), datetime(2025, 1, 1))
+
+    port = free_port()
+    central = multiprocessing.Process(
+        target=serve, args=(os.path.join(workdir, f"central-{size}.db"), port, 4), daemon=True
+    )
+    central.start()
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(url)
+        use_database(kiosk_db)
+        with app.app_context():
+            # Everything so far counts as pushed; only the new rows travel
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO sync_state (target, pushed_seq) SELECT :target, MAX(seq) FROM sync_log"),
+                    {'target': url}
+                )
+            populate(kiosk_db, new, datetime(2025, 1, 1), datetime(2025, 1, 2), seed=7,
+                     first_ordinals=next_ordinals(kiosk_db))
+
+            with db.engine.connect() as conn:
+                after = sync.pushed_seq(conn, url)
+                started = time.perf_counter()
+                scanned, raw_bytes = 0, 0
+                while True:
+                    last, rows = sync.pending(conn, after, batch_size)
+                    if last is None:
+                        break
+                    scanned += len(rows)
+                    raw_bytes += len(json.dumps(rows, separators=(',', ':')))
+                    after = last
+                read_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            result = sync.push(db.engine, url, os.environ['SYNC_TOKEN'], DEVICE_ID, batch_size)
+            push_seconds = time.perf_counter() - started
+    finally:
+        central.terminate()
+        central.join()
+
+    return {
+        'table_rows': size + new,
+        'pushed_rows': result['rows'],
+        'batches': result['batches'],
+        'read_ms': read_seconds * 1000,
+        'push_seconds': push_seconds,
+        'rows_per_second': result['rows'] / push_seconds if push_seconds else 0.0,
+        'wire_bytes': result['bytes'],
+        'json_bytes': raw_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 200000],
+                        help="Services already on the kiosk")
+    parser.add_argument('--new', type=int, default=2000, help="New services to push")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    results = {}
+    for size in args.sizes:
+        result = results[f"rows_{size}"] = run_case(workdir, size, args.new, args.batch_size)
+        print(f"{result['table_rows']:>9} rows: read {result['pushed_rows']} new in {result['read_ms']:7.1f} ms, "
+              f"pushed in {result['push_seconds']:.2f} s ({result['rows_per_second']:,.0f} rows/s, "
+              f"{result['batches']} batches, {result['wire_bytes']:,} bytes vs {result['json_bytes']:,} as JSON)")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'sync', params, results)
+
+
+if __name__ == '__main__':
+    main()
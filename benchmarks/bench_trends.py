@@ -0,0 +1,100 @@
+"""
+Multi-year trend queries: columnar snapshot against pandas over SQLite.
+
+Fills a scratch database with --rows services over --years years, builds
+the analytics snapshot, then answers the same monthly trend split by
+service type both ways: the reports.py approach of reading the range's rows
+into pandas and grouping them, and analytics.Snapshot.trend() over the
+memory-mapped columns. Also times appending --new services to the snapshot.
+
+    python -m benchmarks.bench_trends --rows 1000000 --years 6 --json trends.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import storage
+from benchmarks.datagen import create_schema, next_ordinals, populate
+from benchmarks.harness import latency_summary
+
+BY_SPLITS = [('month', 'service_type'), ('week', 'payment_method'), ('day', None), ('year', 'service_type')]
+
+
+def pandas_trend(db_path, start, end, by, split):
+    """Group the range's rows the way reports.py reads them"""
+    import pandas as pd
+    conn = storage.connect_readonly(db_path)
+    try:
+        services = pd.read_sql_query(
+            "SELECT created_at, service_type, payment_method, amount FROM service "
+            "WHERE created_at >= ? AND created_at < ?",
+            conn, params=(start.isoformat(), end.isoformat()), parse_dates=['created_at']
+        )
+    finally:
+        conn.close()
+    freq = {'day': 'D', 'week': 'W-MON', 'month': 'MS', 'year': 'YS'}[by]
+    keys = [pd.Grouper(key='created_at', freq=freq)] + ([split] if split else [])
+    return services.groupby(keys)['amount'].agg(['count', 'sum'])
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return latency_summary(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--years', type=int, default=6)
+    parser.add_argument('--new', type=int, default=5000, help="Services appended incrementally")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-')
+    db_path = os.path.join(workdir, 'temple.db')
+    create_schema(db_path)
+    start, end = date(2025 - args.years, 1, 1), date(2025, 1, 1)
+    populate(db_path, args.rows, datetime.combine(start, datetime.min.time()),
+             datetime.combine(end, datetime.min.time()))
+
+    snapshot = analytics.Snapshot(db_path)
+    started = time.perf_counter()
+    snapshot.update()
+    results = {'build_seconds': time.perf_counter() - started, 'snapshot_bytes': snapshot.info()['bytes']}
+    print(f"snapshot: {args.rows} rows in {results['build_seconds']:.1f} s, "
+          f"{results['snapshot_bytes'] / 1e6:.1f} MB")
+
+    populate(db_path, args.new, datetime(2025, 1, 1), datetime(2025, 1, 2), seed=7,
+             first_ordinals=next_ordinals(db_path))
+    started = time.perf_counter()
+    added = snapshot.update()
+    results['append_ms'] = (time.perf_counter() - started) * 1000
+    print(f"append: {added} rows in {results['append_ms']:.1f} ms")
+
+    end = date(2025, 1, 2)
+    for by, split in BY_SPLITS:
+        label = f"{by}_{split or 'all'}"
+        snap = timed(lambda: snapshot.trend(start, end, by, split), args.repeat)
+        frame = timed(lambda: pandas_trend(db_path, start, end, by, split), max(1, args.repeat // 2))
+        results[label] = {'snapshot': snap, 'pandas': frame}
+        print(f"{label:<22} snapshot p50 {snap['p50_ms']:8.1f} ms   pandas p50 {frame['p50_ms']:8.1f} ms")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'trends', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Production server throughput as the number of worker threads grows.
+
+Starts serve.py on a scratch database once per --threads value and drives it
+with the same counters as benchmarks.loadtest, reporting sales per second,
+p95 latency and the error rate for each worker count. With --compare-serialize
+every worker count is also run with SQLITE_SERIALIZE_WRITES=0, where
+concurrent writers fall back to SQLite's busy timeout instead of the
+in-process write lock.
+
+    python -m benchmarks.bench_workers --threads 1 2 4 8 --counters 16 --duration 15 --json workers.json
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import serve
+from benchmarks.loadtest import drive, free_port, wait_until_ready
+
+
+def run_case(db_path, threads, serialize, counters, duration, think_time):
+    """Serve a fresh copy of the database with `threads` workers and drive it"""
+    workdir = tempfile.mkdtemp(prefix='sscm-workers-')
+    case_db = os.path.join(workdir, 'temple.db')
+    if db_path:
+        source, target = sqlite3.connect(db_path), sqlite3.connect(case_db)
+        source.backup(target)
+        source.close()
+        target.close()
+    # Read by storage.configure in the server process
+    os.environ['TEMPLE_SQLITE_SERIALIZE_WRITES'] = str(int(serialize))
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(case_db, port, threads), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url)
+        return drive(base_url, counters, duration, think_time=think_time)
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help="Worker thread counts")
+    parser.add_argument('--counters', type=int, default=16, help="Concurrent counters")
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds per case")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help="Mean seconds between a counter's sales (0: back to back)")
+    parser.add_argument('--db', help="Database to copy for each case (default: empty)")
+    parser.add_argument('--compare-serialize', action='store_true',
+                        help="Also run every case with SQLITE_SERIALIZE_WRITES=0")
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    modes = [True, False] if args.compare_serialize else [True]
+    results = {}
+    for serialize in modes:
+        for threads in args.threads:
+            label = f"threads_{threads}" + ('' if serialize else '_unserialized')
+            result = run_case(args.db, threads, serialize, args.counters, args.duration, args.think_time)
+            results[label] = result
+            print(f"{threads:>3} threads{'' if serialize else ' (unserialized)':<15}: "
+                  f"{result['requests_per_second']:>8.1f} sales/s  "
+                  f"p95 {result['latency']['p95_ms']:>7.1f} ms  errors {result['error_rate']:.2%}")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'workers', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Counter write latency while a monthly report is being generated.
+
+A writer posts sales through the app continuously; part way through, a
+report for a large month is generated in a separate process, as a report
+job would be. Write latency before and during the report is printed for
+each journal mode, so WAL can be compared with the old rollback journal.
+Use --workdir to put the database on the SD card being measured.
+
+    python -m benchmarks.bench_write_during_report --rows 200000 --journal-modes WAL DELETE
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import create_schema, populate
+from benchmarks.harness import use_database, percentile
+
+
+def generate_report(year, month, output_file):
+    from reports import generate_monthly_report
+    generate_monthly_report(year, month, output_file)
+
+
+def run(db_path, journal_mode, warmup):
+    app = use_database(db_path)
+    app.config['SQLITE_JOURNAL_MODE'] = journal_mode
+    import storage
+    storage.configure(app)
+    client = app.test_client()
+    client.post('/login', data={'username': 'clerk', 'password': 'clerk123'})
+
+    now = datetime.utcnow()
+    output_file = os.path.join(os.path.dirname(db_path), f"{journal_mode}.xlsx")
+    report = multiprocessing.Process(target=generate_report, args=(now.year, now.month, output_file))
+    before, during = [], []
+    started = time.perf_counter()
+    while True:
+        if not report.is_alive() and report.exitcode is None and time.perf_counter() - started > warmup:
+            report.start()
+        t0 = time.perf_counter()
+        response = client.post('/temple-management/services?serviceType=1',
+                               json={'invoiceType': 'TOKEN', 'paymentMethod': 'CASH'})
+        latency = time.perf_counter() - t0
+        assert response.status_code == 200, response.get_json()
+        (during if report.is_alive() else before).append(latency)
+        if report.exitcode is not None:
+            break
+    return before, during
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--journal-modes', nargs='+', default=['WAL', 'DELETE'])
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--workdir')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sscm-bench-', dir=args.workdir)
+    template = os.path.join(workdir, 'template.db')
+    create_schema(template)
+    # The current month, so the report and the live sales hit the same range
+    now = datetime.utcnow()
+    populate(template, args.rows, datetime(now.year, now.month, 1), now)
+
+    print(f"{'journal':>8} {'phase':>7} {'writes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in args.journal_modes:
+        db_path = os.path.join(workdir, f"{mode.lower()}.db")
+        shutil.copy(template, db_path)
+        before, during = run(db_path, mode, args.warmup)
+        for phase, latencies in (('before', before), ('during', during)):
+            print(f"{mode:>8} {phase:>7} {len(latencies):>7} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{max(latencies, default=float('nan')) * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
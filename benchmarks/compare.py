@@ -0,0 +1,63 @@
+"""
+Side-by-side comparison of two benchmark result files.
+
+Lists every numeric result in either file with the relative change, and
+marks changes beyond --threshold percent.
+
+    python -m benchmarks.compare before.json after.json --threshold 5
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.results import load_results, flatten
+
+
+def compare(before, after):
+    """
+    Pair up the numeric results of two runs.
+
+    Returns:
+        list: (metric, before value or None, after value or None, change % or None)
+    """
+    old, new = flatten(before['results']), flatten(after['results'])
+    rows = []
+    for metric in sorted(old.keys() | new.keys()):
+        a, b = old.get(metric), new.get(metric)
+        change = (b - a) / a * 100 if a not in (None, 0) and b is not None else None
+        rows.append((metric, a, b, change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help="Flag changes larger than this many percent")
+    args = parser.parse_args()
+
+    before, after = load_results(args.before), load_results(args.after)
+    if before['benchmark'] != after['benchmark']:
+        sys.exit(f"Different benchmarks: {before['benchmark']} vs {after['benchmark']}")
+    for label, run in (('before', before), ('after', after)):
+        env = run['environment']
+        print(f"{label:>6}: {run['recorded_at']} commit {env['commit']}"
+              f"{' (dirty)' if env['dirty'] else ''} on {env['machine']}, {env['cpus']} CPUs")
+    if before['params'] != after['params']:
+        print("warning: the runs used different parameters")
+
+    rows = compare(before, after)
+    width = max([len(metric) for metric, *_ in rows] + [6])
+    print(f"{'metric':<{width}} {'before':>12} {'after':>12} {'change':>9}")
+    for metric, a, b, change in rows:
+        flag = ' *' if change is not None and abs(change) >= args.threshold else ''
+        print(f"{metric:<{width}} {'-' if a is None else f'{a:.4g}':>12} "
+              f"{'-' if b is None else f'{b:.4g}':>12} "
+              f"{'' if change is None else f'{change:+.1f}%':>9}{flag}")
+
+
+if __name__ == '__main__':
+    main()
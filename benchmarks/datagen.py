@@ -0,0 +1,260 @@
+"""
+Synthetic service data for benchmarks.
+
+Rows are written straight through sqlite3 in the same column formats that
+SQLAlchemy uses, so the app and the report engine read them like real sales.
+Sales follow the real price list and a counter's service, frequency and
+payment mix, and cluster on Thursdays, Sundays, festivals and opening hours.
+
+Filling a database from the command line (an existing one is added to):
+
+    python -m benchmarks.datagen --db temple.db --rows 2000000 --start 2021-01-01 --end 2025-01-01
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups
+from models import ServiceType, SERVICE_PRICES
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Most counter sales are cheap single-day tokens
+SERVICE_WEIGHTS = {1: 40, 2: 30, 3: 6, 4: 4, 5: 3, 6: 3, 7: 2, 8: 1, 9: 3,
+                   10: 1, 11: 1, 12: 1, 13: 0.5, 14: 1, 15: 0.3, 16: 0.5,
+                   17: 0.5, 18: 2, 19: 2}
+PAYMENT_WEIGHTS = {'CASH': 60, 'UPI': 35, 'CARD': 5}
+FREQUENCY_WEIGHTS = {'SINGLE': 90, 'WEEKLY': 6, 'MONTHLY': 4}
+FREQUENCY_DAYS = {'SINGLE': 1, 'WEEKLY': 7, 'MONTHLY': 30}
+FREQUENCY_MULTIPLIER = {'SINGLE': 1, 'WEEKLY': 7, 'MONTHLY': 30}
+
+# Thursday is the Sai temple's busy day, Sunday the family day (Monday first)
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 2.5, 1.0, 1.2, 1.8)
+# Festival multipliers by (month, day). The real dates follow the lunar
+# calendar; fixed days are close enough to shape the load.
+FESTIVALS = {(1, 1): 4, (1, 14): 5, (4, 6): 6, (7, 21): 8, (10, 12): 8, (12, 25): 3}
+# Counter opening hours
+OPEN_HOURS = (6, 21)
+
+# Devotee names are drawn from these, so names repeat like real ones do
+FIRST_NAMES = ('Venkata', 'Srinivas', 'Lakshmi', 'Rama', 'Sai', 'Padma', 'Suresh', 'Ramesh',
+               'Anjali', 'Krishna', 'Sita', 'Ravi', 'Durga', 'Prasad', 'Kavya', 'Naga',
+               'Surya', 'Bhavani', 'Mohan', 'Sarada', 'Gopal', 'Uma', 'Hari', 'Vani')
+SURNAMES = ('Rao', 'Reddy', 'Sharma', 'Naidu', 'Murthy', 'Chowdary', 'Sastry', 'Varma',
+            'Kumar', 'Devi', 'Prasad', 'Raju', 'Gupta', 'Setty', 'Iyer', 'Acharya')
+
+COLUMNS = (
+    'service_type', 'service_name', 'invoice_type', 'invoice_number', 'frequency',
+    'valid_till', 'devotee_name', 'contact_number', 'gothram', 'puja_details',
+    'address1', 'city', 'district', 'state', 'pincode', 'payment_method',
+    'amount', 'created_at'
+)
+
+
+def _weighted(rng, weights, k):
+    return rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+
+def devotee_name(number):
+    """A repeatable devotee name for a devotee number"""
+    first = FIRST_NAMES[number % len(FIRST_NAMES)]
+    middle = FIRST_NAMES[number // len(FIRST_NAMES) % len(FIRST_NAMES)]
+    surname = SURNAMES[number // len(FIRST_NAMES) ** 2 % len(SURNAMES)]
+    return f"{first} {middle} {surname}"
+
+
+def archive_invoice_number(prefix, ordinal):
+    """
+    Invoice number for a synthetic row, e.g. HT00000001.
+
+    The app's own format (TA0001 .. TZ9999) has room for 259,974 numbers per
+    prefix, far fewer than a multi-year dataset needs. Synthetic rows use this
+    separate series instead, which also leaves the app's counters free, so
+    sales issued during a benchmark start at TA0001 / RA0001.
+    """
+    return f"H{prefix}{ordinal + 1:08d}"
+
+
+def day_weight(day):
+    """Relative number of sales on a day"""
+    return WEEKDAY_WEIGHTS[day.weekday()] * FESTIVALS.get((day.month, day.day), 1)
+
+
+def _sale_windows(start, end):
+    """(first, last, weight) of each day's selling hours within [start, end)"""
+    windows = []
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        midnight = datetime.combine(day, datetime.min.time())
+        first = max(start, midnight + timedelta(hours=OPEN_HOURS[0]))
+        last = min(end, midnight + timedelta(hours=OPEN_HOURS[1]))
+        if last <= first:
+            # The range starts or ends outside opening hours; use what is left
+            first = max(start, midnight)
+            last = min(end, midnight + timedelta(days=1))
+        if last > first:
+            windows.append((first, last, day_weight(day)))
+        day += timedelta(days=1)
+    return windows
+
+
+def sale_times(rng, count, start, end):
+    """Yield `count` ascending sale times in [start, end), shaped by day_weight and OPEN_HOURS"""
+    windows = _sale_windows(start, end)
+    total = sum(weight for _, _, weight in windows)
+    # Largest remainder split, so the counts add up to exactly `count`
+    quotas = [count * weight / total for _, _, weight in windows]
+    counts = [int(quota) for quota in quotas]
+    by_remainder = sorted(range(len(quotas)), key=lambda i: quotas[i] - counts[i], reverse=True)
+    for i in by_remainder[:count - sum(counts)]:
+        counts[i] += 1
+    for (first, last, _), day_count in zip(windows, counts):
+        span = last - first
+        for fraction in sorted(rng.random() for _ in range(day_count)):
+            yield first + span * fraction
+
+
+def generate_rows(count, start, end, seed=42, first_ordinals=None):
+    """
+    Yield `count` service row tuples over [start, end), in created_at order.
+
+    Invoice ordinals continue from `first_ordinals` ({'T': n, 'R': n}) and
+    the dict is updated in place, so successive calls never collide.
+    """
+    rng = random.Random(seed)
+    times = sale_times(random.Random(seed + 1), count, start, end)
+    ordinals = first_ordinals if first_ordinals is not None else {'T': 0, 'R': 0}
+    chunk = 10000
+    for base in range(0, count, chunk):
+        size = min(chunk, count - base)
+        types = _weighted(rng, SERVICE_WEIGHTS, size)
+        payments = _weighted(rng, PAYMENT_WEIGHTS, size)
+        frequencies = _weighted(rng, FREQUENCY_WEIGHTS, size)
+        for i in range(size):
+            service_type = types[i]
+            # Only Abhishekam is sold weekly/monthly at the counter
+            frequency = frequencies[i] if service_type == 1 else 'SINGLE'
+            invoice_type = 'TOKEN' if service_type in (1, 2) and frequency == 'SINGLE' else 'RECEIPT'
+            prefix = invoice_type[0]
+            invoice_number = archive_invoice_number(prefix, ordinals[prefix])
+            ordinals[prefix] += 1
+            created_at = next(times)
+            devotee = rng.randrange(200000)
+            detailed = invoice_type == 'RECEIPT'
+            yield (
+                service_type,
+                ServiceType(service_type).name,
+                invoice_type,
+                invoice_number,
+                frequency,
+                (created_at + timedelta(days=FREQUENCY_DAYS[frequency])).strftime(DATETIME_FORMAT),
+                devotee_name(devotee) if detailed or devotee % 3 == 0 else None,
+                f"9{devotee:09d}" if detailed else None,
+                f"Gothram {devotee % 97}" if detailed else None,
+                f"Puja for family {devotee}" if detailed else None,
+                f"{devotee % 500} Main Road" if detailed else None,
+                'Vidyanagar' if detailed else None,
+                'Guntur' if detailed else None,
+                'Andhra Pradesh' if detailed else None,
+                '522001' if detailed else None,
+                payments[i],
+                float(SERVICE_PRICES[service_type] * FREQUENCY_MULTIPLIER[frequency]),
+                created_at.strftime(DATETIME_FORMAT),
+            )
+
+
+def populate(db_path, count, start, end, seed=42, first_ordinals=None):
+    """Insert `count` synthetic rows into an existing service table"""
+    conn = sqlite3.connect(db_path)
+    placeholders = ', '.join('?' * len(COLUMNS))
+    with conn:
+        conn.executemany(
+            f"INSERT INTO service ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            generate_rows(count, start, end, seed, first_ordinals)
+        )
+        # Bulk rows bypass create_service, so refresh the rollups they touch
+        # and drop the roster days they touch (rebuilt when next asked for)
+        days = rollups.range_params(start.date() - timedelta(days=1), end.date() + timedelta(days=1))
+        for statement in rollups.REBUILD:
+            conn.execute(statement, days)
+        conn.execute("DELETE FROM roster_day WHERE day >= :start AND day < :end", days)
+    conn.close()
+
+
+def next_ordinals(db_path):
+    """Archive ordinals following the synthetic rows already in a database"""
+    conn = sqlite3.connect(db_path)
+    ordinals = {}
+    for prefix in ('T', 'R'):
+        last = conn.execute(
+            "SELECT MAX(invoice_number) FROM service WHERE invoice_number >= ? AND invoice_number < ?",
+            (f"H{prefix}", f"H{prefix}~")
+        ).fetchone()[0]
+        ordinals[prefix] = int(last[2:]) if last else 0
+    conn.close()
+    return ordinals
+
+
+def create_schema(db_path):
+    """Create the app's tables in a scratch database file"""
+    from app import init_db
+    from benchmarks.harness import use_database
+    use_database(db_path)
+    init_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic services")
+    parser.add_argument('--db', default='temple.db', help="Database file, created if missing")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2021, 1, 1))
+    parser.add_argument('--end', type=date.fromisoformat, default=date(2025, 1, 1),
+                        help="Day after the last day")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-devotees', action='store_true',
+                        help="Do not rebuild the devotee directory afterwards")
+    parser.add_argument('--json', help="Write timings to this JSON file")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    create_schema(db_path)
+    start = datetime.combine(args.start, datetime.min.time())
+    end = datetime.combine(args.end, datetime.min.time())
+
+    started = time.perf_counter()
+    populate(db_path, args.rows, start, end, args.seed, next_ordinals(db_path))
+    insert_seconds = time.perf_counter() - started
+    print(f"Inserted {args.rows} services in {insert_seconds:.1f}s "
+          f"({args.rows / insert_seconds:.0f} rows/s)")
+
+    directory_seconds = None
+    if not args.skip_devotees:
+        import devotees
+        from app import app
+        from extensions import db
+        started = time.perf_counter()
+        with app.app_context():
+            with db.engine.begin() as conn:
+                count = devotees.backfill(conn)
+        directory_seconds = time.perf_counter() - started
+        print(f"Devotee directory rebuilt: {count} devotees in {directory_seconds:.1f}s")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'datagen', params, {
+            'rows': args.rows,
+            'insert_seconds': insert_seconds,
+            'rows_per_second': args.rows / insert_seconds,
+            'devotee_backfill_seconds': directory_seconds,
+        })
+
+
+if __name__ == '__main__':
+    main()
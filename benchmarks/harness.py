@@ -0,0 +1,74 @@
+"""Helpers shared by the benchmark scripts."""
+import logging
+import multiprocessing
+import resource
+import statistics
+import time
+
+
+def _child(fn, args, results):
+    started = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+
+
+def run_isolated(fn, *args):
+    """Run fn(*args) in a fresh process; return (seconds, peak RSS bytes)"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(fn, args, results))
+    process.start()
+    outcome = results.get()
+    process.join()
+    return outcome
+
+
+def use_database(db_path):
+    """Point the app (engine and read-only report connections) at a scratch database"""
+    import storage
+    from app import app
+    app.config['DATABASE_PATH'] = db_path
+    storage.configure(app)
+    return app
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of samples (fraction 0.5 is the median)"""
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean of latencies given in seconds, in milliseconds"""
+    return {
+        'p50_ms': percentile(seconds, 0.50) * 1000,
+        'p95_ms': percentile(seconds, 0.95) * 1000,
+        'p99_ms': percentile(seconds, 0.99) * 1000,
+        'max_ms': max(seconds, default=float('nan')) * 1000,
+        'mean_ms': statistics.fmean(seconds) * 1000 if seconds else float('nan'),
+    }
+
+
+def serve(db_path, port, threads=0):
+    """
+    Run the app on a database (process target).
+
+    With threads, on the production server (serve.py) with that many worker
+    threads; otherwise on the threaded development server.
+    """
+    from app import init_db
+    app = use_database(db_path)
+    init_db()
+    # Slow statements under deliberate overload are expected here
+    logging.getLogger('temple.slow_queries').setLevel(logging.ERROR)
+    if threads:
+        import serve as production
+        logging.getLogger('waitress').setLevel(logging.ERROR)
+        production.run(app, '127.0.0.1', port, threads, production.DEFAULTS['CONNECTION_LIMIT'], 5.0)
+        return
+    # Per-request log lines would cost more than some requests
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app.run(host='127.0.0.1', port=port, threaded=True, use_reloader=False)
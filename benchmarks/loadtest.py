@@ -0,0 +1,220 @@
+"""
+Concurrent load driver: several counters selling at once over HTTP.
+
+Each counter is a thread with its own logged-in session that posts sales to
+/temple-management/services back to back (or with --think-time between
+them), drawing services from the same mix as benchmarks.datagen. Latency is
+measured per request; anything but a 200 counts as an error.
+
+By default a server is started in a separate process on a scratch copy of
+--db (or an empty database), so the app is measured with the data size you
+choose; pass --url to drive a server that is already running instead.
+
+    python -m benchmarks.datagen --db /tmp/festival.db --rows 1000000
+    python -m benchmarks.loadtest --db /tmp/festival.db --counters 8 --duration 30 --json load.json
+"""
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import (
+    SERVICE_WEIGHTS, PAYMENT_WEIGHTS, FREQUENCY_WEIGHTS, devotee_name
+)
+from benchmarks.harness import latency_summary, serve
+
+
+def sale(rng):
+    """(service type, request body) for one counter sale that passes validation"""
+    service_type = rng.choices(list(SERVICE_WEIGHTS), weights=list(SERVICE_WEIGHTS.values()))[0]
+    frequency = 'SINGLE'
+    if service_type == 1:
+        frequency = rng.choices(list(FREQUENCY_WEIGHTS), weights=list(FREQUENCY_WEIGHTS.values()))[0]
+    invoice_type = 'TOKEN' if service_type in (1, 2) and frequency == 'SINGLE' else 'RECEIPT'
+    body = {
+        'invoiceType': invoice_type,
+        'frequency': frequency,
+        'paymentMethod': rng.choices(list(PAYMENT_WEIGHTS), weights=list(PAYMENT_WEIGHTS.values()))[0],
+    }
+    if invoice_type == 'RECEIPT':
+        devotee = rng.randrange(200000)
+        body.update({
+            'devoteeName': devotee_name(devotee),
+            'devoteeContactNum': f"9{devotee:09d}",
+            'gothram': f"Gothram {devotee % 97}",
+            'pujaDetails': f"Puja for family {devotee}",
+            'address': {'address1': f"{devotee % 500} Main Road", 'city': 'Vidyanagar',
+                        'district': 'Guntur', 'state': 'Andhra Pradesh', 'pincode': '522001'},
+        })
+    return service_type, body
+
+
+class CounterSession:
+    """One logged-in counter: a cookie jar and an opener"""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        form = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(f"{base_url}/login", data=form, timeout=30).read()
+
+    def post_sale(self, service_type, body):
+        """POST one sale; returns (status, error message or None)"""
+        request = urllib.request.Request(
+            f"{self.base_url}/temple-management/services?serviceType={service_type}",
+            data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('message')
+            except ValueError:
+                message = e.reason
+            return e.code, message
+        except OSError as e:
+            return None, str(e)
+
+
+def run_counter(session, seed, deadline, max_requests, think_time, samples, errors):
+    rng = random.Random(seed)
+    sent = 0
+    while time.monotonic() < deadline and (not max_requests or sent < max_requests):
+        service_type, body = sale(rng)
+        started = time.perf_counter()
+        status, message = session.post_sale(service_type, body)
+        samples.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(f"{status}: {message}")
+        sent += 1
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def drive(base_url, counters, duration, max_requests=0, think_time=0.0,
+          username='clerk', password='clerk123'):
+    """
+    Run `counters` concurrent counters against a server.
+
+    Returns:
+        dict: Request count, error rate, throughput and latency percentiles
+    """
+    sessions = [CounterSession(base_url, username, password) for _ in range(counters)]
+    samples, errors = [], []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=run_counter,
+                         args=(session, seed, deadline, max_requests, think_time, samples, errors))
+        for seed, session in enumerate(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_rate': len(errors) / len(samples) if samples else 0.0,
+        'seconds': elapsed,
+        'requests_per_second': len(samples) / elapsed,
+        'latency': latency_summary(samples),
+        'top_errors': Counter(errors).most_common(5),
+    }
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--counters', type=int, default=4, help="Concurrent counters")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds to run")
+    parser.add_argument('--requests', type=int, default=0, help="Stop each counter after this many sales")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help="Mean seconds between a counter's sales (0: back to back)")
+    parser.add_argument('--url', help="Drive this running server instead of starting one")
+    parser.add_argument('--db', help="Database to copy for the started server (default: empty)")
+    parser.add_argument('--threads', type=int, default=0,
+                        help="Run the started server on serve.py with this many threads (0: development server)")
+    parser.add_argument('--username', default='clerk')
+    parser.add_argument('--password', default='clerk123')
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        workdir = tempfile.mkdtemp(prefix='sscm-load-')
+        db_path = os.path.join(workdir, 'temple.db')
+        if args.db:
+            # The backup API also picks up anything still in the WAL file
+            source, target = sqlite3.connect(args.db), sqlite3.connect(db_path)
+            source.backup(target)
+            source.close()
+            target.close()
+        port = free_port()
+        server = multiprocessing.Process(target=serve, args=(db_path, port, args.threads), daemon=True)
+        server.start()
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url)
+        results = drive(base_url, args.counters, args.duration, args.requests,
+                        args.think_time, args.username, args.password)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    latency = results['latency']
+    print(f"{args.counters} counters: {results['requests']} sales in {results['seconds']:.1f}s "
+          f"({results['requests_per_second']:.1f}/s), error rate {results['error_rate']:.2%}")
+    print(f"latency ms: p50 {latency['p50_ms']:.1f}  p95 {latency['p95_ms']:.1f}  "
+          f"p99 {latency['p99_ms']:.1f}  max {latency['max_ms']:.1f}")
+    for message, count in results['top_errors']:
+        print(f"  {count} x {message}")
+
+    if args.json:
+        from benchmarks.results import write_results
+        params = {key: value for key, value in vars(args).items() if key not in ('json', 'password')}
+        write_results(args.json, 'loadtest', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Machine-readable benchmark results.
+
+Every benchmark that takes --json writes one file in the same envelope:
+what ran, with which parameters, on which commit and machine, and its
+numbers under "results". benchmarks/compare.py diffs two such files.
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Where a run happened, so results from different machines are not mixed up"""
+    status = _git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_results(path, benchmark, params, results):
+    """Write one run's results to `path` as JSON"""
+    document = {
+        'benchmark': benchmark,
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'command': ' '.join(sys.argv),
+        'environment': environment(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as handle:
+        json.dump(document, handle, indent=2, default=str)
+        handle.write('\n')
+    print(f"Results written to {path}")
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def flatten(value, prefix=''):
+    """Numeric leaves of nested dicts/lists as {'a.b.0.c': number}"""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return {prefix: value}
+        return {}
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
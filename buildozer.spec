@@ -3,10 +3,10 @@ title = sscm
 package.name = templesscm
 package.domain = org.sscm
 source.dir = .
-source.include_exts = py,png,jpg,jpeg,kv,atlas,db,txt,html,css,js
+source.include_exts = py,png,jpg,jpeg,kv,atlas,db,txt,html,css,js,json,woff,woff2,gz,br
 version = 1.0
 
-requirements = python3,kivy,kivymd,flask,flask-sqlalchemy,flask-login,flask-wtf,werkzeug,python-dotenv,sqlalchemy,openpyxl,pandas
+requirements = python3,kivy,kivymd,flask,waitress,flask-sqlalchemy,flask-login,flask-wtf,werkzeug,python-dotenv,sqlalchemy,openpyxl,pandas,numpy
 bootstrap = sdl2
 android.api = 30
 
@@ -0,0 +1,247 @@
+import argparse
+import bisect
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+import storage
+
+# The service catalog (what the counter sells and at which price) lives in
+# the service_catalog and service_price tables. Prices are effective-dated:
+# a new price applies to sales from its effective_from on, and the amount of
+# every past sale stays whatever was charged at the time.
+#
+# Each process keeps the whole catalog in memory as one Catalog snapshot.
+# Every change bumps catalog_version in the same transaction; the cached
+# snapshot is checked against it at most every CHECK_SECONDS (on a separate
+# read-only connection) and reloaded only when the version moved, so the
+# price lookup on a sale is a dict lookup with no database round-trip.
+
+# How stale another process's catalog change may be before this one sees it
+CHECK_SECONDS = 5.0
+
+# effective_from of the prices seeded from models.SERVICE_PRICES
+SEED_EFFECTIVE_FROM = datetime(2000, 1, 1)
+
+# Weekly and monthly subscriptions are charged per day of validity
+FREQUENCY_MULTIPLIERS = {'SINGLE': 1, 'WEEKLY': 7, 'MONTHLY': 30}
+
+VERSION = "SELECT version FROM catalog_version WHERE id = 1"
+SERVICES = "SELECT service_type, name, display_name, active FROM service_catalog ORDER BY service_type"
+PRICES = "SELECT service_type, effective_from, price FROM service_price ORDER BY service_type, effective_from"
+
+SET_PRICE = """
+INSERT INTO service_price (service_type, price, effective_from)
+VALUES (:service_type, :price, :effective_from)
+ON CONFLICT (service_type, effective_from) DO UPDATE SET price = excluded.price
+"""
+
+BUMP_VERSION = "UPDATE catalog_version SET version = version + 1, changed_at = :now WHERE id = 1"
+
+_cache = None
+_check_after = 0.0
+_lock = threading.Lock()
+
+
+def _stamp(when):
+    # Same fixed-width text SQLAlchemy stores DateTime columns as, so
+    # effective_from compares correctly as a string
+    return when.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def display_name(name):
+    """ABHISHEKAM -> Abhishekam, as shown on the dashboard and in reports"""
+    return name.replace('_', ' ').title()
+
+
+class Catalog:
+    """One version of the catalog, with current prices precomputed"""
+
+    def __init__(self, version, services, prices):
+        self.version = version
+        # {service_type: {'name', 'display_name', 'active'}}
+        self.services = services
+        # {service_type: ([effective_from, ...], [price, ...])}, ascending
+        self.prices = prices
+        self.names = {service_type: service['name'] for service_type, service in services.items()}
+        self.display_names = {
+            service_type: service['display_name'] for service_type, service in services.items()
+        }
+        # The shape dashboard.html iterates over, built once per version
+        self.service_types = {
+            service_type: {'name': service['name'], 'value': service_type}
+            for service_type, service in services.items() if service['active']
+        }
+        self._current = None
+        self._roll(datetime.utcnow())
+
+    def _roll(self, now):
+        # Prices in force now, and when the next scheduled price change is due
+        current, next_change = {}, datetime.max
+        for service_type, (starts, amounts) in self.prices.items():
+            index = bisect.bisect_right(starts, now)
+            if index and self.services[service_type]['active']:
+                current[service_type] = amounts[index - 1]
+            if index < len(starts):
+                next_change = min(next_change, starts[index])
+        # Swapped in one assignment so concurrent readers never see a mix
+        self._current = (current, next_change)
+
+    def current_prices(self):
+        """{service_type: price} of every active service, as of now"""
+        current, next_change = self._current
+        if next_change != datetime.max:
+            now = datetime.utcnow()
+            if now >= next_change:
+                self._roll(now)
+                current = self._current[0]
+        return current
+
+    def price(self, service_type, frequency='SINGLE', at=None):
+        """
+        Price of a service, or None if it is unknown, retired or not yet priced.
+
+        Args:
+            service_type (int): Service type
+            frequency (str): SINGLE, WEEKLY or MONTHLY
+            at (datetime): Price in force at this time (defaults to now)
+        """
+        if at is None:
+            base = self.current_prices().get(service_type)
+        else:
+            starts, amounts = self.prices.get(service_type, ((), ()))
+            index = bisect.bisect_right(starts, at)
+            base = amounts[index - 1] if index else None
+        return base * FREQUENCY_MULTIPLIERS.get(frequency, 1) if base is not None else None
+
+    def is_sold(self, service_type):
+        return service_type in self.current_prices()
+
+
+def load(conn):
+    """Read a Catalog snapshot over a sqlite3 connection"""
+    version = conn.execute(VERSION).fetchone()
+    services = {
+        service_type: {'name': name, 'display_name': label, 'active': bool(active)}
+        for service_type, name, label, active in conn.execute(SERVICES)
+    }
+    prices = {}
+    for service_type, effective_from, price in conn.execute(PRICES):
+        starts, amounts = prices.setdefault(service_type, ([], []))
+        starts.append(datetime.fromisoformat(effective_from))
+        # Whole rupee prices stay ints, as they were in SERVICE_PRICES
+        amounts.append(int(price) if float(price).is_integer() else price)
+    return Catalog(version[0] if version else 0, services, prices)
+
+
+def get():
+    """
+    The current Catalog snapshot.
+
+    Returns the cached snapshot unless CHECK_SECONDS have passed since the
+    version was last checked; then reads the version and reloads if it moved.
+    """
+    global _cache, _check_after
+    if _cache is not None and time.monotonic() < _check_after:
+        return _cache
+    with _lock:
+        if _cache is None or time.monotonic() >= _check_after:
+            conn = storage.connect_readonly()
+            try:
+                # Version first: a change committed in between is picked up
+                # now or at the next check, never missed
+                version = conn.execute(VERSION).fetchone()
+                if _cache is None or version is None or version[0] != _cache.version:
+                    _cache = load(conn)
+            finally:
+                conn.close()
+            _check_after = time.monotonic() + CHECK_SECONDS
+    return _cache
+
+
+def invalidate():
+    """Make the next get() check the version; call after committing a change"""
+    global _check_after
+    _check_after = 0.0
+
+
+def set_price(conn, service_type, price, effective_from=None):
+    """
+    Schedule a new price for a service inside the caller's transaction.
+
+    Prices can only change from now on; sales already made keep their amount.
+
+    Args:
+        conn: SQLAlchemy connection or session
+        service_type (int): Service type in the catalog
+        price (float): New price of a single service
+        effective_from (datetime): When the price applies (defaults to now)
+
+    Returns:
+        datetime: When the price applies
+    """
+    now = datetime.utcnow()
+    effective_from = effective_from or now
+    if price <= 0:
+        raise ValueError("Price must be greater than zero")
+    if effective_from < now.replace(second=0, microsecond=0):
+        raise ValueError("Prices can only change from now on")
+    if conn.execute(text("SELECT 1 FROM service_catalog WHERE service_type = :service_type"),
+                    {'service_type': service_type}).first() is None:
+        raise ValueError("Invalid service type")
+
+    conn.execute(text(SET_PRICE), {
+        'service_type': service_type, 'price': price, 'effective_from': _stamp(effective_from)
+    })
+    conn.execute(text(BUMP_VERSION), {'now': _stamp(now)})
+    return effective_from
+
+
+def seed(conn):
+    """Fill an empty catalog from the ServiceType enum and SERVICE_PRICES"""
+    from models import ServiceType, SERVICE_PRICES
+    for service_type in ServiceType:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO service_catalog (service_type, name, display_name, active) "
+            "VALUES (:service_type, :name, :display_name, 1)"
+        ), {'service_type': service_type.value, 'name': service_type.name,
+            'display_name': display_name(service_type.name)})
+    for service_type, price in SERVICE_PRICES.items():
+        conn.execute(text(
+            "INSERT INTO service_price (service_type, price, effective_from) "
+            "SELECT :service_type, :price, :effective_from WHERE NOT EXISTS "
+            "(SELECT 1 FROM service_price WHERE service_type = :service_type)"
+        ), {'service_type': service_type, 'price': price,
+            'effective_from': _stamp(SEED_EFFECTIVE_FROM)})
+    conn.execute(text(
+        "INSERT OR IGNORE INTO catalog_version (id, version, changed_at) VALUES (1, 1, :now)"
+    ), {'now': _stamp(datetime.utcnow())})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the service catalog or schedule a price change")
+    parser.add_argument('command', choices=['show', 'set-price'])
+    parser.add_argument('service_type', type=int, nargs='?')
+    parser.add_argument('price', type=float, nargs='?')
+    parser.add_argument('--from', dest='effective_from', type=datetime.fromisoformat,
+                        help="When the price applies (YYYY-MM-DD[ HH:MM], UTC; defaults to now)")
+    args = parser.parse_args()
+
+    from app import app, init_db
+    from extensions import db
+    init_db()
+    with app.app_context():
+        if args.command == 'set-price':
+            if args.service_type is None or args.price is None:
+                parser.error("set-price needs a service type and a price")
+            with db.engine.begin() as conn:
+                effective_from = set_price(conn, args.service_type, args.price, args.effective_from)
+            print(f"Service {args.service_type} costs {args.price:g} from {effective_from}")
+
+        snapshot = get()
+        print(f"Catalog version {snapshot.version}")
+        for service_type, service in snapshot.services.items():
+            starts, amounts = snapshot.prices.get(service_type, ((), ()))
+            history = ', '.join(f"{amount:g} from {start.date()}" for start, amount in zip(starts, amounts))
+            print(f"{service_type:>3} {service['display_name']:<45} "
+                  f"{'' if service['active'] else '(retired) '}{history}")
@@ -0,0 +1,268 @@
+import argparse
+import re
+from datetime import datetime
+from sqlalchemy import text
+
+# Devotee directory: one row per (name, phone) pair seen at the counter, so
+# regular devotees are picked from a list instead of retyped. Service rows
+# keep their own copy of the details (the receipt as issued) and point at
+# their devotee through service.devotee_id.
+
+ADDRESS_FIELDS = ('address1', 'address2', 'address3', 'address4',
+                  'city', 'district', 'state', 'pincode')
+DETAIL_FIELDS = ('gothram',) + ADDRESS_FIELDS
+
+# Upper bound for a prefix range scan on a text index
+PREFIX_END = '\U0010ffff'
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 25
+
+
+def display_name(name):
+    """Name as stored in the directory, with runs of whitespace collapsed"""
+    return ' '.join((name or '').split())
+
+
+def name_key(name):
+    """Case- and whitespace-insensitive form of a name, or '' for no name"""
+    return display_name(name).lower()
+
+
+def phone_key(contact_number):
+    """Last ten digits of a phone number, so +91 and 0-prefixed forms match"""
+    return re.sub(r'\D', '', contact_number or '')[-10:]
+
+
+# A sale with a name creates or refreshes its devotee. Details are only
+# overwritten by non-empty values, so a quick token sale without an address
+# does not wipe the address given on an earlier receipt.
+UPSERT = f"""
+INSERT INTO devotee (name, name_key, contact_number, phone_key, {', '.join(DETAIL_FIELDS)},
+                     visit_count, first_seen, last_seen)
+VALUES (:name, :name_key, :contact_number, :phone_key, {', '.join(':' + f for f in DETAIL_FIELDS)},
+        :visits, :seen, :seen)
+ON CONFLICT (name_key, phone_key) DO UPDATE SET
+    name = excluded.name,
+    contact_number = COALESCE(NULLIF(excluded.contact_number, ''), contact_number),
+    {', '.join(f"{f} = COALESCE(NULLIF(excluded.{f}, ''), {f})" for f in DETAIL_FIELDS)},
+    visit_count = visit_count + excluded.visit_count,
+    last_seen = MAX(last_seen, excluded.last_seen)
+"""
+
+# Full-text index over names and phone numbers. It is an external-content
+# table kept in step by triggers, so the text is stored only once.
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS devotee_fts USING fts5("
+    "name, phone_key, content='devotee', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER IF NOT EXISTS devotee_fts_insert AFTER INSERT ON devotee BEGIN "
+    "INSERT INTO devotee_fts (rowid, name, phone_key) VALUES (new.id, new.name, new.phone_key); END",
+    "CREATE TRIGGER IF NOT EXISTS devotee_fts_delete AFTER DELETE ON devotee BEGIN "
+    "INSERT INTO devotee_fts (devotee_fts, rowid, name, phone_key) "
+    "VALUES ('delete', old.id, old.name, old.phone_key); END",
+    "CREATE TRIGGER IF NOT EXISTS devotee_fts_update AFTER UPDATE OF name, phone_key ON devotee BEGIN "
+    "INSERT INTO devotee_fts (devotee_fts, rowid, name, phone_key) "
+    "VALUES ('delete', old.id, old.name, old.phone_key); "
+    "INSERT INTO devotee_fts (rowid, name, phone_key) VALUES (new.id, new.name, new.phone_key); END",
+]
+
+# Backfill: one devotee per (name, phone) group, then link every service
+# to its devotee. Like UPSERT, each detail is the latest non-empty value:
+# created_at is a fixed-width 26 character string, so MAX() over
+# created_at || value picks the newest value and substr() strips the stamp.
+def _latest(column):
+    return f"substr(MAX(CASE WHEN {column} != '' THEN created_at || {column} END), 27)"
+
+
+BACKFILL = [
+    "UPDATE service SET devotee_id = NULL WHERE devotee_id IS NOT NULL",
+    "DELETE FROM devotee",
+    f"""
+    INSERT INTO devotee (name, name_key, contact_number, phone_key, {', '.join(DETAIL_FIELDS)},
+                         visit_count, first_seen, last_seen)
+    SELECT {_latest('devotee_display_name(devotee_name)')}, devotee_name_key(devotee_name),
+           {_latest('contact_number')}, devotee_phone_key(contact_number),
+           {', '.join(_latest(field) for field in DETAIL_FIELDS)},
+           COUNT(*), MIN(created_at), MAX(created_at)
+    FROM service
+    WHERE devotee_name_key(devotee_name) != ''
+    GROUP BY devotee_name_key(devotee_name), devotee_phone_key(contact_number)
+    """,
+    """
+    UPDATE service SET devotee_id = (
+        SELECT id FROM devotee
+        WHERE devotee.name_key = devotee_name_key(service.devotee_name)
+          AND devotee.phone_key = devotee_phone_key(service.contact_number)
+    )
+    WHERE devotee_name_key(devotee_name) != ''
+    """,
+]
+
+LOOKUP_COLUMNS = ('id', 'name', 'contact_number') + DETAIL_FIELDS + ('visit_count', 'last_seen')
+
+
+def _service_values(service):
+    values = {field: getattr(service, field) for field in DETAIL_FIELDS}
+    values.update({
+        'name': display_name(service.devotee_name),
+        'name_key': name_key(service.devotee_name),
+        'contact_number': service.contact_number,
+        'phone_key': phone_key(service.contact_number),
+        'seen': service.created_at,
+        'visits': 1,
+    })
+    return values
+
+
+def record_services(session, services):
+    """
+    Create or refresh the devotees of new services and set their devotee_id.
+
+    Runs inside the caller's transaction; services without a name are skipped.
+    """
+    ids = {}
+    now = datetime.utcnow()
+    for service in services:
+        if not name_key(service.devotee_name):
+            continue
+        if service.created_at is None:
+            service.created_at = now
+        values = _service_values(service)
+        session.execute(text(UPSERT), values)
+        key = (values['name_key'], values['phone_key'])
+        if key not in ids:
+            ids[key] = session.execute(
+                text("SELECT id FROM devotee WHERE name_key = :name_key AND phone_key = :phone_key"),
+                values
+            ).scalar()
+        service.devotee_id = ids[key]
+
+
+def record_service(session, service):
+    """Create or refresh the devotee of one new service"""
+    record_services(session, [service])
+
+
+def create_search_index(conn):
+    """
+    Create the FTS5 index and its triggers, if this SQLite build has FTS5.
+
+    Returns:
+        bool: Whether the index exists
+    """
+    try:
+        for statement in FTS_SCHEMA:
+            conn.execute(text(statement))
+    except Exception as e:
+        if 'fts5' not in str(e):
+            raise
+        # Without FTS5, lookups fall back to name and phone prefix scans
+        return False
+    conn.execute(text("INSERT INTO devotee_fts (devotee_fts) VALUES ('rebuild')"))
+    return True
+
+
+def has_search_index(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'devotee_fts'"
+    )).scalar() is not None
+
+
+def backfill(conn):
+    """
+    Rebuild the directory from every historical service row.
+
+    Safe to re-run; duplicates collapse onto one devotee per (name, phone).
+
+    Returns:
+        int: Number of devotees
+    """
+    dbapi_conn = conn.connection
+    dbapi_conn.create_function('devotee_display_name', 1, display_name, deterministic=True)
+    dbapi_conn.create_function('devotee_name_key', 1, name_key, deterministic=True)
+    dbapi_conn.create_function('devotee_phone_key', 1, phone_key, deterministic=True)
+    for statement in BACKFILL:
+        conn.execute(text(statement))
+    return conn.execute(text("SELECT COUNT(*) FROM devotee")).scalar()
+
+
+def _fts_query(query):
+    # Every word must match as a prefix; quoting keeps user input literal
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def lookup(conn, query, limit=DEFAULT_LIMIT):
+    """
+    Find devotees for autocomplete.
+
+    Digits are matched against the start of the phone number; text first
+    against the start of the name, then (with FTS5) against the start of any
+    word of the name, so "rao" also finds "Venkata Rao". Each branch stops
+    after `limit` index entries, so the cost does not grow with the directory.
+
+    Returns:
+        list: Row mappings with LOOKUP_COLUMNS, most frequent devotees first
+              within each branch
+    """
+    query = (query or '').strip()
+    limit = max(1, min(limit, MAX_LIMIT))
+    columns = ', '.join(f"devotee.{column}" for column in LOOKUP_COLUMNS)
+    digits = re.sub(r'[\s+-]', '', query)
+
+    if digits.isdigit():
+        # Drop a +91 country code or a leading trunk 0 as phone_key() does
+        if query.startswith('+'):
+            digits = digits[2:]
+        elif digits.startswith('0'):
+            digits = digits[1:]
+        prefix = phone_key(digits) if len(digits) > 10 else digits
+        branches = [(
+            f"SELECT {columns} FROM devotee WHERE phone_key >= :start AND phone_key < :end "
+            f"ORDER BY phone_key LIMIT :limit",
+            {'start': prefix, 'end': prefix + PREFIX_END}
+        )]
+    else:
+        prefix = name_key(query)
+        if not prefix:
+            return []
+        branches = [(
+            f"SELECT {columns} FROM devotee WHERE name_key >= :start AND name_key < :end "
+            f"ORDER BY name_key LIMIT :limit",
+            {'start': prefix, 'end': prefix + PREFIX_END}
+        )]
+        match = _fts_query(query)
+        if match and has_search_index(conn):
+            branches.append((
+                f"SELECT {columns} FROM devotee_fts JOIN devotee ON devotee.id = devotee_fts.rowid "
+                f"WHERE devotee_fts MATCH :match LIMIT :limit",
+                {'match': f"name : ({match})"}
+            ))
+
+    found = {}
+    for statement, params in branches:
+        rows = conn.execute(text(statement), dict(params, limit=limit)).mappings().all()
+        for row in sorted(rows, key=lambda row: row['visit_count'], reverse=True):
+            found.setdefault(row['id'], row)
+        if len(found) >= limit:
+            break
+    return list(found.values())[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Devotee directory maintenance")
+    parser.add_argument('command', choices=['backfill', 'lookup'])
+    parser.add_argument('query', nargs='?', default='')
+    args = parser.parse_args()
+
+    from app import app, init_db
+    from extensions import db
+    init_db()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if args.command == 'backfill':
+                print(f"{backfill(conn)} devotees in the directory")
+            else:
+                for row in lookup(conn, args.query):
+                    print(f"{row['name']:<30} {row['contact_number'] or '':<15} visits={row['visit_count']}")
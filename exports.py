@@ -0,0 +1,273 @@
+import argparse
+import csv
+import glob
+import importlib.util
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime
+import archive
+from reports import (
+    REPORTS_DIR, SERVICES_IN_RANGE_QUERY, SERVICE_SHEET_COLUMNS, PAYMENT_SHEET_COLUMNS,
+    add_display_names, load_totals, summarize, service_sheet_name, payment_sheet_name,
+    format_service_sheet, format_payment_sheet
+)
+
+# Rows read from SQLite per chunk; memory use is bounded by this, not by the range
+CHUNK_SIZE = 5000
+
+# Excel's hard row limit per sheet (including the header row)
+MAX_SHEET_ROWS = 1048576
+
+FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def export_basename(start, end):
+    """File name stem for a range export, e.g. Temple_Export_2024-04-01_2025-04-01"""
+    return f"Temple_Export_{start.date().isoformat()}_{end.date().isoformat()}"
+
+
+def iter_chunks(conn, start, end, chunk_size=CHUNK_SIZE):
+    """Yield services created in [start, end) as DataFrames of at most chunk_size rows"""
+    import pandas as pd
+    for chunk in pd.read_sql_query(
+        SERVICES_IN_RANGE_QUERY, conn, params=(str(start), str(end)),
+        parse_dates=['created_at', 'valid_till'], chunksize=chunk_size
+    ):
+        yield add_display_names(chunk)
+
+
+def unique_devotees(conn, start, end):
+    return conn.execute(
+        "SELECT COUNT(DISTINCT devotee_name) FROM service WHERE created_at >= ? AND created_at < ?",
+        (str(start), str(end))
+    ).fetchone()[0]
+
+
+def summary_rows(conn, start, end):
+    """Rows of the Summary sheet, in the same layout as create_summary_sheet"""
+    summary_df, service_breakdown, payment_breakdown = summarize(
+        load_totals(conn, start, end), unique_devotees(conn, start, end)
+    )
+    rows = [[f"Report: {start.date().isoformat()} to {end.date().isoformat()}"]]
+    rows.append(list(summary_df.columns))
+    rows.extend(summary_df.astype(object).where(summary_df.notna(), None).values.tolist())
+    rows.extend([[], ["Service Type Breakdown:"], list(service_breakdown.columns)])
+    rows.extend(service_breakdown.values.tolist())
+    rows.extend([[], ["Payment Method Breakdown:"], list(payment_breakdown.columns)])
+    rows.extend(payment_breakdown.values.tolist())
+    return rows
+
+
+def sheet_rows(chunk, columns):
+    """Cell values for a chunk in a sheet layout, with missing values as None"""
+    frame = chunk[list(columns)]
+    return frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+
+
+class _SheetSplitter:
+    """
+    Routes each chunk's rows to per-service and per-payment-method sheets.
+
+    Sheets are opened lazily through `open_sheet(name, header, layout)` and
+    continued as "<name> 2", "<name> 3", ... once `max_rows` is reached.
+    """
+
+    def __init__(self, open_sheet, max_rows=None):
+        self.open_sheet = open_sheet
+        self.max_rows = max_rows
+        self._sheets = {}
+
+    def write(self, chunk):
+        for layout, group_column, columns, sheet_name in (
+            ('service', 'service_name', SERVICE_SHEET_COLUMNS, service_sheet_name),
+            ('payment', 'payment_name', PAYMENT_SHEET_COLUMNS, payment_sheet_name),
+        ):
+            for name, group in chunk.groupby(group_column, sort=False):
+                for row in sheet_rows(group, columns):
+                    self._append(layout, sheet_name(name), columns, row)
+
+    def _append(self, layout, base_name, columns, row):
+        entry = self._sheets.get(base_name)
+        if entry is None or (self.max_rows and entry[1] >= self.max_rows):
+            part = entry[2] + 1 if entry else 1
+            suffix = f" {part}" if part > 1 else ""
+            sheet = self.open_sheet(f"{base_name[:31 - len(suffix)]}{suffix}",
+                                    list(columns.values()), layout)
+            entry = self._sheets[base_name] = [sheet, 1, part]
+        entry[0].append(row)
+        entry[1] += 1
+
+
+def write_xlsx(conn, start, end, output_file, chunk_size=CHUNK_SIZE):
+    """Write a workbook in openpyxl write-only mode; rows go straight to disk"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    summary = workbook.create_sheet('Summary')
+
+    def open_sheet(name, header, layout):
+        worksheet = workbook.create_sheet(name)
+        (format_service_sheet if layout == 'service' else format_payment_sheet)(worksheet)
+        worksheet.append(header)
+        return worksheet
+
+    splitter = _SheetSplitter(open_sheet, MAX_SHEET_ROWS)
+    for chunk in iter_chunks(conn, start, end, chunk_size):
+        splitter.write(chunk)
+
+    for row in summary_rows(conn, start, end):
+        summary.append(row)
+    workbook.save(output_file)
+
+
+def write_csv(conn, start, end, output_file, chunk_size=CHUNK_SIZE):
+    """Write one CSV per sheet layout and bundle them into a zip file"""
+    workdir = tempfile.mkdtemp(prefix='sscm-export-')
+    handles = []
+
+    class CsvSheet:
+        def __init__(self, name):
+            handle = open(os.path.join(workdir, f"{name}.csv"), 'w', newline='', encoding='utf-8')
+            handles.append(handle)
+            self.writer = csv.writer(handle)
+
+        def append(self, row):
+            self.writer.writerow(row)
+
+    def open_sheet(name, header, layout):
+        sheet = CsvSheet(name)
+        sheet.append(header)
+        return sheet
+
+    try:
+        summary = CsvSheet('Summary')
+        splitter = _SheetSplitter(open_sheet)
+        for chunk in iter_chunks(conn, start, end, chunk_size):
+            splitter.write(chunk)
+        for row in summary_rows(conn, start, end):
+            summary.append(row)
+        for handle in handles:
+            handle.close()
+
+        with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+            for handle in handles:
+                bundle.write(handle.name, os.path.basename(handle.name))
+    finally:
+        for handle in handles:
+            handle.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def write_parquet(conn, start, end, output_file, chunk_size=CHUNK_SIZE):
+    """Write every service column to a Parquet file, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet exports need the pyarrow package (pip install pyarrow)")
+
+    text_columns = ['service_name', 'invoice_type', 'invoice_number', 'frequency', 'devotee_name',
+                    'contact_number', 'gothram', 'puja_details', 'address1', 'address2', 'address3',
+                    'address4', 'city', 'district', 'state', 'pincode', 'payment_method',
+                    'payment_name']
+    schema = pa.schema(
+        [('id', pa.int64()), ('service_type', pa.int32())]
+        + [(name, pa.string()) for name in text_columns]
+        + [('amount', pa.float64()), ('created_at', pa.timestamp('us')),
+           ('valid_till', pa.timestamp('us'))]
+    )
+    with pq.ParquetWriter(output_file, schema, compression='snappy') as writer:
+        for chunk in iter_chunks(conn, start, end, chunk_size):
+            writer.write_table(pa.Table.from_pandas(chunk[schema.names], schema=schema,
+                                                    preserve_index=False))
+
+
+WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+EXTENSIONS = {'xlsx': 'xlsx', 'csv': 'zip', 'parquet': 'parquet'}
+
+
+def check_format(fmt):
+    """Raise ValueError unless exports in this format can be written here"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Export format must be one of {', '.join(FORMATS)}")
+    # pyarrow is optional; find out before a job is queued, not when it runs
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError("Parquet exports need the pyarrow package (pip install pyarrow)")
+
+
+def export_files():
+    """Finished exports in reports/"""
+    return [path for path in glob.glob(os.path.join(REPORTS_DIR, "Temple_Export_*"))
+            if '.partial.' not in os.path.basename(path)]
+
+
+def evict(max_bytes, keep=None):
+    """Delete the oldest exports in reports/ until under max_bytes"""
+    files = [(os.path.getmtime(path), os.path.getsize(path), path) for path in export_files()]
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path != keep:
+            os.remove(path)
+            total -= size
+
+
+def export_range(start, end, fmt='xlsx', output_file=None, db_path=None,
+                 chunk_size=CHUNK_SIZE, max_bytes=None):
+    """
+    Export services created in [start, end) with a fixed memory ceiling.
+
+    The file is written under a temporary name and renamed into place, so a
+    download never sees a half-written export.
+
+    Args:
+        start (datetime): First instant included
+        end (datetime): First instant excluded
+        fmt (str): 'xlsx' (write-only workbook), 'csv' (zip of per-sheet CSVs) or 'parquet'
+        output_file (str): Defaults to reports/Temple_Export_<start>_<end>.<ext>
+        db_path (str): Database file (defaults to the configured database)
+        max_bytes (int): Delete the oldest exports in reports/ above this size
+
+    Returns:
+        str: Path to the exported file
+    """
+    check_format(fmt)
+    if end <= start:
+        raise ValueError("Export range end must be after its start")
+
+    if output_file is None:
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        output_file = os.path.join(REPORTS_DIR, f"{export_basename(start, end)}.{EXTENSIONS[fmt]}")
+    root, ext = os.path.splitext(output_file)
+    partial = f"{root}.partial{ext}"
+
+    # Services of archived years are read from their archives
+    conn = archive.connect_range(start, end, db_path)
+    try:
+        WRITERS[fmt](conn, start, end, partial, chunk_size)
+        os.replace(partial, output_file)
+    finally:
+        conn.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+    if max_bytes:
+        evict(max_bytes, keep=output_file)
+    return output_file
+
+
+def _day(value):
+    return datetime.combine(date.fromisoformat(value), datetime.min.time())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export services for a date range")
+    parser.add_argument('--start', type=_day, required=True, help="First day (YYYY-MM-DD)")
+    parser.add_argument('--end', type=_day, required=True, help="Day after the last day (YYYY-MM-DD)")
+    parser.add_argument('--format', choices=FORMATS, default='xlsx')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    print(f"Export written: {export_range(args.start, args.end, args.format, args.output)}")
@@ -1,5 +1,13 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy
 from flask_login import LoginManager
+import storage
+import metrics
+
+class SQLAlchemy(_SQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        # Every pooled connection gets the PRAGMAs configured in storage.py,
+        # and every statement is timed for /metrics
+        return metrics.install(storage.install(super().create_engine(sa_url, engine_opts)))
 
 db = SQLAlchemy()
 login_manager = LoginManager()
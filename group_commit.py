@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from extensions import db
+import metrics
+
+# Group commit for the sale path. With synchronous=FULL every COMMIT waits
+# for an fsync, and on the Pi's SD card that wait is most of a sale's
+# latency. Requests hand their sale to submit() instead of committing it
+# themselves; one writer thread takes whatever sales arrive within
+# `batch_wait` seconds (at most `batch_size`), writes them in a single
+# transaction and answers every caller once that transaction is committed.
+# A busy counter then pays for one fsync per batch rather than one per sale,
+# while a sale on an idle counter waits at most `batch_wait` longer.
+#
+# Invoice numbers are allocated by the writer inside the batch's
+# transaction, in arrival order, so they stay gapless: a batch that fails
+# to commit takes its numbers back with it. Its sales are then prepared
+# again from their arguments and retried one transaction each, so one bad
+# sale only fails its own request. Numbers from
+# reserved blocks (INVOICE_BLOCK_SIZE) are taken in prepare instead, before
+# the batch's transaction takes the write lock the reservation needs.
+
+
+class WriteQueueFull(Exception):
+    """Raised when too many sales are already waiting for the writer"""
+
+
+class WriteTimeout(Exception):
+    """Raised when a sale's batch was not committed in time; it may still be"""
+
+
+class PendingWrite:
+    """One sale waiting for its batch to be committed"""
+
+    def __init__(self, args):
+        self.args = args
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+
+    def result(self, timeout=None):
+        """The committed value; re-raises the error if this sale failed"""
+        if not self._done.wait(timeout):
+            raise WriteTimeout("The sale was not confirmed in time; look it up before selling it again")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def finish(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self._done.set()
+
+
+class GroupCommitter:
+    """
+    Single writer that commits concurrent sales in batches.
+
+    Each submitted sale goes through two callables in the writer thread,
+    inside the app context: prepare(*args) checks and builds it before the
+    batch's transaction writes anything (an error fails that sale alone), then
+    write(prepared) adds it to the session and returns what the caller
+    gets back. That value is handed to another thread after the session is
+    gone, so write should return plain data rather than ORM objects.
+    """
+
+    def __init__(self, app, prepare, write, batch_size=32, batch_wait=0.005, max_pending=500):
+        self.app = app
+        self.prepare = prepare
+        self.write = write
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        """
+        Queue a sale for the next batch.
+
+        Returns:
+            PendingWrite: Call result() to wait for the commit
+        """
+        if self._queue.qsize() >= self.max_pending:
+            raise WriteQueueFull("Too many sales are waiting to be saved")
+        pending = PendingWrite(args)
+        self._queue.put(pending)
+        return pending
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=None):
+        """Commit what is queued, then stop the writer"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        pending = self._queue.get()
+        if pending is None:
+            return None
+        batch = [pending]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                # Commit this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self.app.app_context():
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    # Never leave a caller waiting
+                    for pending in batch:
+                        if not pending._done.is_set():
+                            pending.finish(error=e)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        ready = []
+        for pending in batch:
+            try:
+                ready.append((pending, self.prepare(*pending.args)))
+            except Exception as e:
+                pending.finish(error=e)
+        if not ready:
+            return
+
+        try:
+            values = [self.write(prepared) for _, prepared in ready]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if len(ready) > 1:
+                # Find the sale at fault; the others go through on their own.
+                # The rollback detached the prepared objects, so start over
+                for pending, _ in ready:
+                    self._commit_one(pending)
+                return
+            raise
+        for (pending, _), value in zip(ready, values):
+            pending.finish(value)
+        metrics.GROUP_COMMIT_BATCH.observe(len(ready))
+        metrics.GROUP_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    def _commit_one(self, pending):
+        try:
+            value = self.write(self.prepare(*pending.args))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            pending.finish(error=e)
+        else:
+            pending.finish(value)
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs are kept this long so clients can still poll and download
+JOB_RETENTION_SECONDS = 3600
+
+
+class JobQueueFull(Exception):
+    """Raised when too many report jobs are already waiting"""
+
+
+class Job:
+    """State of one background job, as reported by the status endpoint"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.0
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def update(self, progress, stage=None):
+        """Progress callback handed to the work function"""
+        self.progress = progress
+        self.stage = stage
+        # Give request threads a chance at the GIL between report stages
+        time.sleep(0)
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'progress': round(self.progress, 2),
+            'stage': self.stage,
+            'error': self.error
+        }
+
+
+def _lower_thread_priority():
+    # Linux lets a single thread be niced via its native id, which keeps
+    # report work behind request threads on the Pi; elsewhere this is a no-op
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+class JobQueue:
+    """
+    In-process background job queue.
+
+    Jobs with the same key that are still queued or running are coalesced
+    into one, at most `workers` jobs run at once and at most `max_pending`
+    may wait, so a burst of report clicks cannot pile up behind the counter.
+    """
+
+    def __init__(self, app, workers=1, max_pending=8):
+        self.app = app
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='report-job',
+            initializer=_lower_thread_priority
+        )
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, work):
+        """
+        Queue work(job) unless an identical job is already in flight.
+
+        Returns:
+            Job: The new or the coalesced job
+        """
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job:
+                return job
+            pending = sum(1 for active in self._active.values() if active.status == 'queued')
+            if pending >= self.max_pending:
+                raise JobQueueFull("Too many report jobs are waiting, please try again shortly")
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_count(self):
+        """Jobs queued or running"""
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, work):
+        job.status = 'running'
+        try:
+            with self.app.app_context():
+                job.result = work(job)
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active.pop(job.key, None)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,182 @@
+import base64
+import binascii
+import sqlite3
+from datetime import datetime
+from sqlalchemy import text
+import archive
+import storage
+
+# Past invoices, filtered and paged newest first, for looking up a sale,
+# reprinting its receipt or reviewing a day at the counter.
+#
+# Pages are keyset paginated on (created_at, id): the cursor is the last row
+# of the previous page and the next page starts right below it in the index,
+# so page 1000 costs what page 1 does (OFFSET would step over every earlier
+# row again). ix_service_listing is ordered exactly as pages are, on
+# (created_at, id), and also holds the columns of the default fields, so the
+# default listing is answered from the index without sorting or touching the
+# table; other fields are only read when asked for.
+#
+# Closed years live in their archive files (archive.py). A page is read from
+# the hot database first and continues into the archives, newest year
+# first, only when it runs out there; the cursor says which year it is in.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Response field: column
+FIELDS = {
+    'id': 'id',
+    'createdAt': 'created_at',
+    'invoiceNumber': 'invoice_number',
+    'invoiceType': 'invoice_type',
+    'serviceType': 'service_type',
+    'paymentMethod': 'payment_method',
+    'amount': 'amount',
+    'frequency': 'frequency',
+    'validTill': 'valid_till',
+    'devoteeId': 'devotee_id',
+    'devoteeName': 'devotee_name',
+    'devoteeContactNum': 'contact_number',
+    'gothram': 'gothram',
+    'pujaDetails': 'puja_details',
+    'address1': 'address1',
+    'address2': 'address2',
+    'address3': 'address3',
+    'address4': 'address4',
+    'city': 'city',
+    'district': 'district',
+    'state': 'state',
+    'pincode': 'pincode',
+}
+
+# Everything here is in ix_service_listing
+DEFAULT_FIELDS = ('createdAt', 'invoiceNumber', 'invoiceType', 'serviceType', 'paymentMethod', 'amount')
+
+# Filter: (column, how the request value is converted)
+FILTERS = {
+    'invoiceNumber': ('invoice_number', str),
+    'serviceType': ('service_type', int),
+    'paymentMethod': ('payment_method', str),
+    'invoiceType': ('invoice_type', str),
+    'devoteeId': ('devotee_id', int),
+    'devoteeContactNum': ('contact_number', str),
+}
+
+
+def encode_cursor(created_at, service_id):
+    """Opaque cursor for the row a page ended on"""
+    return base64.urlsafe_b64encode(f"{created_at}|{service_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, service_id = raw.rsplit('|', 1)
+        datetime.fromisoformat(created_at)
+        return created_at, int(service_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields):
+    """Columns for a comma separated list of response fields (DEFAULT_FIELDS when empty)"""
+    names = [name.strip() for name in fields.split(',') if name.strip()] if fields else DEFAULT_FIELDS
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def build_query(filters, fields, start=None, end=None, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    SQL and named parameters for one page of a single database file.
+
+    Args:
+        filters (dict): {filter name in FILTERS: value}
+        fields (list): Response field names
+        start, end (datetime): created_at range, end exclusive
+        cursor (tuple): (created_at, id) of the previous page's last row
+        limit (int): Rows to return
+
+    Returns:
+        tuple: (sql, params); the first two result columns are created_at and id
+    """
+    columns = ['created_at', 'id'] + [FIELDS[name] for name in fields
+                                      if FIELDS[name] not in ('created_at', 'id')]
+    where, params = [], {'limit': limit}
+    for name, value in filters.items():
+        column, convert = FILTERS[name]
+        where.append(f"{column} = :{column}")
+        params[column] = convert(value)
+    if start:
+        where.append("created_at >= :start")
+        params['start'] = archive._stamp(start)
+    if cursor:
+        where.append("(created_at, id) < (:cursor_at, :cursor_id)")
+        params['cursor_at'], params['cursor_id'] = cursor
+    if end:
+        where.append("created_at < :end")
+        params['end'] = archive._stamp(end)
+    sql = (f"SELECT {', '.join(columns)} FROM service"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + " ORDER BY created_at DESC, id DESC LIMIT :limit")
+    return sql, params
+
+
+def _rows(conn, sql, params):
+    if isinstance(conn, sqlite3.Connection):
+        return conn.execute(sql, params).fetchall()
+    return conn.execute(text(sql), params).fetchall()
+
+
+def page(session, filters, fields, start=None, end=None, cursor=None, limit=DEFAULT_LIMIT, db_path=None):
+    """
+    One page of services, newest first, from the hot database and then the
+    archives of closed years (see archive.py) for as far as the page needs.
+
+    An archive is only opened once the hot database has run out of rows for
+    the page, and the cursor skips the ones above it, so a page deep in
+    history reads the one or two files it falls in.
+
+    Args:
+        session: SQLAlchemy session or connection of the hot database
+        filters, fields, start, end, cursor: See build_query()
+        limit (int): Rows per page
+
+    Returns:
+        tuple: (services as dicts of the requested fields, cursor of the next page or None)
+    """
+    archived = session.execute(text(archive.LIST_ARCHIVES)).fetchall()
+    # Older services are in the archives; anything the hot database still
+    # holds from before this is an interrupted archive run's leftover
+    hot_from = archive.year_bounds(archived[-1][0])[1] if archived else None
+    hot_start = max(start, hot_from) if start and hot_from else start or hot_from
+
+    rows = []
+    if not hot_from or ((not end or end > hot_from) and (not cursor or cursor[0] >= archive._stamp(hot_from))):
+        sql, params = build_query(filters, fields, hot_start, end, cursor, limit + 1)
+        rows = _rows(session, sql, params)
+
+    for year, file_name in reversed(archived):
+        year_start, year_end = archive.year_bounds(year)
+        if len(rows) > limit or (start and year_end <= start):
+            break
+        after = (rows[-1][0], rows[-1][1]) if rows else cursor
+        if (end and year_start >= end) or (after and after[0] < archive._stamp(year_start)):
+            continue
+        sql, params = build_query(filters, fields, start, end, after, limit + 1 - len(rows))
+        conn = storage.connect_readonly(archive.archive_path(file_name, db_path))
+        try:
+            rows.extend(_rows(conn, sql, params))
+        finally:
+            conn.close()
+
+    next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+    names = ['createdAt', 'id'] + [name for name in fields if FIELDS[name] not in ('created_at', 'id')]
+    services = []
+    for row in rows[:limit]:
+        values = dict(zip(names, row))
+        services.append({name: values[name] for name in fields})
+    return services, next_cursor
@@ -1,30 +1,92 @@
+import startup
+import threading
+import time
+import urllib.request
 from kivymd.app import MDApp
 from kivy.core.window import Window
 from kivy.utils import platform
 from kivymd.uix.screen import MDScreen
+from kivymd.uix.label import MDLabel
 from kivymd.uix.webview import MDWebView
 from kivy.clock import Clock
 
+startup.mark('kivy imports')
+
+SERVER_URL = "http://localhost:5000"
+READY_URL = f"{SERVER_URL}/ready"
+# How long to wait for the server before showing an error
+READY_TIMEOUT = 60
+
 class MainScreen(MDScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.webview = MDWebView(url="http://localhost:5000")
+        # Shown until the server answers the readiness probe
+        self.status = MDLabel(text="Starting Temple POS...", halign="center")
+        self.add_widget(self.status)
+
+    def show_app(self):
+        self.remove_widget(self.status)
+        self.webview = MDWebView(url=SERVER_URL)
         self.add_widget(self.webview)
 
+    def show_error(self, message):
+        self.status.text = message
+
+# Set when the app closes so queued receipts are printed before it exits
+server_stop = threading.Event()
+
+def run_server():
+    """Import the app and serve it with waitress; runs in a background thread"""
+    import serve
+    from app import app, init_db, draining, shutdown
+    startup.mark('app import')
+    init_db()
+    startup.mark('database ready')
+    options = serve.settings(host='localhost', port=5000)
+    serve.run(app, options['HOST'], options['PORT'], options['THREADS'],
+              options['CONNECTION_LIMIT'], options['SHUTDOWN_TIMEOUT'],
+              stop=server_stop, draining=draining, on_shutdown=shutdown)
+
+def wait_until_ready(timeout=READY_TIMEOUT, interval=0.1):
+    """Poll the readiness probe until it answers 200 or the timeout passes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(READY_URL, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            # Not listening yet, or answering 503 while migrations run
+            pass
+        time.sleep(interval)
+    return False
+
 class TemplePOSApp(MDApp):
     def build(self):
         Window.softinput_mode = "below_target"
         return MainScreen()
 
     def on_start(self):
+        startup.mark('window shown')
         # Start Flask server
-        from app import app
-        import threading
-        def run_flask():
-            app.run(host='localhost', port=5000)
-        threading.Thread(target=run_flask, daemon=True).start()
-        # Wait for server to start
-        Clock.schedule_once(lambda dt: None, 2)
+        threading.Thread(target=run_server, daemon=True).start()
+        # Load the WebView only once the server answers
+        threading.Thread(target=self.wait_for_server, daemon=True).start()
+
+    def wait_for_server(self):
+        if wait_until_ready():
+            Clock.schedule_once(lambda dt: self.server_ready())
+        else:
+            Clock.schedule_once(lambda dt: self.root.show_error(
+                "The server did not start. Please restart the app."))
+
+    def on_stop(self):
+        server_stop.set()
+
+    def server_ready(self):
+        startup.mark('server ready')
+        self.root.show_app()
+        startup.report()
 
 if __name__ == '__main__':
-    TemplePOSApp().run()
\ No newline at end of file
+    TemplePOSApp().run()
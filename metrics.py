@@ -0,0 +1,336 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# In-process instrumentation, exposed in the Prometheus text format at
+# /metrics. Everything is aggregated into fixed-bucket histograms and
+# counters as it happens (one bisect and a short lock per observation), so
+# it is cheap enough to leave on at the counter. Label values are route
+# endpoints, SQL verbs and report stages, never paths or parameters, so the
+# number of series stays small.
+#
+# Per request the app records how long it spent in SQL, in COMMIT, loading
+# the user, allocating the invoice number and rendering templates. These
+# phases overlap (allocation and commit time is also SQL time) and are meant
+# to be read side by side against the request's total duration.
+
+DEFAULTS = {
+    # Statements at least this slow are logged to the slow query log
+    'SLOW_QUERY_MS': 100.0,
+    # File for the slow query log (rotated at 1 MB); empty logs through the app logger
+    'SLOW_QUERY_LOG': '',
+}
+
+settings = dict(DEFAULTS)
+
+slow_query_log = logging.getLogger('temple.slow_queries')
+
+# Seconds; request and query latencies on a Pi range from sub-millisecond
+# lookups to multi-second report downloads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+REPORT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Histogram:
+    """Bucketed distribution per label combination, with sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labels, labels, [('le', le)]), cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labels, labels), series[-1]
+            yield f"{self.name}_count", _format_labels(self.labels, labels), cumulative
+
+
+REQUEST_SECONDS = Histogram(
+    'temple_http_request_duration_seconds', "Time to handle a request, by route",
+    ('endpoint', 'method', 'status')
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    'temple_http_request_phase_seconds',
+    "Time a request spent in SQL, commit, user loading, invoice numbering and rendering",
+    ('endpoint', 'phase')
+)
+REQUEST_QUERIES = Histogram(
+    'temple_http_request_sql_queries', "SQL statements executed per request",
+    ('endpoint',), QUERY_COUNT_BUCKETS
+)
+QUERY_SECONDS = Histogram(
+    'temple_sql_query_duration_seconds', "Time to execute one SQL statement, by verb",
+    ('statement',)
+)
+SLOW_QUERIES = Counter(
+    'temple_sql_slow_queries_total', "Statements slower than SLOW_QUERY_MS, by verb",
+    ('statement',)
+)
+REPORT_STAGE_SECONDS = Histogram(
+    'temple_report_stage_duration_seconds', "Time spent in each stage of a report",
+    ('report', 'stage'), REPORT_BUCKETS
+)
+
+PRINTED_RECEIPTS = Counter(
+    'temple_print_receipts_total', "Receipts the print spooler printed or gave up on",
+    ('format', 'status')
+)
+PRINT_BATCH_SECONDS = Histogram(
+    'temple_print_batch_duration_seconds', "Time to render and write one batch of receipts, retries included",
+    ('format',)
+)
+
+GROUP_COMMIT_BATCH = Histogram(
+    'temple_group_commit_batch_sales', "Sales committed together in one group commit",
+    (), BATCH_SIZE_BUCKETS
+)
+GROUP_COMMIT_SECONDS = Histogram(
+    'temple_group_commit_duration_seconds', "Time to write and commit one batch of sales"
+)
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_PHASE_SECONDS, REQUEST_QUERIES,
+            QUERY_SECONDS, SLOW_QUERIES, REPORT_STAGE_SECONDS,
+            PRINTED_RECEIPTS, PRINT_BATCH_SECONDS,
+            GROUP_COMMIT_BATCH, GROUP_COMMIT_SECONDS]
+
+
+def render(extra=()):
+    """
+    Every registered metric in the Prometheus text exposition format.
+
+    Args:
+        extra: (name, help, kind, value) tuples for gauges read at scrape time
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    for name, documentation, kind, value in extra:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _request_state():
+    """Phase totals of the current request, or None outside a request"""
+    return g.get('_metrics') if has_request_context() else None
+
+
+def _add_phase(phase, seconds):
+    state = _request_state()
+    if state is not None:
+        state[phase] = state.get(phase, 0.0) + seconds
+
+
+class phase:
+    """Time a block (or, as a decorator, a function) as a phase of the current request"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add_phase(self.name, time.perf_counter() - self._started)
+
+    def __call__(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _add_phase(self.name, time.perf_counter() - started)
+        return timed
+
+
+class StageTimer:
+    """
+    Times the stages of a report from its progress(fraction, stage) calls.
+
+    Wraps the report's progress callback: each call closes the stage before
+    it, and finish() closes the last one.
+    """
+
+    def __init__(self, report, progress=None):
+        self.report = report
+        self.progress = progress
+        self.stage = None
+        self._started = None
+
+    def __call__(self, fraction, stage):
+        self._lap()
+        self.stage, self._started = stage, time.perf_counter()
+        if self.progress:
+            self.progress(fraction, stage)
+
+    def finish(self):
+        self._lap()
+        self.stage = None
+
+    def _lap(self):
+        if self.stage is not None:
+            REPORT_STAGE_SECONDS.observe(time.perf_counter() - self._started, self.report, self.stage)
+
+
+def _statement_verb(statement):
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return verb if verb in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA') else 'OTHER'
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    verb = _statement_verb(statement)
+    QUERY_SECONDS.observe(elapsed, verb)
+
+    state = _request_state()
+    if state is not None:
+        state['sql'] = state.get('sql', 0.0) + elapsed
+        state['queries'] = state.get('queries', 0) + 1
+
+    if elapsed * 1000 >= settings['SLOW_QUERY_MS']:
+        SLOW_QUERIES.inc(verb)
+        # Statements only; parameters carry devotee names and phone numbers
+        slow_query_log.warning(
+            "%.1f ms [%s] %s", elapsed * 1000,
+            request.endpoint if has_request_context() else 'background',
+            ' '.join(statement.split())[:500]
+        )
+
+
+def install(engine):
+    """Time every statement and COMMIT the engine runs"""
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    event.listen(engine, 'after_cursor_execute', _after_execute)
+
+    # COMMIT goes straight to the DB-API connection, bypassing the cursor
+    # events; with synchronous=FULL it is where the fsync happens
+    do_commit = engine.dialect.do_commit
+
+    def timed_commit(dbapi_connection):
+        started = time.perf_counter()
+        try:
+            do_commit(dbapi_connection)
+        finally:
+            elapsed = time.perf_counter() - started
+            QUERY_SECONDS.observe(elapsed, 'COMMIT')
+            _add_phase('commit', elapsed)
+
+    engine.dialect.do_commit = timed_commit
+    return engine
+
+
+def _start_request():
+    g._metrics = {}
+    g._metrics_started = time.perf_counter()
+
+
+def _finish_request(response):
+    state = g.get('_metrics')
+    if state is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - g._metrics_started,
+                            endpoint, request.method, str(response.status_code))
+    REQUEST_QUERIES.observe(state.pop('queries', 0), endpoint)
+    for name, seconds in state.items():
+        REQUEST_PHASE_SECONDS.observe(seconds, endpoint, name)
+    return response
+
+
+def init_app(app):
+    """
+    Record per-route latency and per-request SQL for the app.
+
+    Settings are read from app.config, then TEMPLE_* environment variables,
+    then DEFAULTS, as in storage.configure().
+    """
+    for key, default in DEFAULTS.items():
+        value = app.config.get(key, os.environ.get(f"TEMPLE_{key}", default))
+        settings[key] = type(default)(value)
+        app.config[key] = settings[key]
+
+    if settings['SLOW_QUERY_LOG'] and not slow_query_log.handlers:
+        handler = RotatingFileHandler(settings['SLOW_QUERY_LOG'], maxBytes=1024 * 1024, backupCount=3)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_log.addHandler(handler)
+        slow_query_log.propagate = False
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
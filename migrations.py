@@ -0,0 +1,228 @@
+import sys
+from datetime import datetime
+from sqlalchemy import text
+import rollups
+import devotees
+import roster
+import catalog
+import sync
+import archive
+
+# Ordered schema migrations. db.create_all() only creates missing tables, so
+# anything that changes an existing table (indexes, columns, backfills) goes
+# here. Each migration gets a version number, a description and the steps to
+# run: SQL strings, or callables taking the connection. Steps must be safe to
+# run against a freshly created schema too, hence IF NOT EXISTS everywhere.
+MIGRATIONS = [
+    (1, "Add report and lookup indexes on service", [
+        "CREATE INDEX IF NOT EXISTS ix_service_created_at ON service (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_service_type_created_at ON service (service_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_service_payment_created_at ON service (payment_method, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_service_valid_till ON service (valid_till)",
+        "CREATE INDEX IF NOT EXISTS ix_service_contact_number ON service (contact_number)",
+        "ANALYZE service",
+    ]),
+    (2, "Backfill daily rollups from existing services", [
+        rollups.rebuild,
+    ]),
+    (3, "Add the devotee directory and link services to it", [
+        lambda conn: add_column(conn, 'service', 'devotee_id', 'INTEGER REFERENCES devotee (id)'),
+        "CREATE INDEX IF NOT EXISTS ix_service_devotee_id ON service (devotee_id)",
+        devotees.create_search_index,
+        devotees.backfill,
+        "ANALYZE devotee",
+    ]),
+    (4, "Add the subscription window index and build the puja roster", [
+        "CREATE INDEX IF NOT EXISTS ix_service_subscription_window ON service (created_at, valid_till) "
+        "WHERE frequency IN ('WEEKLY', 'MONTHLY')",
+        lambda conn: roster.ensure(conn, roster.today()),
+    ]),
+    (5, "Move the service catalog and prices into the database", [
+        catalog.seed,
+    ]),
+    (6, "Log inserted services for sync to a central node", [
+        sync.BACKFILL_LOG,
+        sync.LOG_TRIGGER,
+    ]),
+    (7, "Add a covering index ordered like service listing pages", [
+        "CREATE INDEX IF NOT EXISTS ix_service_listing ON service "
+        "(created_at, id, service_type, payment_method, invoice_type, amount, invoice_number)",
+        # A prefix of ix_service_listing, so only extra work on every insert
+        "DROP INDEX IF EXISTS ix_service_created_at",
+        "ANALYZE service",
+    ]),
+    (8, "Rebuild the puja rosters on the temple's local days", [
+        roster.rebuild_built,
+    ]),
+    (9, "Rebuild the daily rollups on the temple's local days", [
+        rollups.rebuild,
+    ]),
+    (10, "Never issue the id of an archived service again", [
+        lambda conn: service_autoincrement(conn),
+        archive.reserve_archived_ids,
+        "ANALYZE service",
+    ]),
+]
+
+# Representative queries used by the app, for EXPLAIN QUERY PLAN reporting
+EXPLAINED_QUERIES = {
+    'monthly report': (
+        "SELECT * FROM service WHERE created_at >= :start AND created_at < :end"
+    ),
+    'service type totals': (
+        "SELECT COUNT(*), SUM(amount) FROM service "
+        "WHERE service_type = :service_type AND created_at >= :start AND created_at < :end"
+    ),
+    'payment method totals': (
+        "SELECT COUNT(*), SUM(amount) FROM service "
+        "WHERE payment_method = :payment_method AND created_at >= :start AND created_at < :end"
+    ),
+    'active subscriptions': (
+        "SELECT * FROM service WHERE valid_till >= :start"
+    ),
+    'devotee by phone': (
+        "SELECT * FROM service WHERE contact_number = :contact_number"
+    ),
+    'invoice lookup': (
+        "SELECT * FROM service WHERE invoice_number = :invoice_number"
+    ),
+    'puja roster for a day': roster.ACTIVE_ON_DAY,
+    'service listing page': (
+        "SELECT created_at, id, invoice_number, invoice_type, service_type, payment_method, amount "
+        "FROM service WHERE (created_at, id) < (:cursor_at, :cursor_id) "
+        "ORDER BY created_at DESC, id DESC LIMIT 51"
+    ),
+    'devotee by name prefix': (
+        "SELECT * FROM devotee WHERE name_key >= :name_start AND name_key < :name_end "
+        "ORDER BY name_key LIMIT 8"
+    ),
+    'devotee by phone prefix': (
+        "SELECT * FROM devotee WHERE phone_key >= :phone_start AND phone_key < :phone_end "
+        "ORDER BY phone_key LIMIT 8"
+    ),
+}
+
+EXPLAIN_PARAMS = {
+    'start': '2025-01-01 00:00:00',
+    'end': '2025-02-01 00:00:00',
+    'service_type': 1,
+    'payment_method': 'CASH',
+    'contact_number': '9000000000',
+    'invoice_number': 'TA0001',
+    'cursor_at': '2025-01-15 10:30:00.000000',
+    'cursor_id': 1000,
+    'day_end': '2025-01-16 00:00:00',
+    'window_start': '2024-12-17 00:00:00',
+    'name_start': 'ram',
+    'name_end': 'ram\U0010ffff',
+    'phone_start': '98',
+    'phone_end': '98\U0010ffff',
+}
+
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ADD COLUMN, skipped when create_all() already made the column"""
+    existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+def service_autoincrement(conn):
+    """
+    Rebuild the service table as the model declares it, with AUTOINCREMENT, keeping rows and ids.
+
+    SQLite cannot add AUTOINCREMENT to an existing table; without it the next
+    id is one past the largest id still in the table, which archiving
+    empties. Skipped when create_all() already made the table this way.
+    """
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from models import Service
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'service'")).scalar()
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    table = Service.__table__
+    existing = {row[1] for row in conn.execute(text("PRAGMA table_info(service)"))}
+    columns = ', '.join(column.name for column in table.columns if column.name in existing)
+
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    conn.execute(text(ddl.replace("CREATE TABLE service ", "CREATE TABLE service_rebuilt ", 1)))
+    conn.execute(text(f"INSERT INTO service_rebuilt ({columns}) SELECT {columns} FROM service"))
+    # Takes its indexes and the sync log trigger along; both are created again
+    conn.execute(text("DROP TABLE service"))
+    conn.execute(text("ALTER TABLE service_rebuilt RENAME TO service"))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    conn.execute(text(sync.LOG_TRIGGER))
+
+
+def current_version(conn):
+    """Return the highest applied schema version (0 for a new database)"""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def run_migrations(engine):
+    """
+    Apply any pending migrations in order.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so an interrupted upgrade resumes where it stopped.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {'version': number, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+        applied.append(number)
+    return applied
+
+
+def explain_queries(engine):
+    """
+    Run EXPLAIN QUERY PLAN over the app's main queries.
+
+    Returns:
+        dict: Query name -> list of plan detail lines
+    """
+    plans = {}
+    with engine.connect() as conn:
+        for name, query in EXPLAINED_QUERIES.items():
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), EXPLAIN_PARAMS)
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+if __name__ == "__main__":
+    from app import app, init_db
+    from extensions import db
+
+    # init_db() creates tables and applies pending migrations
+    init_db()
+    with app.app_context():
+        with db.engine.connect() as conn:
+            print(f"Schema version: {current_version(conn)}")
+        if '--explain' in sys.argv:
+            for name, details in explain_queries(db.engine).items():
+                print(f"{name}:")
+                for detail in details:
+                    print(f"    {detail}")
@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
 from enum import Enum
+from flask import current_app
 from extensions import db
+from sequences import next_invoice_number
+import catalog
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -39,6 +42,8 @@ class Frequency(Enum):
     WEEKLY = "WEEKLY"
     MONTHLY = "MONTHLY"
 
+# Prices the service catalog is seeded with (migration 5); after that the
+# service_catalog and service_price tables are authoritative, see catalog.py
 SERVICE_PRICES = {
     1: 16,     # ABHISHEKAM
     2: 11,     # ASHTOTHRAM
@@ -73,7 +78,145 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class InvoiceSequence(db.Model):
+    """Per-prefix invoice counter; next_value is the next ordinal to issue"""
+    __tablename__ = 'invoice_sequence'
+
+    prefix = db.Column(db.String(4), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyRollup(db.Model):
+    """Per-day count and amount of services for one key of one dimension"""
+    __tablename__ = 'daily_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)  # see rollups.DIMENSIONS
+    key = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class Devotee(db.Model):
+    """A regular devotee, deduplicated by name and phone (see devotees.py)"""
+    __tablename__ = 'devotee'
+    __table_args__ = (
+        db.UniqueConstraint('name_key', 'phone_key', name='ux_devotee_name_phone'),
+        db.Index('ix_devotee_phone_key', 'phone_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    name_key = db.Column(db.String(100), nullable=False)  # devotees.name_key()
+    contact_number = db.Column(db.String(15))
+    phone_key = db.Column(db.String(10), nullable=False, default='')  # devotees.phone_key()
+    gothram = db.Column(db.String(50))
+    address1 = db.Column(db.String(100))
+    address2 = db.Column(db.String(100))
+    address3 = db.Column(db.String(100))
+    address4 = db.Column(db.String(100))
+    city = db.Column(db.String(50))
+    district = db.Column(db.String(50))
+    state = db.Column(db.String(50))
+    pincode = db.Column(db.String(10))
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+
+class ServiceCatalogEntry(db.Model):
+    """A service the counter sells; service_type matches Service.service_type"""
+    __tablename__ = 'service_catalog'
+
+    service_type = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # e.g. SAI_SATHYA_VRATHAM
+    display_name = db.Column(db.String(100), nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+
+class ServicePrice(db.Model):
+    """Price of a service from effective_from until the service's next price"""
+    __tablename__ = 'service_price'
+    __table_args__ = (
+        db.UniqueConstraint('service_type', 'effective_from', name='ux_service_price_effective'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    service_type = db.Column(db.Integer, db.ForeignKey('service_catalog.service_type'), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False)
+
+class CatalogVersion(db.Model):
+    """Single row bumped by every catalog change, so caches know to reload"""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RosterDay(db.Model):
+    """A day whose puja roster has been precomputed into puja_roster"""
+    __tablename__ = 'roster_day'
+
+    day = db.Column(db.Date, primary_key=True)
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class PujaRoster(db.Model):
+    """One subscription puja due on one day (see roster.py)"""
+    __tablename__ = 'puja_roster'
+
+    day = db.Column(db.Date, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('service.id'), primary_key=True)
+
+class ServiceArchive(db.Model):
+    """A closed year whose services were moved into its own file (see archive.py)"""
+    __tablename__ = 'service_archive'
+
+    year = db.Column(db.Integer, primary_key=True)
+    file_name = db.Column(db.String(100), nullable=False)  # in storage.archive_dir()
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SyncLog(db.Model):
+    """Append-only log of inserted services, filled by a trigger (see sync.py)"""
+    __tablename__ = 'sync_log'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # AUTOINCREMENT: a sequence number is never reused, even after a delete
+    seq = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, nullable=False)
+
+class SyncState(db.Model):
+    """How far this node's change log has been pushed to a central node"""
+    __tablename__ = 'sync_state'
+
+    target = db.Column(db.String(200), primary_key=True)  # central node URL
+    pushed_seq = db.Column(db.Integer, nullable=False, default=0)
+    pushed_at = db.Column(db.DateTime)
+
+class SyncPeer(db.Model):
+    """A device whose change log this central node has received"""
+    __tablename__ = 'sync_peer'
+
+    device_id = db.Column(db.String(3), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    last_push_at = db.Column(db.DateTime)
+
 class Service(db.Model):
+    # Kept in step with migrations 1, 3, 4, 7 and 10 in migrations.py, which add
+    # the same indexes to databases created before they were declared here.
+    # AUTOINCREMENT: ids of services moved to an archive are never issued again
+    __table_args__ = (
+        db.Index('ix_service_listing', 'created_at', 'id', 'service_type', 'payment_method',
+                 'invoice_type', 'amount', 'invoice_number'),
+        db.Index('ix_service_type_created_at', 'service_type', 'created_at'),
+        db.Index('ix_service_payment_created_at', 'payment_method', 'created_at'),
+        db.Index('ix_service_valid_till', 'valid_till'),
+        db.Index('ix_service_contact_number', 'contact_number'),
+        db.Index('ix_service_devotee_id', 'devotee_id'),
+        db.Index('ix_service_subscription_window', 'created_at', 'valid_till',
+                 sqlite_where=db.text("frequency IN ('WEEKLY', 'MONTHLY')")),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     service_type = db.Column(db.Integer, nullable=False)
     service_name = db.Column(db.String(100), nullable=False)
@@ -87,6 +230,8 @@ class Service(db.Model):
     contact_number = db.Column(db.String(15))
     gothram = db.Column(db.String(50))
     puja_details = db.Column(db.Text)
+    # Added by migration 3 on older databases
+    devotee_id = db.Column(db.Integer, db.ForeignKey('devotee.id'))
     
     # Address Details
     address1 = db.Column(db.String(100))
@@ -105,40 +250,27 @@ class Service(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     @staticmethod
-    def generate_invoice_number(invoice_type):
+    def invoice_prefix(invoice_type):
+        """Invoice number prefix for an invoice type (TOKEN/RECEIPT), after this device's id"""
+        # Kiosks that sync to a central node each have their own DEVICE_ID,
+        # so their numbers never collide (see sync.py)
+        device_id = current_app.config.get('DEVICE_ID', '')
+        return device_id + ("T" if invoice_type == "TOKEN" else "R")
+
+    @staticmethod
+    def generate_invoice_number(invoice_type, block_size=0):
         """Generate a unique invoice number based on type (TOKEN/RECEIPT)"""
-        prefix = "T" if invoice_type == "TOKEN" else "R"
-        last_service = Service.query.filter(
-            Service.invoice_number.like(f"{prefix}%")
-        ).order_by(Service.invoice_number.desc()).first()
-        
-        if not last_service:
-            return f"{prefix}A0001"
-            
-        last_num = int(last_service.invoice_number[2:])
-        new_num = last_num + 1
-        
-        if new_num > 9999:
-            # Increment the letter
-            letter = chr(ord(last_service.invoice_number[1]) + 1)
-            if letter > 'Z':
-                raise ValueError("Invoice number limit reached")
-            return f"{prefix}{letter}0001"
-            
-        return f"{prefix}{last_service.invoice_number[1]}{new_num:04d}"
+        return next_invoice_number(Service.invoice_prefix(invoice_type), block_size)
 
     @staticmethod
     def calculate_amount(service_type, frequency="SINGLE"):
-        """Calculate service amount based on type and frequency"""
-        base_amount = SERVICE_PRICES.get(service_type)
-        if not base_amount:
+        """Calculate service amount based on type and frequency at today's catalog price"""
+        # Served from the in-memory catalog; no query on the sale path
+        amount = catalog.get().price(service_type, frequency)
+        if not amount:
             raise ValueError("Invalid service type")
-            
-        if frequency == "WEEKLY":
-            return base_amount * 7
-        elif frequency == "MONTHLY":
-            return base_amount * 30
-        return base_amount
+        # As the Float column reads it back, whether or not the row is reloaded
+        return float(amount)
 
     @staticmethod
     def calculate_valid_till(frequency="SINGLE"):
@@ -0,0 +1,386 @@
+import argparse
+import json
+import string
+import textwrap
+from datetime import datetime
+
+# Server-side rendering of TOKEN slips and RECEIPTs, in the layouts of the
+# dashboard's print preview, as ESC/POS byte streams for thermal printers and
+# as PDF. The input is the print payload service_print_data() builds (the
+# fields create_service returns). Layouts are compiled once at import: the
+# constant bytes of every line are prebuilt and only the fields are filled
+# in per receipt.
+
+TEMPLE_NAME = "Shirdi Sai Cultural Mission"
+TEMPLE_ADDRESS = ("Vidyanagar, Tirupati District, Andhra Pradesh. -524413",
+                  "Contact Number - 9705894817")
+TOKEN_HEADING = "SSCM"
+
+# Characters per line of a 58 mm thermal printer in font A
+PRINTER_COLUMNS = 32
+
+FORMATS = {
+    'escpos': ('application/octet-stream', 'bin'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+
+# Layouts: (style, template) lines, templates filled from fields()
+TOKEN_LAYOUT = [
+    ('title', TOKEN_HEADING),
+    ('heading', "{service}"),
+    ('large', "{number}"),
+    ('normal', "Valid till: {valid_till}"),
+    ('heading', "{amount}"),
+]
+
+RECEIPT_LAYOUT = [
+    ('heading', TEMPLE_NAME),
+    ('small', TEMPLE_ADDRESS[0]),
+    ('small', TEMPLE_ADDRESS[1]),
+    ('heading', "{service}"),
+    ('small', "{copy}"),
+    ('rule', ""),
+    ('field', "Receipt No: {number}"),
+    ('field', "Gothram: {gothram}"),
+    ('field', "Name: {name}"),
+    ('field', "Puja Details: {puja}"),
+    ('field', "Address: {address}"),
+    ('field', "Amount in Words: {amount_words}"),
+    ('bold', "Amount: {amount}"),
+    ('signature', "Signature"),
+]
+
+# Office copy first, then the devotee's, as on the A4 receipt
+RECEIPT_COPIES = ("Office Copy", "Devotee Copy")
+
+
+# ---- Field formatting -------------------------------------------------
+
+UNITS = ['', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten',
+         'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen',
+         'Eighteen', 'Nineteen']
+TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+
+
+def amount_in_words(number):
+    """16116 -> 'Sixteen Thousand One Hundred and Sixteen', like numberToWords in dashboard.js"""
+    if number == 0:
+        return 'Zero'
+    if number < 20:
+        return UNITS[number]
+    if number < 100:
+        return TENS[number // 10] + (' ' + UNITS[number % 10] if number % 10 else '')
+    if number < 1000:
+        return UNITS[number // 100] + ' Hundred' + \
+            (' and ' + amount_in_words(number % 100) if number % 100 else '')
+    if number < 100000:
+        return amount_in_words(number // 1000) + ' Thousand' + \
+            (' ' + amount_in_words(number % 1000) if number % 1000 else '')
+    return amount_in_words(number // 100000) + ' Lakh' + \
+        (' ' + amount_in_words(number % 100000) if number % 100000 else '')
+
+
+def format_amount(amount):
+    # Neither ESC/POS code pages nor the PDF base fonts have a rupee sign
+    amount = int(amount) if float(amount).is_integer() else amount
+    return f"Rs.{amount}/-"
+
+
+def format_date(value):
+    """DD/MM/YYYY from a datetime or an ISO timestamp"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime('%d/%m/%Y')
+
+
+def fields(data, copy=''):
+    """Values for the layout templates from one print payload"""
+    address = data.get('address') or {}
+    street = ' '.join(address.get(key) or '' for key in ('address1', 'address2', 'address3', 'address4'))
+    region = ' '.join(address.get(key) or '' for key in ('city', 'district', 'state', 'pincode'))
+    return {
+        'service': data.get('serviceName') or '',
+        'number': data.get('invoiceNumber') or '',
+        'valid_till': format_date(data['validTill']) if data.get('validTill') else '',
+        'amount': format_amount(data.get('amount') or 0),
+        'amount_words': f"{amount_in_words(int(data.get('amount') or 0))} rupees only",
+        'gothram': data.get('gothram') or '',
+        'name': data.get('devoteeName') or '',
+        'puja': data.get('pujaDetails') or '',
+        'address': ' '.join(f"{street} {region}".split()),
+        'copy': copy,
+    }
+
+
+def _compile(layout):
+    """Split each template into literal text and field names once"""
+    compiled = []
+    for style, template in layout:
+        pieces = [(literal, name) for literal, name, _, _ in string.Formatter().parse(template)]
+        compiled.append((style, pieces))
+    return compiled
+
+
+def _fill(pieces, values):
+    return ''.join(literal + (values[name] if name else '') for literal, name in pieces)
+
+
+# ---- ESC/POS ----------------------------------------------------------
+
+ESC, GS = b'\x1b', b'\x1d'
+INIT = ESC + b'@'
+ALIGN_LEFT, ALIGN_CENTER = ESC + b'a\x00', ESC + b'a\x01'
+BOLD_ON, BOLD_OFF = ESC + b'E\x01', ESC + b'E\x00'
+NORMAL_SIZE = GS + b'!\x00'
+# Feed a few lines past the tear bar, then a partial cut
+CUT = ESC + b'd\x04' + GS + b'V\x01'
+
+# style -> (prefix, suffix, wrap width); every line resets to normal after itself
+ESCPOS_STYLES = {
+    'title': (ALIGN_CENTER + BOLD_ON + GS + b'!\x11', BOLD_OFF + NORMAL_SIZE, PRINTER_COLUMNS // 2),
+    'large': (ALIGN_CENTER + BOLD_ON + GS + b'!\x11', BOLD_OFF + NORMAL_SIZE, PRINTER_COLUMNS // 2),
+    'heading': (ALIGN_CENTER + BOLD_ON, BOLD_OFF, PRINTER_COLUMNS),
+    'normal': (ALIGN_CENTER, b'', PRINTER_COLUMNS),
+    'small': (ALIGN_CENTER, b'', PRINTER_COLUMNS),
+    'field': (ALIGN_LEFT, b'', PRINTER_COLUMNS),
+    'bold': (ALIGN_LEFT + BOLD_ON, BOLD_OFF, PRINTER_COLUMNS),
+    'rule': (ALIGN_LEFT + b'-' * PRINTER_COLUMNS, b'', 0),
+    'signature': (ALIGN_LEFT + b'\n\n' + b' ' * (PRINTER_COLUMNS - 12) + b'-' * 12 + b'\n'
+                  + b' ' * (PRINTER_COLUMNS - 11), b'', PRINTER_COLUMNS),
+}
+
+
+def _escpos_template(layout):
+    """Compile a layout to [bytes | (pieces, wrap width)] parts"""
+    parts = []
+    for style, pieces in _compile(layout):
+        prefix, suffix, width = ESCPOS_STYLES[style]
+        parts.append(prefix)
+        if any(name for _, name in pieces):
+            parts.append((pieces, width))
+        elif width:
+            parts.append(_escpos_text(_fill(pieces, {}), width))
+        parts.append(suffix + b'\n')
+    return parts
+
+
+def _escpos_text(text, width):
+    # Thermal printers only have single-byte code pages; anything else
+    # (e.g. names typed in Telugu) prints as '?'
+    if len(text) > width:
+        text = '\n'.join(textwrap.wrap(text, width))
+    return text.encode('ascii', 'replace')
+
+
+def _render_escpos(template, values):
+    return b''.join(
+        part if isinstance(part, bytes) else _escpos_text(_fill(part[0], values), part[1])
+        for part in template
+    )
+
+
+ESCPOS_TOKEN = _escpos_template(TOKEN_LAYOUT)
+ESCPOS_RECEIPT = _escpos_template(RECEIPT_LAYOUT)
+
+
+def render_escpos(data):
+    """
+    ESC/POS bytes for one print payload, or a list of token payloads.
+
+    Tokens are cut after every slip; a receipt prints an office and a
+    devotee copy with a cut after each.
+    """
+    documents = data if isinstance(data, list) else [data]
+    out = [INIT]
+    for document in documents:
+        if document.get('invoiceType') == 'TOKEN':
+            out.append(_render_escpos(ESCPOS_TOKEN, fields(document)))
+            out.append(CUT)
+        else:
+            for copy in RECEIPT_COPIES:
+                out.append(_render_escpos(ESCPOS_RECEIPT, fields(document, copy)))
+                out.append(CUT)
+    return b''.join(out)
+
+
+# ---- PDF --------------------------------------------------------------
+
+# Advance widths (1/1000 em) of ASCII 32..126 in the standard Helvetica and
+# Helvetica-Bold fonts, for centring and wrapping without a font library
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722, 722, 667,
+    611, 778, 722, 278, 500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667,
+    667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500,
+    222, 833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611, 975, 722, 722, 722, 722, 667,
+    611, 778, 722, 278, 556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667,
+    667, 611, 333, 278, 333, 584, 556, 333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556,
+    278, 889, 611, 611, 611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+
+MM = 72 / 25.4
+TOKEN_PAGE_WIDTH = 55 * MM
+A4 = (595.28, 841.89)
+PDF_MARGIN = 10 * MM
+
+# style -> (font resource, size, centred)
+PDF_STYLES = {
+    'title': ('F2', 20, True),
+    'large': ('F2', 16, True),
+    'heading': ('F2', 13, True),
+    'normal': ('F1', 10, True),
+    'small': ('F1', 8, True),
+    'field': ('F1', 10, False),
+    'bold': ('F2', 11, False),
+    'rule': ('F1', 10, False),
+    'signature': ('F1', 10, False),
+}
+
+
+def text_width(text, font, size):
+    widths = HELVETICA_BOLD_WIDTHS if font == 'F2' else HELVETICA_WIDTHS
+    return sum(widths[ord(char) - 32] if 32 <= ord(char) < 127 else 556 for char in text) * size / 1000
+
+
+def _pdf_wrap(text, font, size, width):
+    lines, line = [], ''
+    for word in text.split(' '):
+        candidate = f"{line} {word}" if line else word
+        if line and text_width(candidate, font, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line]
+
+
+def _pdf_string(text):
+    escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return b'(' + escaped.encode('cp1252', 'replace') + b')'
+
+
+PDF_TOKEN = _compile(TOKEN_LAYOUT)
+PDF_RECEIPT = _compile(RECEIPT_LAYOUT)
+
+
+def _pdf_lines(template, values, left, top, width):
+    """
+    Content stream operators for a layout in the box starting at (left, top).
+
+    Returns:
+        tuple: (content bytes, y position below the last line)
+    """
+    out, y = [], top
+    for style, pieces in template:
+        font, size, centred = PDF_STYLES[style]
+        leading = size * 1.35
+        if style == 'rule':
+            y -= leading / 2
+            out.append(f"{left:.2f} {y:.2f} m {left + width:.2f} {y:.2f} l S".encode())
+            y -= leading / 2
+            continue
+        if style == 'signature':
+            y -= leading * 2
+            out.append(f"{left + width - 40 * MM:.2f} {y:.2f} m {left + width:.2f} {y:.2f} l S".encode())
+        for line in _pdf_wrap(_fill(pieces, values), font, size, width):
+            y -= leading
+            line_width = text_width(line, font, size)
+            x = left + (width - line_width) / 2 if centred else left
+            if style == 'signature':
+                x = left + width - line_width
+            out.append(b"BT /%s %d Tf %.2f %.2f Td %s Tj ET" % (
+                font.encode(), size, x, y, _pdf_string(line)))
+    return b'\n'.join(out), y
+
+
+def _pdf_document(pages):
+    """A PDF file from (width, height, content stream) pages"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # the page tree, once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for width, height, content in pages:
+        kids.append(len(objects) + 1)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (width, height, len(objects) + 2)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content) + 1, content))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b' '.join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_pdf(data):
+    """
+    PDF for one print payload, or a list of token payloads.
+
+    Each token is a 55 mm wide page sized to its slip; a receipt is one A4
+    page with the office copy on the top half and the devotee copy below.
+    """
+    documents = data if isinstance(data, list) else [data]
+    pages = []
+    for document in documents:
+        if document.get('invoiceType') == 'TOKEN':
+            width = TOKEN_PAGE_WIDTH - 2 * 4 * MM
+            content, bottom = _pdf_lines(PDF_TOKEN, fields(document), 4 * MM, 0, width)
+            height = -bottom + 8 * MM
+            # Lines were laid out from y=0 down; shift them onto the page
+            pages.append((TOKEN_PAGE_WIDTH, height,
+                          b"1 0 0 1 0 %.2f cm\n" % (height - 4 * MM) + content))
+        else:
+            width, height = A4
+            half = height / 2
+            streams = []
+            for index, copy in enumerate(RECEIPT_COPIES):
+                top = height - PDF_MARGIN - index * half
+                content, _ = _pdf_lines(PDF_RECEIPT, fields(document, copy),
+                                        PDF_MARGIN, top, width - 2 * PDF_MARGIN)
+                streams.append(content)
+            # Dashed cut line between the copies
+            streams.append(b"[4 4] 0 d %.2f %.2f m %.2f %.2f l S [] 0 d" % (
+                PDF_MARGIN, half, width - PDF_MARGIN, half))
+            pages.append((width, height, b'\n'.join(streams)))
+    return _pdf_document(pages)
+
+
+RENDERERS = {'escpos': render_escpos, 'pdf': render_pdf}
+
+
+def render(data, fmt='escpos'):
+    """Render a print payload (or list of token payloads) as escpos or pdf bytes"""
+    if fmt not in RENDERERS:
+        raise ValueError(f"Print format must be one of {', '.join(RENDERERS)}")
+    return RENDERERS[fmt](data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a print payload (JSON) as ESC/POS or PDF")
+    parser.add_argument('payload', help="JSON file with a print payload or a list of tokens")
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=list(RENDERERS), default='pdf')
+    args = parser.parse_args()
+
+    with open(args.payload) as handle:
+        payload = json.load(handle)
+    with open(args.output, 'wb') as handle:
+        handle.write(render(payload, args.format))
+    print(f"Written {args.output}")
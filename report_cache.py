@@ -0,0 +1,146 @@
+import glob
+import os
+import threading
+from sqlalchemy import text
+from reports import REPORTS_DIR, month_bounds, report_basename
+import archive
+
+# Cached reports live next to the plain ones in reports/ and carry the data
+# version they were built from in their name:
+#   Temple_Report_March_2025.<count>-<max id>.xlsx
+# Cache hits are served without a lock; builds take one lock per month and
+# format, so only requests for the same report wait on each other's build.
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+DATA_VERSION = "SELECT COUNT(*), MAX(id) FROM service WHERE created_at >= :start AND created_at < :end"
+
+
+def data_version(conn, year, month):
+    """
+    Stamp for the data behind a month's report: row count and max id.
+
+    Both come straight off the created_at index, so this stays cheap no
+    matter how large the month is. Months of archived years are counted in
+    their archive.
+    """
+    start, end = month_bounds(year, month)
+    params = {'start': str(start), 'end': str(end)}
+    if start.date() < archive.hot_start(conn):
+        archived = archive.connect_range(start, end)
+        try:
+            count, max_id = archived.execute(DATA_VERSION, params).fetchone()
+        finally:
+            archived.close()
+    else:
+        count, max_id = conn.execute(text(DATA_VERSION), params).one()
+    return f"{count}-{max_id or 0}"
+
+
+def cache_path(year, month, version, fmt='xlsx'):
+    return os.path.join(REPORTS_DIR, f"{report_basename(year, month)}.{version}.{fmt}")
+
+
+def cached_files(year=None, month=None, fmt='xlsx'):
+    """Cached report files, for one month or for all of them"""
+    name = report_basename(year, month) if year and month else "Temple_Report_*"
+    return [path for path in glob.glob(os.path.join(REPORTS_DIR, f"{name}.*.{fmt}"))
+            if '.partial.' not in os.path.basename(path)]
+
+
+def _build_lock(year, month, fmt):
+    with _build_locks_guard:
+        return _build_locks.setdefault((year, month, fmt), threading.Lock())
+
+
+def get_report(conn, build, year, month, fmt='xlsx', max_bytes=None):
+    """
+    Return (path, etag) of a report, building it only when needed.
+
+    Every month, closed ones included, is looked up by its data version and
+    rebuilt only when services have been added since the cached copy was
+    made: a closed month still gains the sales a kiosk pushes late (sync.py)
+    or an archive rerun merges in.
+
+    Args:
+        conn: SQLAlchemy connection or session used for the data version
+        build (callable): build(year, month, output_file) writes the report
+        max_bytes (int): Evict least recently used files above this size
+    """
+    version = data_version(conn, year, month)
+    path = cache_path(year, month, version, fmt)
+    if _touch(path):
+        return path, _etag(path)
+
+    with _build_lock(year, month, fmt):
+        # Built by the request this one waited behind
+        if not os.path.exists(path):
+            os.makedirs(REPORTS_DIR, exist_ok=True)
+            # Build under a temporary name so a half-written file is never served
+            root, ext = os.path.splitext(path)
+            partial = f"{root}.partial{ext}"
+            build(year, month, partial)
+            os.replace(partial, path)
+
+            # Older versions of this month are stale now
+            for stale in cached_files(year, month, fmt):
+                if stale != path:
+                    _remove(stale)
+            if max_bytes:
+                evict(max_bytes, keep=path)
+
+    return path, _etag(path)
+
+
+def evict(max_bytes, keep=None):
+    """Delete least recently served cached reports until under max_bytes"""
+    files = [(os.path.getmtime(path), os.path.getsize(path), path)
+             for path in cached_files(fmt='*')]
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path != keep:
+            _remove(path)
+            total -= size
+
+
+def invalidate(year=None, month=None):
+    """
+    Delete cached reports for one month, or all of them.
+
+    Returns:
+        int: Number of files removed
+    """
+    files = cached_files(year, month, fmt='*')
+    for path in files:
+        os.remove(path)
+    return len(files)
+
+
+def _etag(path):
+    # The data version in the file name identifies the content
+    return os.path.basename(path)
+
+
+def _touch(path):
+    """Mark a cached report as just served; False if it is not there"""
+    # mtime doubles as "last served" for LRU eviction
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _remove(path):
+    # Builds of other months may evict the same file at the same time
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    removed = invalidate()
+    print(f"Removed {removed} cached reports")
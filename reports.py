@@ -1,110 +1,159 @@
 import os
-import pandas as pd
-import sqlite3
+import archive
+import metrics
+import catalog
 from datetime import datetime
 from enum import Enum
-from models import ServiceType, PaymentMethod
+from models import PaymentMethod
 
-def generate_monthly_report(year=None, month=None):
+# pandas (and openpyxl, through ExcelWriter) is imported inside the functions
+# that need it, so importing this module for its constants stays cheap and the
+# kiosk's first page is not held up by the report stack.
+
+# Display names used in every sheet, looked up once per column with .map();
+# service names come from the catalog (catalog.get().display_names)
+PAYMENT_NAMES = {p.value: p.name.title() for p in PaymentMethod}
+
+# Generated reports are written here, next to this file
+REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
+
+def report_basename(year, month):
+    """File name stem for a month's report, e.g. Temple_Report_March_2025"""
+    month_name = datetime.strptime(f"{year}-{month}", "%Y-%m").strftime("%B_%Y")
+    return f"Temple_Report_{month_name}"
+
+def generate_monthly_report(year=None, month=None, output_file=None, progress=None):
     """
     Generate a monthly Excel report with service-wise and payment-wise data in separate tabs.
     
     Args:
         year (int): Year for the report (defaults to current year if None)
         month (int): Month for the report (defaults to current month if None)
+        output_file (str): Where to write the report (defaults to reports/Temple_Report_<Month>_<Year>.xlsx)
+        progress (callable): Optional progress(fraction, stage) callback for background jobs
         
     Returns:
         str: Path to the generated Excel file
     """
+    import pandas as pd
+    
     # Use current year and month if not specified
     if year is None:
         year = datetime.now().year
     if month is None:
         month = datetime.now().month
+    # Stage timings go to /metrics as well as to the caller's callback
+    progress = metrics.StageTimer('monthly', progress)
     
     # Create reports directory if it doesn't exist
-    reports_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
-    os.makedirs(reports_dir, exist_ok=True)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
     
-    # Connect to the database
-    conn = sqlite3.connect('temple.db')
+    # Read-only connection, separate from the counter's writer pool; an
+    # archived month is read from its year's archive
+    conn = archive.connect_range(*month_bounds(year, month))
     
     # Create a month name for the file
-    month_name = datetime.strptime(f"{year}-{month}", "%Y-%m").strftime("%B_%Y")
-    excel_file = os.path.join(reports_dir, f"Temple_Report_{month_name}.xlsx")
+    excel_file = output_file or os.path.join(REPORTS_DIR, f"{report_basename(year, month)}.xlsx")
+    
+    # Read the month once; every sheet is derived from this frame
+    progress(0.0, 'Loading services')
+    services = load_month(conn, year, month)
+    totals = load_month_totals(conn, year, month)
+    conn.close()
     
     # Create Excel writer
     with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
         # Create a summary sheet
-        create_summary_sheet(conn, writer, year, month)
+        progress(0.2, 'Summary')
+        create_summary_sheet(services, totals, writer, year, month)
         
         # Create service-wise sheets
-        create_service_sheets(conn, writer, year, month)
+        progress(0.3, 'Service sheets')
+        create_service_sheets(services, writer)
         
         # Create payment-wise sheets
-        create_payment_sheets(conn, writer, year, month)
+        progress(0.6, 'Payment sheets')
+        create_payment_sheets(services, writer)
+        
+        progress(0.9, 'Saving workbook')
+    progress.finish()
     
-    conn.close()
     return excel_file
 
-def create_summary_sheet(conn, writer, year, month):
-    """Create a summary sheet with overall statistics"""
-    # Query for summary data
-    query = """
-    SELECT 
-        COUNT(*) as total_services,
-        SUM(amount) as total_amount,
-        COUNT(DISTINCT devotee_name) as unique_devotees
-    FROM service
-    WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?
-    """
-    
-    summary_df = pd.read_sql_query(query, conn, params=(str(year), str(month).zfill(2)))
-    
-    # Add service type breakdown
-    service_type_query = """
-    SELECT 
-        service_type,
-        COUNT(*) as count,
-        SUM(amount) as total_amount
-    FROM service
-    WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?
-    GROUP BY service_type
-    ORDER BY total_amount DESC
-    """
-    
-    service_breakdown = pd.read_sql_query(service_type_query, conn, params=(str(year), str(month).zfill(2)))
-    
-    # Map service_type numbers to names
-    service_breakdown['service_name'] = service_breakdown['service_type'].apply(
-        lambda x: ServiceType(x).name.replace('_', ' ').title()
+def month_bounds(year, month):
+    """Return the half-open [start, end) created_at range for a month"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+# created_at is stored as 'YYYY-MM-DD HH:MM:SS.ffffff', so a plain string
+# range keeps the predicate sargable instead of wrapping it in strftime()
+SERVICES_IN_RANGE_QUERY = """
+SELECT *
+FROM service
+WHERE created_at >= ? AND created_at < ?
+ORDER BY created_at, id
+"""
+
+def add_display_names(services):
+    """Add service_name and payment_name columns mapped from the enum values"""
+    services['service_name'] = services['service_type'].map(catalog.get().display_names)
+    services['payment_name'] = services['payment_method'].map(PAYMENT_NAMES)
+    return services
+
+def load_month(conn, year, month):
+    """Load all services created in a month with a single range scan"""
+    import pandas as pd
+    start, end = month_bounds(year, month)
+    services = pd.read_sql_query(
+        SERVICES_IN_RANGE_QUERY, conn, params=(str(start), str(end)),
+        parse_dates=['created_at', 'valid_till']
     )
-    
-    # Payment method breakdown
-    payment_query = """
-    SELECT 
-        payment_method,
-        COUNT(*) as count,
-        SUM(amount) as total_amount
-    FROM service
-    WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?
-    GROUP BY payment_method
-    ORDER BY total_amount DESC
+    return add_display_names(services)
+
+def load_totals(conn, start, end):
+    """Load per-dimension totals for days in [start, end) from the daily rollups"""
+    import pandas as pd
+    query = """
+    SELECT dimension, key, SUM(count) as count, SUM(amount) as total_amount
+    FROM daily_rollup
+    WHERE day >= ? AND day < ?
+    GROUP BY dimension, key
     """
     
-    payment_breakdown = pd.read_sql_query(payment_query, conn, params=(str(year), str(month).zfill(2)))
-    
-    # Map payment method numbers to names
-    payment_breakdown['payment_name'] = payment_breakdown['payment_method'].apply(
-        lambda x: PaymentMethod(x).name.title()
+    return pd.read_sql_query(query, conn, params=(start.date().isoformat(), end.date().isoformat()))
+
+def load_month_totals(conn, year, month):
+    """Load the month's per-dimension totals from the daily rollups"""
+    return load_totals(conn, *month_bounds(year, month))
+
+def summarize(totals, unique_devotees):
+    """Build the summary row and the service/payment breakdowns from rollup totals"""
+    import pandas as pd
+    # Every service has exactly one invoice type, so those rows add up to the totals
+    invoice_totals = totals[totals['dimension'] == 'invoice_type']
+    summary_df = pd.DataFrame([{
+        'total_services': int(invoice_totals['count'].sum()),
+        'total_amount': invoice_totals['total_amount'].sum() if not invoice_totals.empty else None,
+        'unique_devotees': unique_devotees
+    }])
+    service_breakdown = breakdown(totals, 'service_type', catalog.get().display_names, 'service_name')
+    payment_breakdown = breakdown(totals, 'payment_method', PAYMENT_NAMES, 'payment_name')
+    return summary_df, service_breakdown, payment_breakdown
+
+def create_summary_sheet(services, totals, writer, year, month):
+    """Create a summary sheet with overall statistics"""
+    # Service type and payment method breakdowns come from the rollups
+    summary_df, service_breakdown, payment_breakdown = summarize(
+        totals, services['devotee_name'].nunique()
     )
     
     # Write to Excel
     summary_df.to_excel(writer, sheet_name='Summary', index=False, startrow=1)
-    service_breakdown[['service_name', 'count', 'total_amount']].to_excel(
+    service_breakdown.to_excel(
         writer, sheet_name='Summary', index=False, startrow=5
     )
-    payment_breakdown[['payment_name', 'count', 'total_amount']].to_excel(
+    payment_breakdown.to_excel(
         writer, sheet_name='Summary', index=False, startrow=len(service_breakdown) + 8
     )
     
@@ -114,117 +163,91 @@ def create_summary_sheet(conn, writer, year, month):
     worksheet.cell(row=5, column=1).value = "Service Type Breakdown:"
     worksheet.cell(row=len(service_breakdown) + 8, column=1).value = "Payment Method Breakdown:"
 
-def create_service_sheets(conn, writer, year, month):
+def breakdown(totals, dimension, names, name_column):
+    """Count and total amount per name for one rollup dimension, largest total first"""
+    import pandas as pd
+    rows = totals[totals['dimension'] == dimension]
+    keys = rows['key'].astype(int) if dimension == 'service_type' else rows['key']
+    return (
+        pd.DataFrame({
+            name_column: keys.map(names).values,
+            'count': rows['count'].values,
+            'total_amount': rows['total_amount'].values
+        })
+        .sort_values('total_amount', ascending=False, kind='stable')
+    )
+
+# Column layouts for the per-service and per-payment sheets
+SERVICE_SHEET_COLUMNS = {
+    'invoice_number': 'Invoice Number',
+    'created_at': 'Date',
+    'devotee_name': 'Devotee Name',
+    'gothram': 'Gothram',
+    'contact_number': 'Contact',
+    'amount': 'Amount',
+    'payment_name': 'Payment Method',
+    'puja_details': 'Puja Details'
+}
+
+PAYMENT_SHEET_COLUMNS = {
+    'invoice_number': 'Invoice Number',
+    'created_at': 'Date',
+    'service_name': 'Service Type',
+    'devotee_name': 'Devotee Name',
+    'amount': 'Amount',
+    'puja_details': 'Puja Details'
+}
+
+def service_sheet_name(service_name):
+    return f"{service_name[:28]}"  # Excel has a 31 character limit for sheet names
+
+def payment_sheet_name(payment_name):
+    return f"Payment_{payment_name[:20]}"  # Excel has a 31 character limit for sheet names
+
+def format_service_sheet(worksheet):
+    worksheet.column_dimensions['A'].width = 15  # Invoice number
+    worksheet.column_dimensions['B'].width = 20  # Date
+    worksheet.column_dimensions['C'].width = 25  # Devotee name
+    worksheet.column_dimensions['H'].width = 30  # Puja details
+
+def format_payment_sheet(worksheet):
+    worksheet.column_dimensions['A'].width = 15  # Invoice number
+    worksheet.column_dimensions['B'].width = 20  # Date
+    worksheet.column_dimensions['C'].width = 25  # Service type
+    worksheet.column_dimensions['D'].width = 25  # Devotee name
+    worksheet.column_dimensions['F'].width = 30  # Puja details
+
+def create_service_sheets(services, writer):
     """Create separate sheets for each service type"""
-    # Get all services for the month
-    query = """
-    SELECT *
-    FROM service
-    WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?
-    """
-    
-    all_services = pd.read_sql_query(query, conn, params=(str(year), str(month).zfill(2)))
-    
-    if all_services.empty:
+    if services.empty:
         # No data for this month
         return
     
-    # Get unique service types
-    service_types = all_services['service_type'].unique()
-    
-    for service_type in service_types:
-        # Filter data for this service type
-        service_data = all_services[all_services['service_type'] == service_type].copy()
-        
-        # Get service name
-        service_name = ServiceType(service_type).name.replace('_', ' ').title()
-        
-        # Format the data for display
-        service_data['created_at'] = pd.to_datetime(service_data['created_at'])
-        service_data['valid_till'] = pd.to_datetime(service_data['valid_till'])
-        service_data['payment_method'] = service_data['payment_method'].apply(
-            lambda x: PaymentMethod(x).name.title()
-        )
-        
-        # Select and rename columns for better readability
-        display_columns = {
-            'invoice_number': 'Invoice Number',
-            'created_at': 'Date',
-            'devotee_name': 'Devotee Name',
-            'gothram': 'Gothram',
-            'contact_number': 'Contact',
-            'amount': 'Amount',
-            'payment_method': 'Payment Method',
-            'puja_details': 'Puja Details'
-        }
-        
+    for service_name, service_data in services.groupby('service_name', sort=False):
         # Create the sheet
-        sheet_name = f"{service_name[:28]}"  # Excel has a 31 character limit for sheet names
-        service_data[list(display_columns.keys())].rename(columns=display_columns).to_excel(
+        sheet_name = service_sheet_name(service_name)
+        service_data[list(SERVICE_SHEET_COLUMNS)].rename(columns=SERVICE_SHEET_COLUMNS).to_excel(
             writer, sheet_name=sheet_name, index=False
         )
         
         # Format the sheet
-        worksheet = writer.sheets[sheet_name]
-        worksheet.column_dimensions['A'].width = 15  # Invoice number
-        worksheet.column_dimensions['B'].width = 20  # Date
-        worksheet.column_dimensions['C'].width = 25  # Devotee name
-        worksheet.column_dimensions['H'].width = 30  # Puja details
+        format_service_sheet(writer.sheets[sheet_name])
 
-def create_payment_sheets(conn, writer, year, month):
+def create_payment_sheets(services, writer):
     """Create separate sheets for each payment method"""
-    # Get all services for the month
-    query = """
-    SELECT *
-    FROM service
-    WHERE strftime('%Y', created_at) = ? AND strftime('%m', created_at) = ?
-    """
-    
-    all_services = pd.read_sql_query(query, conn, params=(str(year), str(month).zfill(2)))
-    
-    if all_services.empty:
+    if services.empty:
         # No data for this month
         return
     
-    # Get unique payment methods
-    payment_methods = all_services['payment_method'].unique()
-    
-    for payment_method in payment_methods:
-        # Filter data for this payment method
-        payment_data = all_services[all_services['payment_method'] == payment_method].copy()
-        
-        # Get payment method name
-        payment_name = PaymentMethod(payment_method).name.title()
-        
-        # Format the data for display
-        payment_data['created_at'] = pd.to_datetime(payment_data['created_at'])
-        payment_data['service_type'] = payment_data['service_type'].apply(
-            lambda x: ServiceType(x).name.replace('_', ' ').title()
-        )
-        
-        # Select and rename columns for better readability
-        display_columns = {
-            'invoice_number': 'Invoice Number',
-            'created_at': 'Date',
-            'service_type': 'Service Type',
-            'devotee_name': 'Devotee Name',
-            'amount': 'Amount',
-            'puja_details': 'Puja Details'
-        }
-        
+    for payment_name, payment_data in services.groupby('payment_name', sort=False):
         # Create the sheet
-        sheet_name = f"Payment_{payment_name[:20]}"  # Excel has a 31 character limit for sheet names
-        payment_data[list(display_columns.keys())].rename(columns=display_columns).to_excel(
+        sheet_name = payment_sheet_name(payment_name)
+        payment_data[list(PAYMENT_SHEET_COLUMNS)].rename(columns=PAYMENT_SHEET_COLUMNS).to_excel(
             writer, sheet_name=sheet_name, index=False
         )
         
         # Format the sheet
-        worksheet = writer.sheets[sheet_name]
-        worksheet.column_dimensions['A'].width = 15  # Invoice number
-        worksheet.column_dimensions['B'].width = 20  # Date
-        worksheet.column_dimensions['C'].width = 25  # Service type
-        worksheet.column_dimensions['D'].width = 25  # Devotee name
-        worksheet.column_dimensions['F'].width = 30  # Puja details
+        format_payment_sheet(writer.sheets[sheet_name])
 
 if __name__ == "__main__":
     # Generate report for current month
@@ -0,0 +1,198 @@
+import argparse
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+from extensions import db
+import archive
+import roster
+
+# Per-day totals kept in the daily_rollup table, one row per
+# (day, dimension, key). Every sale adds to exactly one key of each dimension.
+# Days are the temple's local days, as on the puja roster (roster.UTC_OFFSET),
+# so a sale at 01:00 IST counts on that day and not on the UTC day before.
+DIMENSIONS = ('service_type', 'payment_method', 'invoice_type')
+
+INCREMENT = """
+INSERT INTO daily_rollup (day, dimension, key, count, amount)
+VALUES (:day, :dimension, :key, :count, :amount)
+ON CONFLICT (day, dimension, key)
+DO UPDATE SET count = count + excluded.count, amount = amount + excluded.amount
+"""
+
+# Aggregates raw service rows into rollup rows for local days in [:start, :end),
+# which begin at the UTC stamps :start_at and :end_at (see range_params).
+# Seconds only: date() would round 23:59:59.9999995 up a day.
+# Named parameters work with both SQLAlchemy text() and plain sqlite3.
+AGGREGATE = " UNION ALL ".join(
+    f"SELECT date(substr(created_at, 1, 19), :offset) AS day, '{dimension}' AS dimension, "
+    f"CAST({dimension} AS TEXT) AS key, COUNT(*) AS count, SUM(amount) AS amount "
+    f"FROM service WHERE created_at >= :start_at AND created_at < :end_at "
+    f"GROUP BY day, {dimension}"
+    for dimension in DIMENSIONS
+)
+
+REBUILD = [
+    "DELETE FROM daily_rollup WHERE day >= :start AND day < :end",
+    f"INSERT INTO daily_rollup (day, dimension, key, count, amount) {AGGREGATE}",
+]
+
+TOTALS = """
+SELECT dimension, key, SUM(count) AS count, SUM(amount) AS amount
+FROM daily_rollup
+WHERE day >= :start AND day < :end
+GROUP BY dimension, key
+"""
+
+# Full date range used when no bounds are given
+EARLIEST = date(1, 1, 1)
+LATEST = date(9999, 12, 31)
+
+
+def local_day(created_at):
+    """The local day a UTC created_at falls on"""
+    return (created_at + roster.UTC_OFFSET).date()
+
+
+def range_params(start, end):
+    """Bind parameters of REBUILD and AGGREGATE for local days in [start, end)"""
+    def stamp(day):
+        try:
+            return str(roster.day_start(day))
+        except OverflowError:
+            # EARLIEST and LATEST have no time before or after them
+            return day.isoformat()
+    return {'start': start.isoformat(), 'end': end.isoformat(),
+            'start_at': stamp(start), 'end_at': stamp(end), 'offset': roster.DAY_MODIFIER}
+
+
+def record_service(session, service):
+    """Add a new service to its day's rollups inside the caller's transaction"""
+    record_services(session, [service])
+
+
+def record_services(session, services):
+    """Add a batch of new services to the rollups with one upsert per touched key"""
+    increments = {}
+    now = datetime.utcnow()
+    for service in services:
+        if service.created_at is None:
+            service.created_at = now
+        day = local_day(service.created_at).isoformat()
+        for dimension in DIMENSIONS:
+            row_key = (day, dimension, str(getattr(service, dimension)))
+            count, amount = increments.get(row_key, (0, 0))
+            increments[row_key] = (count + 1, amount + service.amount)
+
+    session.execute(text(INCREMENT), [
+        {'day': day, 'dimension': dimension, 'key': key, 'count': count, 'amount': amount}
+        for (day, dimension, key), (count, amount) in increments.items()
+    ])
+
+
+def period_bounds(period, year=None, month=None, today=None):
+    """
+    Return the half-open [start, end) day range for a totals period.
+
+    Args:
+        period (str): 'today', 'week' (Monday to Sunday) or 'month'
+        year (int): Year for 'month' (defaults to the current year)
+        month (int): Month for 'month' (defaults to the current month)
+    """
+    today = today or roster.today()
+    if period == 'today':
+        return today, today + timedelta(days=1)
+    if period == 'week':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'month':
+        year = year or today.year
+        month = month or today.month
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return start, end
+    raise ValueError("Invalid period")
+
+
+def totals(conn, start, end):
+    """
+    Read totals for days in [start, end) from the rollups.
+
+    The cost depends on the number of days and keys, not on the number of sales.
+
+    Returns:
+        dict: {'count', 'amount', and one {key: {'count', 'amount'}} dict per dimension}
+    """
+    result = {dimension: {} for dimension in DIMENSIONS}
+    rows = conn.execute(text(TOTALS), {'start': start.isoformat(), 'end': end.isoformat()})
+    for dimension, key, count, amount in rows:
+        result[dimension][key] = {'count': count, 'amount': amount}
+    # Every sale has exactly one invoice type, so these sum to the grand total
+    by_invoice = result['invoice_type'].values()
+    result['count'] = sum(row['count'] for row in by_invoice)
+    result['amount'] = sum(row['amount'] for row in by_invoice)
+    return result
+
+
+def rebuild(conn, start=EARLIEST, end=LATEST):
+    """
+    Recompute rollups for days in [start, end) from raw service rows.
+
+    Archived years are skipped; their rows are no longer in the service
+    table and their rollups are kept as they were.
+    """
+    params = range_params(max(start, archive.hot_start(conn)), end)
+    for statement in REBUILD:
+        conn.execute(text(statement), params)
+
+
+def verify(conn, start=EARLIEST, end=LATEST):
+    """
+    Compare rollups for days in [start, end) against raw service rows,
+    skipping archived years as rebuild() does.
+
+    Returns:
+        list: (day, dimension, key, expected, actual) for every mismatch,
+              where expected/actual are (count, amount) or None
+    """
+    params = range_params(max(start, archive.hot_start(conn)), end)
+    expected = {
+        (day, dimension, key): (count, amount)
+        for day, dimension, key, count, amount in conn.execute(text(AGGREGATE), params)
+    }
+    actual = {
+        (day, dimension, key): (count, amount)
+        for day, dimension, key, count, amount in conn.execute(
+            text("SELECT day, dimension, key, count, amount FROM daily_rollup "
+                 "WHERE day >= :start AND day < :end"), params
+        )
+    }
+    mismatches = []
+    for row_key in sorted(expected.keys() | actual.keys()):
+        want, got = expected.get(row_key), actual.get(row_key)
+        if want is None or got is None or want[0] != got[0] or abs(want[1] - got[1]) > 0.005:
+            mismatches.append((*row_key, want, got))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or verify the daily rollup tables")
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--start', type=date.fromisoformat, default=EARLIEST,
+                        help="First day to include (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, default=LATEST,
+                        help="Day after the last day to include (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    from app import app, init_db
+    init_db()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if args.command == 'rebuild':
+                rebuild(conn, args.start, args.end)
+                print(f"Rollups rebuilt for {args.start} to {args.end}")
+            else:
+                mismatches = verify(conn, args.start, args.end)
+                for mismatch in mismatches:
+                    print("Mismatch: day=%s dimension=%s key=%s expected=%s actual=%s" % mismatch)
+                print(f"{len(mismatches)} mismatched rollup rows")
+                if mismatches:
+                    raise SystemExit(1)
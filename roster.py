@@ -0,0 +1,178 @@
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+# Daily puja roster: which WEEKLY/MONTHLY subscriptions are due on a day.
+# A subscription is due on every day from the day it was bought up to, but
+# not including, the day its valid_till falls on. Rosters are precomputed
+# into puja_roster one day at a time (roster_day records which days are
+# built); a new subscription is added to the days already built.
+#
+# Services are stamped in UTC, but a roster day is the temple's local day
+# (IST unless TEMPLE_UTC_OFFSET_MINUTES says otherwise): a puja bought at
+# 07:00 IST is due that day, though it is still the day before in UTC.
+
+SUBSCRIPTION_FREQUENCIES = ('WEEKLY', 'MONTHLY')
+
+# Longest validity Service.calculate_valid_till hands out; bounds the
+# created_at range an "active on day D" query has to scan
+MAX_VALIDITY_DAYS = 30
+
+# Days from today kept precomputed
+DEFAULT_DAYS = 7
+
+UTC_OFFSET = timedelta(minutes=int(os.environ.get('TEMPLE_UTC_OFFSET_MINUTES', 330)))
+
+# SQLite date modifier from a UTC stamp to local time, e.g. date(created_at, DAY_MODIFIER)
+DAY_MODIFIER = f"{int(UTC_OFFSET.total_seconds() // 60):+d} minutes"
+
+# Interval query for one day, served by the partial index
+# ix_service_subscription_window (created_at, valid_till). Without the lower
+# created_at bound it would scan every subscription ever sold before the day.
+ACTIVE_ON_DAY = """
+SELECT id FROM service
+WHERE frequency IN ('WEEKLY', 'MONTHLY')
+  AND created_at >= :window_start AND created_at < :day_end
+  AND valid_till >= :day_end
+"""
+
+BUILD_DAY = [
+    "DELETE FROM puja_roster WHERE day = :day",
+    f"INSERT INTO puja_roster (day, service_id) SELECT :day, id FROM ({ACTIVE_ON_DAY})",
+    "INSERT OR REPLACE INTO roster_day (day, built_at) VALUES (:day, :built_at)",
+]
+
+# Adds a new subscription, by invoice number, to the already built days it
+# is due on. Seconds only: date() would round 23:59:59.9999995 up a day
+ADD_SERVICE = """
+INSERT OR IGNORE INTO puja_roster (day, service_id)
+SELECT r.day, s.id FROM service s JOIN roster_day r
+  ON r.day >= date(substr(s.created_at, 1, 19), :offset)
+ AND r.day < date(substr(s.valid_till, 1, 19), :offset)
+WHERE s.invoice_number = :invoice_number
+"""
+
+ROSTER = """
+SELECT s.service_type, s.invoice_number, s.frequency, s.devotee_name, s.gothram,
+       s.puja_details, s.contact_number, s.created_at, s.valid_till
+FROM puja_roster r JOIN service s ON s.id = r.service_id
+WHERE r.day = :day
+ORDER BY s.service_type, s.created_at, s.id
+"""
+
+
+def today():
+    """The temple's local date"""
+    return (datetime.utcnow() + UTC_OFFSET).date()
+
+
+def day_start(day):
+    """The UTC time a local day begins at"""
+    return datetime.combine(day, datetime.min.time()) - UTC_OFFSET
+
+
+def day_params(day):
+    """Bind parameters of ACTIVE_ON_DAY for a local day"""
+    day_end = day_start(day + timedelta(days=1))
+    return {
+        'day': day.isoformat(),
+        'day_end': str(day_end),
+        'window_start': str(day_end - timedelta(days=MAX_VALIDITY_DAYS)),
+    }
+
+
+def build_day(conn, day):
+    """Recompute one day's roster from the service table"""
+    params = dict(day_params(day), built_at=datetime.utcnow())
+    for statement in BUILD_DAY:
+        conn.execute(text(statement), params)
+
+
+def ensure(conn, start, days=DEFAULT_DAYS):
+    """
+    Build the rosters of any days in [start, start + days) not built yet.
+
+    Returns:
+        int: Number of days built
+    """
+    end = start + timedelta(days=days)
+    built = {
+        row[0] for row in conn.execute(
+            text("SELECT day FROM roster_day WHERE day >= :start AND day < :end"),
+            {'start': start.isoformat(), 'end': end.isoformat()}
+        )
+    }
+    missing = [start + timedelta(days=offset) for offset in range(days)
+               if (start + timedelta(days=offset)).isoformat() not in built]
+    for day in missing:
+        build_day(conn, day)
+    return len(missing)
+
+
+def rebuild(conn, start, end):
+    """Recompute the rosters of every day in [start, end)"""
+    for offset in range((end - start).days):
+        build_day(conn, start + timedelta(days=offset))
+
+
+def rebuild_built(conn):
+    """Recompute every roster day built so far"""
+    days = [row[0] for row in conn.execute(text("SELECT day FROM roster_day ORDER BY day"))]
+    for day in days:
+        build_day(conn, date.fromisoformat(day))
+
+
+def record_service(session, service):
+    """Add a new subscription to the built rosters, inside the caller's transaction"""
+    record_services(session, [service])
+
+
+def record_services(session, services):
+    """Add new subscriptions to the built rosters once their rows are written (flushes the session)"""
+    numbers = [service.invoice_number for service in services
+               if service.frequency in SUBSCRIPTION_FREQUENCIES]
+    if not numbers:
+        return
+    session.flush()
+    session.execute(text(ADD_SERVICE), [{'invoice_number': number, 'offset': DAY_MODIFIER} for number in numbers])
+
+
+def roster(conn, day):
+    """
+    Pujas due on a day, building the day's roster first if needed.
+
+    Returns:
+        dict: {service_type: [row mapping with ROSTER's columns, ...]} in service type order
+    """
+    ensure(conn, day, 1)
+    groups = {}
+    for row in conn.execute(text(ROSTER), {'day': day.isoformat()}).mappings():
+        groups.setdefault(row['service_type'], []).append(row)
+    return groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or print the daily puja roster")
+    parser.add_argument('command', choices=['build', 'rebuild', 'show'])
+    parser.add_argument('--start', type=date.fromisoformat, default=today(),
+                        help="First day (YYYY-MM-DD, defaults to today)")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    args = parser.parse_args()
+
+    from app import app, init_db
+    from extensions import db
+    init_db()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if args.command == 'build':
+                print(f"{ensure(conn, args.start, args.days)} roster days built")
+            elif args.command == 'rebuild':
+                rebuild(conn, args.start, args.start + timedelta(days=args.days))
+                print(f"{args.days} roster days rebuilt")
+            else:
+                for service_type, pujas in roster(conn, args.start).items():
+                    print(f"Service type {service_type}: {len(pujas)} pujas")
+                    for puja in pujas:
+                        print(f"  {puja['invoice_number']:<8} {puja['devotee_name'] or '':<30} "
+                              f"{puja['gothram'] or '':<20} {puja['puja_details'] or ''}")
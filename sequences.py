@@ -0,0 +1,142 @@
+import threading
+from sqlalchemy import text
+from extensions import db
+import metrics
+import archive
+
+# Invoice numbers look like TA0001 .. TZ9999: a one letter prefix, a series
+# letter and a four digit number. Internally every number is an ordinal
+# (0 == A0001, 9998 == A9999, 9999 == B0001, ...) so a counter row only
+# has to store a single integer.
+NUMBERS_PER_LETTER = 9999
+LETTERS = 26
+MAX_ORDINAL = NUMBERS_PER_LETTER * LETTERS
+
+
+def format_invoice_number(prefix, ordinal):
+    """Turn a sequence ordinal into an invoice number like TA0001"""
+    letter_index, offset = divmod(ordinal, NUMBERS_PER_LETTER)
+    if ordinal < 0 or letter_index >= LETTERS:
+        raise ValueError("Invoice number limit reached")
+    return f"{prefix}{chr(ord('A') + letter_index)}{offset + 1:04d}"
+
+
+def parse_invoice_number(invoice_number):
+    """Turn an invoice number like TA0001 back into its sequence ordinal"""
+    letter_index = ord(invoice_number[-5]) - ord('A')
+    return letter_index * NUMBERS_PER_LETTER + int(invoice_number[-4:]) - 1
+
+
+def number_pattern(prefix):
+    """GLOB pattern matching exactly the invoice numbers of one prefix"""
+    # A plain prefix match would also take in longer prefixes that start
+    # the same way, e.g. kiosk K1's "K1T" numbers when looking for "K"
+    return f"{prefix}[A-Z][0-9][0-9][0-9][0-9]"
+
+
+def _seed_value(conn, prefix):
+    """Next ordinal for a prefix, continuing from existing and archived service rows"""
+    # One-off scan used only the first time a prefix is seen, so databases
+    # created before the counter table keep numbering where they left off.
+    pattern = number_pattern(prefix)
+    last = conn.execute(
+        text("SELECT invoice_number FROM service WHERE invoice_number GLOB :pattern "
+             "ORDER BY invoice_number DESC LIMIT 1"),
+        {'pattern': pattern}
+    ).scalar()
+    # Numbers of archived years must not be handed out again either
+    archived = archive.last_invoice_number(conn, pattern)
+    if archived and (last is None or archived > last):
+        last = archived
+    return parse_invoice_number(last) + 1 if last else 0
+
+
+@metrics.phase('invoice_number')
+def allocate(conn, prefix, count=1):
+    """
+    Atomically reserve `count` consecutive ordinals for a prefix.
+
+    The UPDATE runs first so the write lock is taken before anything is read;
+    concurrent callers queue on the lock instead of reading the same value.
+
+    Args:
+        conn: SQLAlchemy connection or session inside an open transaction
+        prefix (str): Counter key, e.g. "T" or "R"
+        count (int): Number of ordinals to reserve
+
+    Returns:
+        range: The reserved ordinals
+    """
+    bump = text("UPDATE invoice_sequence SET next_value = next_value + :count "
+                "WHERE prefix = :prefix")
+    params = {'count': count, 'prefix': prefix}
+
+    if conn.execute(bump, params).rowcount == 0:
+        conn.execute(
+            text("INSERT OR IGNORE INTO invoice_sequence (prefix, next_value) "
+                 "VALUES (:prefix, :value)"),
+            {'prefix': prefix, 'value': _seed_value(conn, prefix)}
+        )
+        conn.execute(bump, params)
+
+    end = conn.execute(
+        text("SELECT next_value FROM invoice_sequence WHERE prefix = :prefix"),
+        {'prefix': prefix}
+    ).scalar()
+    return range(end - count, end)
+
+
+class BlockAllocator:
+    """Hands out invoice numbers from blocks reserved in advance per prefix"""
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def next_invoice_number(self, prefix):
+        """Return the next invoice number, reserving a new block when needed"""
+        with self._lock:
+            ordinal = next(self._blocks.get(prefix, iter(())), None)
+            if ordinal is None:
+                block = self._blocks[prefix] = iter(self._reserve(prefix))
+                ordinal = next(block)
+        return format_invoice_number(prefix, ordinal)
+
+    def _reserve(self, prefix):
+        # Blocks are committed on their own connection so a worker holds the
+        # database write lock only for the reservation, not for every sale.
+        with db.engine.begin() as conn:
+            return allocate(conn, prefix, self.block_size)
+
+    def reset(self):
+        """Forget any reserved blocks (unused numbers are skipped)"""
+        with self._lock:
+            self._blocks.clear()
+
+
+_block_allocators = {}
+_block_allocators_lock = threading.Lock()
+
+
+def get_block_allocator(block_size):
+    """Shared per-process allocator for the given block size"""
+    with _block_allocators_lock:
+        allocator = _block_allocators.get(block_size)
+        if allocator is None:
+            allocator = _block_allocators[block_size] = BlockAllocator(block_size)
+        return allocator
+
+
+def next_invoice_number(prefix, block_size=0):
+    """
+    Issue the next invoice number for a prefix.
+
+    With block_size 0 the counter is bumped inside the current session's
+    transaction, so a failed sale rolls the number back and no gaps appear.
+    With a block size, numbers come from a per-process reserved block.
+    """
+    if block_size:
+        return get_block_allocator(block_size).next_invoice_number(prefix)
+    ordinal = allocate(db.session, prefix)[0]
+    return format_invoice_number(prefix, ordinal)
@@ -0,0 +1,145 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+
+# Production entry point: the app behind waitress, a multi-threaded WSGI
+# server written in pure Python (so it also runs inside the Android build).
+# One process with a pool of worker threads, not pre-forked processes: the
+# report job queue, print spooler, caches and metrics all live in the app's
+# process, and SQLite only ever takes one writer at a time anyway. Writes are
+# queued on storage's in-process write lock; reads run in parallel under WAL.
+#
+# SIGTERM or SIGINT starts a graceful shutdown: /health turns 503 so a load
+# balancer stops sending traffic, no new connections are accepted, requests
+# in flight are finished for up to SHUTDOWN_TIMEOUT seconds, then queued
+# receipts are printed and background work and connections are closed.
+#
+#     python serve.py --threads 8 --port 5000
+
+DEFAULTS = {
+    'HOST': '0.0.0.0',
+    'PORT': 5000,
+    # Worker threads, i.e. requests handled at once
+    'THREADS': 8,
+    # Open connections beyond this wait in the listen backlog
+    'CONNECTION_LIMIT': 100,
+    'SHUTDOWN_TIMEOUT': 10.0,
+}
+
+
+def settings(**overrides):
+    """DEFAULTS overridden by TEMPLE_* environment variables, then by non-None arguments"""
+    result = {}
+    for key, default in DEFAULTS.items():
+        value = overrides.get(key.lower())
+        if value is None:
+            value = os.environ.get(f"TEMPLE_{key}", default)
+        result[key] = type(default)(value)
+    return result
+
+
+def create_server(app, host, port, threads, connection_limit, server_map=None):
+    """
+    A waitress server for the app, bound but not yet running.
+
+    Args:
+        server_map (dict): Socket map the server registers its channels in
+    """
+    try:
+        from waitress import create_server as create_waitress_server
+    except ImportError:
+        raise ValueError("The production server needs waitress: pip install waitress")
+    return create_waitress_server(
+        app, map=server_map if server_map is not None else {}, host=host, port=port,
+        threads=threads, connection_limit=connection_limit,
+        # Behind the kiosk WebView or a reverse proxy; do not advertise ourselves
+        ident='', clear_untrusted_proxy_headers=True,
+    )
+
+
+def _drain(server_map, deadline):
+    """Stop accepting connections and serve until no request is in flight or the deadline passes"""
+    from waitress.channel import HTTPChannel
+    from waitress.server import BaseWSGIServer
+    from waitress import wasyncore
+
+    for dispatcher in list(server_map.values()):
+        if isinstance(dispatcher, BaseWSGIServer):
+            # New connections are refused at once rather than reset at the end
+            dispatcher.accepting = False
+            dispatcher.socket.close()
+    while time.monotonic() < deadline:
+        busy = False
+        for channel in list(server_map.values()):
+            if isinstance(channel, HTTPChannel):
+                if channel.requests or channel.total_outbufs_len:
+                    busy = True
+                else:
+                    # Idle keep-alive connections are closed at the next loop
+                    channel.will_close = True
+        if not busy:
+            break
+        wasyncore.loop(timeout=0.1, map=server_map, count=1)
+
+
+def run(app, host, port, threads, connection_limit, shutdown_timeout,
+        stop=None, draining=None, on_shutdown=None):
+    """
+    Serve the app until SIGTERM or SIGINT (or until `stop` is set), then shut down gracefully.
+
+    Args:
+        stop (threading.Event): Set to stop serving; signal handlers are only
+            installed when this is omitted (they need the main thread)
+        draining (threading.Event): Set when the shutdown starts
+        on_shutdown (callable): on_shutdown(timeout), run after the last request
+    """
+    from waitress import wasyncore
+
+    server_map = {}
+    server = create_server(app, host, port, threads, connection_limit, server_map)
+    if stop is None:
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: stop.set())
+    server.print_listen("Serving on http://{}:{}")
+
+    while not stop.is_set():
+        wasyncore.loop(timeout=0.2, map=server_map, count=1)
+
+    started = time.monotonic()
+    if draining is not None:
+        draining.set()
+    _drain(server_map, started + shutdown_timeout)
+    remaining = max(started + shutdown_timeout - time.monotonic(), 0.1)
+    server.task_dispatcher.shutdown(timeout=remaining)
+    wasyncore.close_all(server_map)
+    if on_shutdown is not None:
+        on_shutdown(max(started + shutdown_timeout - time.monotonic(), 1.0))
+    logging.getLogger('waitress').info("Stopped after %.1f s of draining", time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the temple counter app on a production WSGI server")
+    parser.add_argument('--host', help=f"Address to listen on (default {DEFAULTS['HOST']})")
+    parser.add_argument('--port', type=int, help=f"Port to listen on (default {DEFAULTS['PORT']})")
+    parser.add_argument('--threads', type=int, help=f"Worker threads (default {DEFAULTS['THREADS']})")
+    parser.add_argument('--connection-limit', type=int,
+                        help=f"Open connections accepted at once (default {DEFAULTS['CONNECTION_LIMIT']})")
+    parser.add_argument('--shutdown-timeout', type=float,
+                        help=f"Seconds to finish requests on shutdown (default {DEFAULTS['SHUTDOWN_TIMEOUT']})")
+    args = parser.parse_args()
+    options = settings(**vars(args))
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    from app import app, init_db, draining, shutdown
+    init_db()
+    run(app, options['HOST'], options['PORT'], options['THREADS'],
+        options['CONNECTION_LIMIT'], options['SHUTDOWN_TIMEOUT'],
+        draining=draining, on_shutdown=shutdown)
+
+
+if __name__ == '__main__':
+    main()
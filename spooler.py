@@ -0,0 +1,295 @@
+import collections
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+import metrics
+import receipts
+
+# Local print spooler. Sales hand their print payload to submit() and return
+# at once; one background thread renders the receipts (see receipts.py) and
+# writes them to the printer in batches, so a burst of tokens becomes one
+# write to the device instead of one per sale. A printer that is off, out of
+# paper or unplugged fails the write; the batch is retried with exponential
+# backoff and jobs that still fail stay listed as failed for a reprint.
+#
+# Delivery is at least once: a batch that failed half way through is sent
+# again in full, which can repeat a slip rather than lose one.
+
+# Finished jobs are kept this long for the status endpoint, as in jobs.py
+JOB_RETENTION_SECONDS = 3600
+
+# Throughput is reported over this trailing window
+RATE_WINDOW_SECONDS = 60
+
+
+class PrintQueueFull(Exception):
+    """Raised when too many print jobs are already waiting"""
+
+
+class PrintJob:
+    """One sale's receipt (or a bulk sale's tokens) on its way to the printer"""
+
+    def __init__(self, data):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.status = 'queued'
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def receipts(self):
+        """Slips in the job; a receipt counts once though it prints two copies"""
+        return len(self.data) if isinstance(self.data, list) else 1
+
+    @property
+    def name(self):
+        first = self.data[0] if isinstance(self.data, list) else self.data
+        return first.get('invoiceNumber') or self.id
+
+    def to_dict(self):
+        return {
+            'printJobId': self.id,
+            'status': self.status,
+            'receipts': self.receipts,
+            'attempts': self.attempts,
+            'error': self.error
+        }
+
+
+class FileSink:
+    """Writes every job to its own file in a directory, e.g. for a print folder or tests"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, jobs, payloads, extension):
+        for job, payload in zip(jobs, payloads):
+            # Written under a temporary name and renamed, so a watcher never
+            # picks up half a file; a retried job overwrites its own file
+            target = os.path.join(self.directory, f"{job.name}-{job.id[:8]}.{extension}")
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(payload)
+            os.replace(temp_path, target)
+
+    def __str__(self):
+        return f"file://{self.directory}"
+
+
+class DeviceSink:
+    """Writes the batch in one go to a printer device such as /dev/usb/lp0"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, jobs, payloads, extension):
+        with open(self.path, 'ab', buffering=0) as handle:
+            handle.write(b''.join(payloads))
+
+    def __str__(self):
+        return self.path
+
+
+class SocketSink:
+    """Sends the batch over one connection to a network printer's raw port (9100)"""
+
+    def __init__(self, host, port=9100, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def write(self, jobs, payloads, extension):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+            connection.sendall(b''.join(payloads))
+
+    def __str__(self):
+        return f"tcp://{self.host}:{self.port}"
+
+
+def open_sink(target):
+    """
+    The sink for a PRINTER setting.
+
+    Args:
+        target (str): tcp://host[:port], file:///directory or a device path
+    """
+    parsed = urlparse(target)
+    if parsed.scheme == 'tcp':
+        return SocketSink(parsed.hostname, parsed.port or 9100)
+    if parsed.scheme == 'file':
+        return FileSink(parsed.path)
+    if parsed.scheme:
+        raise ValueError(f"Unsupported printer {target}; use tcp://, file:// or a device path")
+    return DeviceSink(target)
+
+
+class PrintSpooler:
+    """
+    Background print queue with batching and retries.
+
+    Up to `batch_size` jobs that arrive within `batch_wait` seconds of each
+    other are rendered and written together. A failed write is retried up to
+    `max_attempts` times, waiting `retry_delay` seconds and doubling.
+    """
+
+    def __init__(self, sink, fmt='escpos', batch_size=20, batch_wait=0.05,
+                 max_attempts=5, retry_delay=0.5, max_pending=500):
+        if fmt not in receipts.FORMATS:
+            raise ValueError(f"Print format must be one of {', '.join(receipts.FORMATS)}")
+        self.sink = sink
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._printed = collections.deque()
+        self._totals = collections.Counter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='print-spooler', daemon=True)
+        self._thread.start()
+
+    def submit(self, data):
+        """
+        Queue a print payload (or a list of token payloads) for printing.
+
+        Returns:
+            PrintJob: The queued job
+        """
+        if self._queue.qsize() >= self.max_pending:
+            raise PrintQueueFull("Too many receipts are waiting for the printer")
+        job = PrintJob(data)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        """Jobs waiting for or being written to the printer"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished_at is None)
+
+    def receipts_per_minute(self):
+        """Receipts printed over the last RATE_WINDOW_SECONDS, per minute"""
+        with self._lock:
+            self._trim(time.monotonic())
+            count = sum(count for _, count in self._printed)
+        return count * 60 / RATE_WINDOW_SECONDS
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+        return {
+            'printer': str(self.sink),
+            'format': self.fmt,
+            'pending': self.pending(),
+            'printed': totals.get('printed', 0),
+            'failed': totals.get('failed', 0),
+            'receiptsPerMinute': round(self.receipts_per_minute(), 1)
+        }
+
+    def shutdown(self, wait=True, timeout=None):
+        """Stop the spooler; with wait, print what is queued first, retries included"""
+        if not wait:
+            # Whatever is left fails at its next error instead of backing off
+            self._stopping.set()
+        self._queue.put(None)
+        if wait:
+            self._thread.join(timeout)
+
+    def _trim(self, now):
+        while self._printed and self._printed[0][0] < now - RATE_WINDOW_SECONDS:
+            self._printed.popleft()
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _next_batch(self):
+        job = self._queue.get()
+        if job is None:
+            return None
+        batch = [job]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Print this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._print(batch)
+
+    def _print(self, batch):
+        started = time.perf_counter()
+        extension = receipts.FORMATS[self.fmt][1]
+        jobs, payloads = [], []
+        for job in batch:
+            job.status = 'printing'
+            try:
+                payloads.append(receipts.render(job.data, self.fmt))
+                jobs.append(job)
+            except Exception as e:
+                # Retrying cannot fix a payload that does not render
+                self._finish([job], 'failed', f"Could not render: {e}")
+
+        for attempt in range(self.max_attempts):
+            if not jobs:
+                break
+            for job in jobs:
+                job.attempts = attempt + 1
+            try:
+                self.sink.write(jobs, payloads, extension)
+            except OSError as e:
+                error = str(e) or type(e).__name__
+                if attempt + 1 < self.max_attempts and not self._stopping.is_set():
+                    time.sleep(self.retry_delay * 2 ** attempt)
+                    continue
+                self._finish(jobs, 'failed', error)
+            else:
+                self._finish(jobs, 'printed')
+            break
+        metrics.PRINT_BATCH_SECONDS.observe(time.perf_counter() - started, self.fmt)
+
+    def _finish(self, jobs, status, error=None):
+        now = time.time()
+        count = sum(job.receipts for job in jobs)
+        for job in jobs:
+            job.status = status
+            job.error = error
+            job.finished_at = now
+        with self._lock:
+            self._totals[status] += count
+            if status == 'printed':
+                self._trim(time.monotonic())
+                self._printed.append((time.monotonic(), count))
+        metrics.PRINTED_RECEIPTS.inc(self.fmt, status, amount=count)
@@ -0,0 +1,97 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Startup phase timings for the kiosk. main.py marks each phase as it
+# finishes; with TEMPLE_PROFILE_STARTUP=1 the breakdown is printed once the
+# WebView is shown. Run this file directly for an import-time breakdown of
+# the Flask app and the cost of each init step.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENABLED = bool(os.environ.get('TEMPLE_PROFILE_STARTUP'))
+
+_started = time.perf_counter()
+_marks = []
+
+
+def mark(label):
+    """Record that a startup phase has just finished"""
+    _marks.append((label, time.perf_counter()))
+
+
+def report(out=None):
+    """Print each phase's duration and the total since this module was imported"""
+    if not ENABLED:
+        return
+    out = out or sys.stderr
+    previous = _started
+    for label, at in _marks:
+        print(f"startup: {label:<24} {(at - previous) * 1000:8.1f} ms", file=out)
+        previous = at
+    print(f"startup: {'total':<24} {(previous - _started) * 1000:8.1f} ms", file=out)
+
+
+def import_breakdown(module='app'):
+    """
+    Import a module in a fresh interpreter under -X importtime.
+
+    Returns:
+        tuple: (total microseconds, [(top-level package, self microseconds)] largest first)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    packages = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name.strip() == module:
+            total = int(cumulative_us)
+    return total, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_init():
+    """Time importing the app, init_db() and the first requests, in this process"""
+    timings = []
+
+    def timed(label, step):
+        start = time.perf_counter()
+        value = step()
+        timings.append((label, time.perf_counter() - start))
+        return value
+
+    flask_app = timed('import app', lambda: __import__('app'))
+    timed('init_db()', flask_app.init_db)
+    client = flask_app.app.test_client()
+    timed('first GET /ready', lambda: client.get('/ready'))
+    timed('first GET /', lambda: client.get('/'))
+    # Deferred until the first report; shown so the saving is visible
+    timed('report stack (pandas)', lambda: (__import__('pandas'), __import__('openpyxl')))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print an import-time and init breakdown of the app")
+    parser.add_argument('--module', default='app', help="Module to profile imports for")
+    parser.add_argument('--top', type=int, default=15, help="Number of packages to list")
+    parser.add_argument('--database', help="Database file to initialise (defaults to the configured one)")
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['TEMPLE_DATABASE_PATH'] = os.path.abspath(args.database)
+
+    total, packages = import_breakdown(args.module)
+    print(f"import {args.module}: {total / 1000:.1f} ms (fresh interpreter)")
+    for package, self_us in packages[:args.top]:
+        print(f"  {package:<28} {self_us / 1000:8.1f} ms")
+
+    print("init:")
+    for label, seconds in profile_init():
+        print(f"  {label:<28} {seconds * 1000:8.1f} ms")
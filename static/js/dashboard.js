@@ -0,0 +1,456 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const serviceModal = document.getElementById('serviceModal');
+    const serviceCards = document.querySelectorAll('.service-card');
+    const selectedServiceTitle = document.getElementById('selectedServiceTitle');
+    const templeServiceForm = document.getElementById('templeServiceForm');
+    const includeAddress = document.getElementById('includeAddress');
+    const addressFields = document.getElementById('addressFields');
+    const devoteeDetails = document.getElementById('additionalDetails');
+    const frequencySection = document.getElementById('frequencySection');
+    const frequencyInputs = document.querySelectorAll('input[name="frequency"]');
+    let currentServiceId = null;
+    let currentServicePrice = 0;
+
+// Service card click handler
+serviceCards.forEach(card => {
+    card.addEventListener('click', () => {
+        const serviceId = card.dataset.serviceId;
+        const serviceName = card.dataset.serviceName.replace(/_/g, ' ').toLowerCase()
+                              .replace(/\b\w/g, c => c.toUpperCase());
+        currentServiceId = serviceId;
+        currentServicePrice = parseFloat(card.dataset.servicePrice);
+
+        // Update modal title
+        selectedServiceTitle.textContent = serviceName;
+        document.getElementById('serviceType').value = serviceId;
+
+        // Reset form
+        templeServiceForm.reset();
+
+        // Update form fields based on service type
+        updateFormFields(serviceId);
+        updateAmount();
+
+        // Show the modal
+        const serviceModalInstance = new bootstrap.Modal(serviceModal);
+        serviceModalInstance.show();
+    });
+});
+    // Toggle address fields
+    includeAddress.addEventListener('change', (e) => {
+        addressFields.style.display = e.target.checked ? 'block' : 'none';
+    });
+
+    // Suggest known devotees while a name or phone number is typed
+    let lookupTimer = null;
+    let lookupController = null;
+
+    function attachDevoteeLookup(input, list) {
+        input.addEventListener('input', () => {
+            clearTimeout(lookupTimer);
+            const query = input.value.trim();
+            if (query.length < 2) {
+                list.replaceChildren();
+                return;
+            }
+            lookupTimer = setTimeout(() => lookupDevotees(query, list), 120);
+        });
+        input.addEventListener('blur', () => setTimeout(() => list.replaceChildren(), 150));
+    }
+
+    async function lookupDevotees(query, list) {
+        // Only the latest keystroke's answer matters
+        if (lookupController) lookupController.abort();
+        lookupController = new AbortController();
+        try {
+            const response = await fetch(`/devotees/lookup?q=${encodeURIComponent(query)}`,
+                                         { signal: lookupController.signal });
+            if (!response.ok) return;
+            const result = await response.json();
+            list.replaceChildren(...result.devotees.map(devotee => {
+                const item = document.createElement('button');
+                item.type = 'button';
+                item.className = 'list-group-item list-group-item-action';
+                item.textContent = [devotee.devoteeName, devotee.devoteeContactNum, devotee.gothram]
+                    .filter(Boolean).join(' · ');
+                item.addEventListener('mousedown', (e) => {
+                    e.preventDefault();
+                    fillDevotee(devotee);
+                    list.replaceChildren();
+                });
+                return item;
+            }));
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Devotee lookup failed:', error);
+        }
+    }
+
+    function fillDevotee(devotee) {
+        document.getElementById('devoteeName').value = devotee.devoteeName || '';
+        document.getElementById('devoteeContactNum').value = devotee.devoteeContactNum || '';
+        document.getElementById('gothram').value = devotee.gothram || '';
+        if (devotee.address) {
+            includeAddress.checked = true;
+            addressFields.style.display = 'block';
+            Object.entries(devotee.address).forEach(([field, value]) => {
+                const input = templeServiceForm.querySelector(`[name="address[${field}]"]`);
+                if (input) input.value = value || '';
+            });
+        }
+    }
+
+    attachDevoteeLookup(document.getElementById('devoteeName'), document.getElementById('nameSuggestions'));
+    attachDevoteeLookup(document.getElementById('devoteeContactNum'), document.getElementById('phoneSuggestions'));
+
+    // Update amount when frequency changes
+    frequencyInputs.forEach(input => {
+        input.addEventListener('change', () => {
+            updateFormFields(currentServiceId);
+            updateAmount();
+        });
+    });
+
+    // Update form fields based on service type and frequency
+    function updateFormFields(serviceId) {
+        const isAbhishekam = serviceId === '1';
+        const isArchana = serviceId === '2';
+        const frequencyValue = document.querySelector('input[name="frequency"]:checked')?.value;
+
+        // Handle invoice type internally
+        const invoiceTypeInput = document.getElementById('invoiceType');
+
+        if (isAbhishekam) {
+            // Show frequency for Abhishekam
+            frequencySection.style.display = 'block';
+            // Set invoice type based on frequency
+            invoiceTypeInput.value = frequencyValue === 'SINGLE' ? 'TOKEN' : 'RECEIPT';
+            // Show additional details for weekly/monthly
+            devoteeDetails.style.display = frequencyValue === 'SINGLE' ? 'none' : 'block';
+        } else if (isArchana) {
+            // Hide frequency for Archana
+            frequencySection.style.display = 'none';
+            // Always token for Archana
+            invoiceTypeInput.value = 'TOKEN';
+            // Hide additional details
+            devoteeDetails.style.display = 'none';
+        } else {
+            // Hide frequency for other services
+            frequencySection.style.display = 'none';
+            // Always receipt for other services
+            invoiceTypeInput.value = 'RECEIPT';
+            // Show additional details
+            devoteeDetails.style.display = 'block';
+        }
+
+        // Update required fields
+        const nameInput = document.getElementById('devoteeName');
+        const gothramInput = document.getElementById('gothram');
+        const pujaDetailsInput = document.getElementById('pujaDetails');
+
+        const requireFields = devoteeDetails.style.display === 'block';
+        nameInput.required = requireFields;
+        gothramInput.required = requireFields;
+        pujaDetailsInput.required = requireFields;
+
+        // Several tokens can be issued at once; receipts are one per devotee
+        const isToken = invoiceTypeInput.value === 'TOKEN';
+        document.getElementById('quantitySection').style.display = isToken ? 'block' : 'none';
+        if (!isToken) {
+            document.getElementById('quantity').value = 1;
+        }
+    }
+
+    // Update amount based on frequency
+    function updateAmount() {
+        let finalAmount = currentServicePrice;
+
+        if (frequencySection.style.display === 'block') {
+            const frequency = document.querySelector('input[name="frequency"]:checked').value;
+            if (frequency === 'WEEKLY') {
+                finalAmount *= 7;
+            } else if (frequency === 'MONTHLY') {
+                finalAmount *= 30;
+            }
+        }
+
+        document.getElementById('amount').textContent = finalAmount.toFixed(2);
+    }
+
+    // Form submission
+    templeServiceForm.addEventListener('submit', async function (e) {
+        e.preventDefault();
+
+        const formData = new FormData(this);
+        const data = {};
+
+        // Extract service type first
+        const serviceType = formData.get('serviceType');
+
+        // Build data object
+        formData.forEach((value, key) => {
+            if (key.startsWith('address[')) {
+                const addressKey = key.match(/\[(.*?)\]/)[1];
+                if (!data.address) data.address = {};
+                if (value) data.address[addressKey] = value;
+            } else if (key !== 'serviceType' && key !== 'quantity') { // Skip serviceType as it goes in URL
+                data[key] = value;
+            }
+        });
+
+        // More than one token goes through the bulk endpoint in a single request
+        const quantity = parseInt(formData.get('quantity') || '1', 10);
+        const isBulk = data.invoiceType === 'TOKEN' && quantity > 1;
+        if (isBulk) {
+            data.items = [{ serviceType: parseInt(serviceType, 10), quantity: quantity }];
+        }
+
+        try {
+            const url = isBulk ? '/temple-management/services/bulk'
+                : `/temple-management/services?serviceType=${serviceType}`;
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(data)
+            });
+
+            const result = await response.json();
+            console.log('Server Response:', result); // Debug log
+
+            if (response.ok) {
+                // Hide service modal
+                const serviceModalInstance = bootstrap.Modal.getInstance(serviceModal);
+                serviceModalInstance.hide();
+
+                // Store print data
+                const printData = isBulk ? result.printData : {
+                    invoiceType: data.invoiceType,
+                    invoiceNumber: result.id,
+                    serviceName: result.serviceName,
+                    gothram: result.gothram,
+                    devoteeName: result.devoteeName,
+                    pujaDetails: result.pujaDetails,
+                    address: result.address,
+                    amount: result.amount,
+                    validTill: result.validTill
+                };
+                document.getElementById('printData').value = JSON.stringify(printData);
+
+                // The server already sent it to the receipt printer; the
+                // preview button still offers the browser print dialog
+                if (!result.printJob) {
+                    updatePrintPreview(printData);
+                }
+
+                // Reset form
+                templeServiceForm.reset();
+            } else {
+                throw new Error(result.message || 'Failed to create service');
+            }
+        } catch (error) {
+            document.getElementById('errorMessage').textContent = error.message;
+            const errorModal = new bootstrap.Modal(document.getElementById('errorModal'));
+            errorModal.show();
+        }
+    });
+
+    // Form validation
+    function validateForm() {
+        const requiredFields = templeServiceForm.querySelectorAll('[required]');
+        let isValid = true;
+
+        requiredFields.forEach(field => {
+            if (!field.value) {
+                field.classList.add('is-invalid');
+                isValid = false;
+            } else {
+                field.classList.remove('is-invalid');
+            }
+        });
+
+        return isValid;
+    }
+
+    // Print preview functions
+    function updatePrintPreview(printData) {
+        console.log('Print Preview Data:', printData); // Debug log
+
+        if (!printData) {
+            printData = JSON.parse(document.getElementById('printData').value);
+        }
+
+        // Clear both previews
+        document.getElementById('tokenPreview').classList.add('d-none');
+        document.getElementById('receiptPreview').classList.add('d-none');
+
+        // A bulk issue returns a list of tokens; print one token slip each
+        const tokens = Array.isArray(printData) ? printData : [printData];
+        if (tokens[0].invoiceType === 'TOKEN') {
+            // Token preview (55mm)
+            const tokenPreview = document.getElementById('tokenPreview');
+            tokenPreview.classList.remove('d-none');
+            const slips = tokenPreview.querySelectorAll('.token-print');
+            slips.forEach((slip, index) => { if (index > 0) slip.remove(); });
+            tokens.forEach((token, index) => {
+                const slip = index === 0 ? slips[0] : slips[0].cloneNode(true);
+                slip.querySelector('.service-name').textContent = token.serviceName;
+                slip.querySelector('.token-number').textContent = token.invoiceNumber;
+                slip.querySelector('.valid-till').textContent = `Valid till: ${formatDateToIndian(token.validTill)}`;
+                slip.querySelector('.amount').textContent = `₹${token.amount}/-`;
+                if (index > 0) tokenPreview.appendChild(slip);
+            });
+        } else {
+            // Receipt preview (Full A4)
+            const receiptPreview = document.getElementById('receiptPreview');
+            receiptPreview.classList.remove('d-none');
+            // Update both copies
+            const receiptCopies = receiptPreview.querySelectorAll('.receipt-copy');
+            receiptCopies.forEach(copy => {
+                copy.querySelector('.service-name').textContent = printData.serviceName;
+                copy.querySelector('.receipt-value').textContent = printData.invoiceNumber || '';
+                copy.querySelector('.gothram-value').textContent = printData.gothram || '';
+                copy.querySelector('.devotee-value').textContent = printData.devoteeName || '';
+                copy.querySelector('.puja-value').textContent = printData.pujaDetails || '';
+
+                // Format address
+                const address = printData.address;
+                const formattedAddress = address ?
+                    `${address.address1 || ''} ${address.address2 || ''} ${address.address3 || ''} ${address.address4 || ''}\n` +
+                    `${address.city || ''} ${address.district || ''} ${address.state || ''} ${address.pincode || ''}`
+                    : '';
+                copy.querySelector('.address-value').textContent = formattedAddress;
+
+                // Convert amount to words
+                const amountInWords = numberToWords(printData.amount);
+                copy.querySelector('.amount-words-value').textContent = `${amountInWords} rupees only`;
+
+                // Format amount with currency symbol
+                copy.querySelector('.amount-value').textContent = `₹${printData.amount}/-`;
+            });
+        }
+
+        // Hide success modal and show print preview modal
+        const successModal = bootstrap.Modal.getInstance(document.getElementById('successModal'));
+        const printPreviewModal = new bootstrap.Modal(document.getElementById('printPreviewModal'));
+
+        if (successModal) {
+            successModal.hide();
+        }
+        printPreviewModal.show();
+    }
+
+    // Format date to Indian format (DD/MM/YYYY)
+    function formatDateToIndian(dateString) {
+        const date = new Date(dateString);
+        const day = String(date.getDate()).padStart(2, '0');
+        const month = String(date.getMonth() + 1).padStart(2, '0');
+        const year = date.getFullYear();
+        return `${day}/${month}/${year}`;
+    }
+
+    // Helper function to convert number to words
+    function numberToWords(number) {
+        const units = ['', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen'];
+        const tens = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety'];
+
+        if (number === 0) return 'Zero';
+
+        function convert(n) {
+            if (n < 20) return units[n];
+            if (n < 100) return tens[Math.floor(n / 10)] + (n % 10 ? ' ' + units[n % 10] : '');
+            if (n < 1000) return units[Math.floor(n / 100)] + ' Hundred' + (n % 100 ? ' and ' + convert(n % 100) : '');
+            if (n < 100000) return convert(Math.floor(n / 1000)) + ' Thousand' + (n % 1000 ? ' ' + convert(n % 1000) : '');
+            return convert(Math.floor(n / 100000)) + ' Lakh' + (n % 100000 ? ' ' + convert(n % 100000) : '');
+        }
+
+        return convert(number);
+    }
+
+    // Print document function
+    function printDocument() {
+        const printWindow = window.open('', '_blank');
+        const isToken = document.getElementById('tokenPreview').classList.contains('d-none') === false;
+        const content = document.getElementById(isToken ? 'tokenPreview' : 'receiptPreview').cloneNode(true);
+
+        // Copy all styles from the page
+        const styles = Array.from(document.querySelectorAll('style, link[rel="stylesheet"]'))
+            .map(el => el.outerHTML)
+            .join('\n');
+
+        printWindow.document.write(`
+    <html>
+        <head>
+            <title>Print</title>
+            ${styles}
+            <style>
+                @page {
+                    size: ${isToken ? '55mm auto' : 'A4 portrait'};
+                    margin: 10mm;
+                }
+                body {
+                    margin: 0;
+                    padding: 10mm;
+                }
+                .receipt-print {
+                    width: ${isToken ? '45mm' : '190mm'};
+                    margin: 0 auto;
+                }
+                .receipt-copy {
+                    page-break-after: avoid;
+                }
+            </style>
+        </head>
+        <body>
+            ${content.innerHTML}
+        </body>
+    </html>
+`);
+        printWindow.document.close();
+        printWindow.print();
+    }
+
+    // Add click handler for print preview button
+    document.getElementById('printPreviewBtn').addEventListener('click', function () {
+        const printData = JSON.parse(document.getElementById('printData').value);
+        updatePrintPreview(printData);
+    });
+    document.querySelector('[onclick="printDocument()"]').addEventListener('click', printDocument);
+
+    // Set current month in the report dropdown
+    const currentMonth = new Date().getMonth() + 1; // JavaScript months are 0-indexed
+    document.getElementById('reportMonth').value = currentMonth;
+
+    // Add click handler for report generation
+    document.getElementById('generateReportBtn').addEventListener('click', async function () {
+        const month = document.getElementById('reportMonth').value;
+        const year = document.getElementById('reportYear').value;
+        const button = this;
+        const label = button.innerHTML;
+
+        // Build the report in the background so the counter stays responsive
+        button.disabled = true;
+        try {
+            const response = await fetch(`/reports/jobs?year=${year}&month=${month}`, { method: 'POST' });
+            let job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.message);
+            }
+            const downloadUrl = job.downloadUrl;
+            while (job.status === 'queued' || job.status === 'running') {
+                button.innerHTML = `<i class="bi bi-hourglass-split"></i> ${Math.round(job.progress * 100)}%`;
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await (await fetch(job.statusUrl || `/reports/jobs/${job.jobId}`)).json();
+            }
+            if (job.status !== 'done') {
+                throw new Error(job.error || job.message);
+            }
+            window.location.href = downloadUrl;
+        } catch (error) {
+            alert(`Error generating report: ${error.message}`);
+        } finally {
+            button.disabled = false;
+            button.innerHTML = label;
+        }
+    });
+});
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Single owner of the SQLite database: where it lives, how connections are
+# pooled and which PRAGMAs every connection gets. The app's SQLAlchemy engine
+# and the report engine's read-only sqlite3 connections both come from here,
+# so they always agree on the file and never block each other under WAL.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULTS = {
+    # Resolved against this directory, never the process working directory
+    'DATABASE_PATH': 'temple.db',
+    # WAL lets report reads run alongside counter writes
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    # FULL syncs every commit; NORMAL is faster on SD cards but a power cut
+    # can lose the last few sales
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_CACHE_SIZE_KB': 8192,
+    'SQLITE_MMAP_SIZE': 64 * 1024 * 1024,
+    'SQLITE_POOL_SIZE': 5,
+    # 1 makes the app's write transactions queue on an in-process lock; 0
+    # leaves concurrent writers to SQLite's busy timeout
+    'SQLITE_SERIALIZE_WRITES': 1,
+    # Closed years moved out by archive.py, relative to the database's directory
+    'ARCHIVE_DIR': 'archive',
+    # Columnar snapshot of the services for trend queries (analytics.py)
+    'ANALYTICS_DIR': 'analytics',
+}
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+settings = dict(DEFAULTS)
+settings['DATABASE_PATH'] = os.path.join(BASE_DIR, DEFAULTS['DATABASE_PATH'])
+
+
+def database_path(path=None):
+    """Absolute path of the database file"""
+    return os.path.join(BASE_DIR, path or settings['DATABASE_PATH'])
+
+
+def configure(app):
+    """
+    Point the app's SQLAlchemy engine at the database with pooled, tuned connections.
+
+    Settings are read from app.config (falling back to TEMPLE_* environment
+    variables, then DEFAULTS) and remembered for connect_readonly().
+    """
+    for key, default in DEFAULTS.items():
+        value = app.config.get(key, os.environ.get(f"TEMPLE_{key}", default))
+        settings[key] = type(default)(value)
+        app.config[key] = settings[key]
+    if settings['SQLITE_SYNCHRONOUS'].upper() not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+    settings['DATABASE_PATH'] = database_path(settings['DATABASE_PATH'])
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{settings['DATABASE_PATH']}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        # SQLAlchemy 1.4 opens a new connection per checkout for file
+        # databases; a small pool keeps page cache and mmap warm between requests
+        'poolclass': QueuePool,
+        'pool_size': settings['SQLITE_POOL_SIZE'],
+        'max_overflow': settings['SQLITE_POOL_SIZE'],
+        'pool_pre_ping': False,
+        'connect_args': {
+            'check_same_thread': False,
+            'timeout': settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+        },
+    }
+
+
+def apply_pragmas(conn, readonly=False):
+    """Apply the configured PRAGMAs to a new DB-API connection"""
+    cursor = conn.cursor()
+    if not readonly:
+        # journal_mode is stored in the file; only a writer may change it
+        cursor.execute(f"PRAGMA journal_mode = {settings['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(settings['SQLITE_BUSY_TIMEOUT_MS'])}")
+    cursor.execute(f"PRAGMA synchronous = {settings['SQLITE_SYNCHRONOUS'].upper()}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size = -{int(settings['SQLITE_CACHE_SIZE_KB'])}")
+    cursor.execute(f"PRAGMA mmap_size = {int(settings['SQLITE_MMAP_SIZE'])}")
+    if readonly:
+        cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+# Statements that make pysqlite open a write transaction
+WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# SQLite allows one writer at a time. Left to itself, a second writer polls
+# with growing sleeps inside busy_timeout and fails with "database is locked"
+# when the timeout runs out; queueing writers on a lock in the process hands
+# the database over the moment the previous transaction ends instead. The
+# lock is taken at a transaction's first write (reads never wait for it) and
+# released once its COMMIT or ROLLBACK has finished.
+_write_lock = threading.Lock()
+_write_holder = None
+
+
+def _raw_connection(connection):
+    # The pool hands out proxies; the events see the sqlite3 connection itself
+    return getattr(connection, 'dbapi_connection', None) or getattr(connection, 'connection', connection)
+
+
+def _take_write_lock(conn, cursor, statement, parameters, context, executemany):
+    global _write_holder
+    if _write_holder is cursor.connection:
+        return
+    if statement.lstrip()[:7].upper().startswith(WRITE_VERBS):
+        # Past the busy timeout the statement goes ahead and SQLite decides,
+        # as without the lock
+        if _write_lock.acquire(timeout=settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000):
+            _write_holder = cursor.connection
+
+
+def _drop_write_lock(dbapi_connection, *args):
+    global _write_holder
+    if _write_holder is not None and _write_holder is _raw_connection(dbapi_connection):
+        _write_holder = None
+        _write_lock.release()
+
+
+def _release_write_lock(end_transaction):
+    def ended(dbapi_connection):
+        try:
+            end_transaction(dbapi_connection)
+        finally:
+            _drop_write_lock(dbapi_connection)
+    return ended
+
+
+def install(engine):
+    """Apply the PRAGMAs to every connection the engine opens, and serialize its writers"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', lambda dbapi_conn, record: apply_pragmas(dbapi_conn))
+        if settings['SQLITE_SERIALIZE_WRITES']:
+            event.listen(engine, 'before_cursor_execute', _take_write_lock)
+            engine.dialect.do_commit = _release_write_lock(engine.dialect.do_commit)
+            engine.dialect.do_rollback = _release_write_lock(engine.dialect.do_rollback)
+            # A connection discarded after an error never reaches ROLLBACK
+            event.listen(engine, 'invalidate', _drop_write_lock)
+            event.listen(engine, 'close', _drop_write_lock)
+    return engine
+
+
+def archive_dir(path=None):
+    """Directory the yearly archives of a database live in"""
+    return os.path.join(os.path.dirname(database_path(path)), settings['ARCHIVE_DIR'])
+
+
+def analytics_dir(path=None):
+    """Directory the analytics snapshot of a database lives in"""
+    return os.path.join(os.path.dirname(database_path(path)), settings['ANALYTICS_DIR'])
+
+
+def connect(path=None):
+    """Open a writable sqlite3 connection with the PRAGMAs, for maintenance jobs"""
+    conn = sqlite3.connect(database_path(path), timeout=settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+                           isolation_level=None)
+    apply_pragmas(conn)
+    return conn
+
+
+def connect_readonly(path=None, prepare=None):
+    """
+    Open a read-only sqlite3 connection for reports and exports.
+
+    It is kept apart from the writer's pool; with WAL it reads a snapshot
+    and never holds up a sale being committed.
+
+    Args:
+        path (str): Database file (defaults to the configured database)
+        prepare (callable): prepare(conn), run before the connection is made
+            query-only, e.g. to attach archives and create TEMP views
+    """
+    uri = f"file:{quote(database_path(path))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=settings['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    if prepare:
+        prepare(conn)
+    apply_pragmas(conn, readonly=True)
+    return conn
@@ -0,0 +1,374 @@
+import argparse
+import gzip
+import hmac
+import json
+import logging
+import re
+import threading
+import urllib.error
+import urllib.request
+import zlib
+from datetime import datetime
+from sqlalchemy import text
+from extensions import db
+from models import Service
+import rollups
+import devotees
+import roster
+
+# Offline counter sync. Every kiosk sells against its own temple.db and
+# pushes its new sales to a central node whenever it can reach it; the
+# central node ends up with every device's services for reports.
+#
+# An AFTER INSERT trigger appends each new service to sync_log, whose
+# AUTOINCREMENT seq only grows. A device remembers, per central node, the
+# highest seq it has had acknowledged (sync_state) and pushes the rows after
+# it in gzip-compressed batches, so a push reads only new rows however big
+# the service table is. The central node keeps each device's acknowledged
+# seq (sync_peer). Batches are applied in one transaction and rows whose
+# invoice number is already there are skipped, so a batch sent again after
+# a lost response is acknowledged without being applied twice.
+#
+# Invoice numbers are the natural key across nodes. Each kiosk is given its
+# own DEVICE_ID, which starts every number it issues (K1TA0001), so devices
+# never hand out the same number; the central node keeps the plain prefixes.
+#
+# Only inserts are replicated: services are never edited, and archiving
+# (archive.py) is done on each node separately. A kiosk cannot archive a
+# year until its services have been pushed: the change log is read joined
+# to the hot service table.
+
+log = logging.getLogger(__name__)
+
+# Up to three capital letters or digits; see Service.invoice_prefix
+DEVICE_ID_PATTERN = re.compile(r'[A-Z0-9]{1,3}')
+
+TOKEN_HEADER = 'X-Sync-Token'
+
+# Largest batch a central node accepts, in rows and uncompressed bytes
+MAX_BATCH_ROWS = 5000
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+# Service columns that travel; ids are local to each database
+COLUMNS = tuple(column.name for column in Service.__table__.columns
+                if column.name not in ('id', 'devotee_id'))
+DATETIME_COLUMNS = {column.name for column in Service.__table__.columns
+                    if isinstance(column.type, db.DateTime)}
+
+# Created by migration 6. Services inserted before it are logged once by the
+# backfill, so a device that sold before sync was set up pushes its history.
+BACKFILL_LOG = "INSERT INTO sync_log (service_id) SELECT id FROM service ORDER BY id"
+LOG_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS tr_service_sync_log AFTER INSERT ON service "
+    "BEGIN INSERT INTO sync_log (service_id) VALUES (NEW.id); END"
+)
+
+PENDING = (
+    "SELECT l.seq, " + ", ".join(f"s.{column}" for column in COLUMNS) + " FROM sync_log l "
+    # Services archived or removed since they were logged come back as NULLs
+    "LEFT JOIN service s ON s.id = l.service_id "
+    "WHERE l.seq > :after ORDER BY l.seq LIMIT :limit"
+)
+
+
+def check_device_id(device_id, required=False):
+    """Raise ValueError unless device_id is usable as an invoice number prefix"""
+    if not device_id:
+        if required:
+            raise ValueError("Set DEVICE_ID to this kiosk's own id before syncing")
+        return
+    if not DEVICE_ID_PATTERN.fullmatch(device_id):
+        raise ValueError("DEVICE_ID must be 1 to 3 capital letters or digits")
+
+
+def check_token(given, expected):
+    """Constant-time comparison of a pushed token with the configured one"""
+    return bool(expected) and hmac.compare_digest((given or '').encode(), expected.encode())
+
+
+def pushed_seq(conn, target):
+    """Highest change log seq the target has acknowledged"""
+    return conn.execute(
+        text("SELECT pushed_seq FROM sync_state WHERE target = :target"), {'target': target}
+    ).scalar() or 0
+
+
+def pending_count(conn, target):
+    """Change log entries not yet pushed to the target"""
+    return conn.execute(
+        text("SELECT COUNT(*) FROM sync_log WHERE seq > :after"), {'after': pushed_seq(conn, target)}
+    ).scalar()
+
+
+def pending(conn, after, limit):
+    """
+    The next batch of the change log after a seq.
+
+    Returns:
+        tuple: (last seq read, or None when nothing is pending; rows as lists in COLUMNS order)
+    """
+    last, rows = None, []
+    for seq, *values in conn.execute(text(PENDING), {'after': after, 'limit': limit}):
+        last = seq
+        if values[COLUMNS.index('invoice_number')] is not None:
+            rows.append(values)
+    return last, rows
+
+
+def encode_batch(device_id, after, last, rows):
+    """Batch request body: gzip-compressed JSON with the columns named once"""
+    body = json.dumps({'deviceId': device_id, 'afterSeq': after, 'lastSeq': last,
+                       'columns': COLUMNS, 'rows': rows}, separators=(',', ':'))
+    return gzip.compress(body.encode(), compresslevel=6)
+
+
+def decode_batch(body, content_encoding=None):
+    """Parse a batch request body, refusing anything over MAX_BATCH_BYTES once inflated"""
+    if content_encoding == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = inflater.decompress(body, MAX_BATCH_BYTES)
+        if inflater.unconsumed_tail:
+            raise ValueError("Sync batch is too large")
+    elif content_encoding:
+        raise ValueError(f"Unsupported Content-Encoding {content_encoding}")
+    try:
+        batch = json.loads(body)
+    except ValueError:
+        raise ValueError("Sync batch is not valid JSON")
+    if not isinstance(batch, dict) or not isinstance(batch.get('lastSeq'), int):
+        raise ValueError("Sync batch needs deviceId, lastSeq, columns and rows")
+    if len(batch.get('rows') or []) > MAX_BATCH_ROWS:
+        raise ValueError(f"At most {MAX_BATCH_ROWS} rows can be synced at once")
+    return batch
+
+
+def _build_service(columns, values):
+    fields = dict(zip(columns, values))
+    service = Service(**{column: fields.get(column) for column in COLUMNS})
+    for column in DATETIME_COLUMNS:
+        value = getattr(service, column)
+        if isinstance(value, str):
+            setattr(service, column, datetime.fromisoformat(value))
+    return service
+
+
+def receive(session, batch, own_device_id=''):
+    """
+    Apply a device's batch on the central node, inside the caller's transaction.
+
+    Args:
+        session: SQLAlchemy session
+        batch (dict): From decode_batch()
+        own_device_id (str): This node's DEVICE_ID, which no device may push as
+
+    Returns:
+        dict: The batch's lastSeq, rows inserted and skipped, and the invoice
+            numbers that clash with a different sale
+    """
+    device_id = batch.get('deviceId')
+    check_device_id(device_id, required=True)
+    if device_id == own_device_id:
+        raise ValueError(f"Device {device_id} is this node's own DEVICE_ID")
+
+    # The upsert runs first so the write lock is taken before anything is read;
+    # two pushes from one device queue instead of both inserting the batch
+    now = datetime.utcnow()
+    session.execute(
+        text("INSERT INTO sync_peer (device_id, last_seq, rows, last_push_at) "
+             "VALUES (:device_id, 0, 0, :now) "
+             "ON CONFLICT (device_id) DO UPDATE SET last_push_at = excluded.last_push_at"),
+        {'device_id': device_id, 'now': now}
+    )
+
+    # Rows are matched on invoice number rather than skipped by seq alone:
+    # a kiosk restored from an old backup numbers its change log again from
+    # where the backup was taken
+    columns = batch.get('columns') or COLUMNS
+    rows = batch.get('rows') or []
+    number_at, created_at = columns.index('invoice_number'), columns.index('created_at')
+    existing = {}
+    numbers = [values[number_at] for values in rows]
+    for start in range(0, len(numbers), 500):
+        chunk = numbers[start:start + 500]
+        existing.update(session.execute(
+            text("SELECT invoice_number, created_at FROM service WHERE invoice_number IN "
+                 "(" + ", ".join(f":n{i}" for i in range(len(chunk))) + ")"),
+            {f"n{i}": number for i, number in enumerate(chunk)}
+        ).fetchall())
+
+    new, conflicts = [], []
+    for values in rows:
+        number = values[number_at]
+        if number in existing:
+            # A replayed batch brings the same sale again; another sale under
+            # the same number is a device that reused its numbers
+            if str(existing[number]) != str(values[created_at]):
+                conflicts.append(number)
+            continue
+        existing[number] = values[created_at]
+        new.append(_build_service(columns, values))
+    if conflicts:
+        log.warning("Device %s sent %d invoice numbers that are already used: %s",
+                    device_id, len(conflicts), ", ".join(conflicts[:10]))
+
+    # Same bookkeeping as a sale made at this node
+    if new:
+        rollups.record_services(session, new)
+        devotees.record_services(session, new)
+        session.add_all(new)
+        session.flush()
+        for service in new:
+            roster.record_service(session, service)
+    session.execute(
+        text("UPDATE sync_peer SET last_seq = MAX(last_seq, :last_seq), rows = rows + :count "
+             "WHERE device_id = :device_id"),
+        {'last_seq': batch['lastSeq'], 'count': len(new), 'device_id': device_id}
+    )
+    return {'deviceId': device_id, 'lastSeq': batch['lastSeq'], 'inserted': len(new),
+            'duplicates': len(rows) - len(new) - len(conflicts), 'conflicts': conflicts}
+
+
+def _post(url, token, body, timeout):
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/sync/push", data=body, method='POST',
+        headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip', TOKEN_HEADER: token}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('message')
+        except ValueError:
+            message = e.reason
+        raise ValueError(f"Central node refused the batch ({e.code}): {message}")
+
+
+def push(engine, url, token, device_id, batch_size=500, timeout=30):
+    """
+    Push everything in the change log that the central node has not acknowledged.
+
+    Each batch's high-water mark is saved once the central node has
+    acknowledged it, so an interrupted push resumes where it stopped.
+
+    Args:
+        engine: SQLAlchemy engine of this node's database
+        url (str): Central node, e.g. http://central.local:5000
+
+    Returns:
+        dict: Rows and batches pushed and the acknowledged seq
+
+    Raises:
+        OSError: The central node could not be reached
+        ValueError: It refused a batch
+    """
+    check_device_id(device_id, required=True)
+    pushed = {'rows': 0, 'batches': 0, 'bytes': 0}
+    with engine.connect() as conn:
+        after = pushed_seq(conn, url)
+    while True:
+        with engine.connect() as conn:
+            last, rows = pending(conn, after, batch_size)
+        if last is None:
+            break
+        body = encode_batch(device_id, after, last, rows)
+        result = _post(url, token, body, timeout)
+        after = max(after, min(int(result['lastSeq']), last))
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO sync_state (target, pushed_seq, pushed_at) VALUES (:target, :seq, :now) "
+                     "ON CONFLICT (target) DO UPDATE SET pushed_seq = excluded.pushed_seq, "
+                     "pushed_at = excluded.pushed_at"),
+                {'target': url, 'seq': after, 'now': datetime.utcnow()}
+            )
+        pushed['rows'] += len(rows)
+        pushed['batches'] += 1
+        pushed['bytes'] += len(body)
+        if after < last:
+            raise ValueError(f"Central node acknowledged up to {after} of {last}")
+    pushed['lastSeq'] = after
+    return pushed
+
+
+class SyncAgent:
+    """Pushes this node's new sales to the central node every `interval` seconds"""
+
+    def __init__(self, app, url, token, interval=30.0, batch_size=500):
+        self.app = app
+        self.url = url
+        self.token = token
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_push_at = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sync-agent', daemon=True)
+        self._thread.start()
+
+    def push_now(self):
+        """Push at once instead of at the next interval"""
+        self._wake.set()
+
+    def stats(self):
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                pending_rows = pending_count(conn, self.url)
+        return {
+            'central': self.url,
+            'pendingRows': pending_rows,
+            'lastPushAt': self.last_push_at.isoformat() if self.last_push_at else None,
+            'lastError': self.last_error
+        }
+
+    def shutdown(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                return
+            try:
+                with self.app.app_context():
+                    result = push(db.engine, self.url, self.token,
+                                  self.app.config['DEVICE_ID'], self.batch_size)
+                self.last_push_at = datetime.utcnow()
+                self.last_error = None
+                if result['rows']:
+                    log.info("Pushed %d services in %d batches", result['rows'], result['batches'])
+            except (OSError, ValueError) as e:
+                # Offline is normal for a kiosk; try again next time
+                self.last_error = str(e)
+                log.warning("Sync push failed: %s", e)
+
+
+def main():
+    from app import app, init_db
+
+    parser = argparse.ArgumentParser(description="Push this kiosk's new sales to the central node")
+    parser.add_argument('command', choices=('push', 'status'))
+    parser.add_argument('--url', default=app.config['SYNC_URL'], help="Central node (default SYNC_URL)")
+    parser.add_argument('--batch-size', type=int, default=app.config['SYNC_BATCH_SIZE'])
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("Give --url or set SYNC_URL")
+
+    init_db()
+    with app.app_context():
+        if args.command == 'push':
+            result = push(db.engine, args.url, app.config['SYNC_TOKEN'],
+                          app.config['DEVICE_ID'], args.batch_size)
+            print(f"Pushed {result['rows']} services in {result['batches']} batches "
+                  f"({result['bytes']} bytes), acknowledged up to {result['lastSeq']}")
+        else:
+            with db.engine.connect() as conn:
+                print(f"Device {app.config['DEVICE_ID'] or '(none)'}: "
+                      f"{pending_count(conn, args.url)} services not yet pushed to {args.url}")
+
+
+if __name__ == '__main__':
+    main()
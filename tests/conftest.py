@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py reads these at import; keep the tests away from temple.db and .secret_key
+os.environ.setdefault('TEMPLE_DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='sscm-tests-'), 'temple.db'))
+os.environ.setdefault('TEMPLE_SECRET_KEY', 'tests')
+os.environ.setdefault('SYNC_TOKEN', 'tests')
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on an empty scratch database with the current schema"""
+    from app import init_db
+    from benchmarks.harness import use_database
+    app = use_database(str(tmp_path / 'temple.db'))
+    init_db()
+    return app
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+import app as app_module
+import archive
+from benchmarks.datagen import populate
+from extensions import db
+
+SALE = {'invoiceType': 'TOKEN', 'paymentMethod': 'CASH', 'frequency': 'SINGLE'}
+
+
+def test_archived_ids_are_not_issued_again(app):
+    db_path = app.config['DATABASE_PATH']
+    populate(db_path, 50, datetime(2020, 3, 1), datetime(2020, 4, 1))
+
+    with app.app_context():
+        # Every service moves out, leaving the hot table empty
+        assert archive.archive_year(2020, db_path, now=datetime(2022, 1, 1)) == 50
+        assert db.session.execute(text("SELECT COUNT(*) FROM service")).scalar() == 0
+        service = app_module.save_service(app_module.build_service(1, SALE))
+        db.session.commit()
+        assert service.id == 51
+
+    conn = archive.connect_range(datetime(2020, 1, 1), datetime(2100, 1, 1), db_path)
+    try:
+        ids = [id for id, in conn.execute("SELECT id FROM service")]
+    finally:
+        conn.close()
+    assert len(ids) == 51 and len(set(ids)) == 51
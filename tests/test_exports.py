@@ -0,0 +1,58 @@
+import os
+import sys
+import zipfile
+from datetime import datetime
+
+import pytest
+
+import exports
+from benchmarks.datagen import populate
+
+START, END = datetime(2025, 1, 1), datetime(2025, 2, 1)
+
+
+@pytest.fixture
+def reports_dir(app, tmp_path, monkeypatch):
+    directory = tmp_path / 'reports'
+    monkeypatch.setattr(exports, 'REPORTS_DIR', str(directory))
+    populate(app.config['DATABASE_PATH'], 200, START, END)
+    return directory
+
+
+def test_export_is_renamed_into_place(app, reports_dir):
+    path = exports.export_range(START, END, 'csv', db_path=app.config['DATABASE_PATH'])
+    assert os.path.basename(path) == 'Temple_Export_2025-01-01_2025-02-01.zip'
+    assert os.listdir(reports_dir) == [os.path.basename(path)]
+    with zipfile.ZipFile(path) as bundle:
+        assert 'Summary.csv' in bundle.namelist()
+
+
+def test_failed_export_leaves_no_file(app, reports_dir, monkeypatch):
+    def fail(conn, start, end, output_file, chunk_size):
+        open(output_file, 'w').close()
+        raise RuntimeError("disk full")
+    monkeypatch.setitem(exports.WRITERS, 'csv', fail)
+    with pytest.raises(RuntimeError):
+        exports.export_range(START, END, 'csv', db_path=app.config['DATABASE_PATH'])
+    assert os.listdir(reports_dir) == []
+
+
+def test_oldest_exports_are_evicted(app, reports_dir):
+    db_path = app.config['DATABASE_PATH']
+    first = exports.export_range(START, datetime(2025, 1, 10), 'csv', db_path=db_path)
+    os.utime(first, (0, 0))
+    second = exports.export_range(datetime(2025, 1, 10), END, 'csv', db_path=db_path)
+    third = exports.export_range(START, END, 'csv', db_path=db_path)
+    exports.evict(os.path.getsize(second) + os.path.getsize(third), keep=third)
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+
+
+def test_parquet_without_pyarrow_is_rejected_up_front(app, monkeypatch):
+    # A None entry makes the package look not installed
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    client = app.test_client()
+    client.post('/login', data={'username': 'clerk', 'password': 'clerk123'})
+    response = client.post('/reports/exports?start=2025-01-01&end=2025-02-01&format=parquet')
+    assert response.status_code == 400
+    assert 'pyarrow' in response.get_json()['message']
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from extensions import db
+from group_commit import GroupCommitter
+
+ADDRESS = {'address1': 'a', 'city': 'c', 'district': 'd', 'state': 's', 'pincode': '522001'}
+SALE = {'invoiceType': 'TOKEN', 'paymentMethod': 'CASH', 'frequency': 'SINGLE', 'devoteeName': 'A',
+        'gothram': 'g', 'pujaDetails': 'p', 'devoteeContactNum': '9876543211', 'address': ADDRESS}
+
+
+def committer(app, write=app_module.write_sale):
+    # A long wait so sales submitted together share a batch
+    return GroupCommitter(app, app_module.prepare_sale, write, batch_wait=0.2)
+
+
+def services(app):
+    with app.app_context():
+        return db.session.execute(text("SELECT id, invoice_number FROM service ORDER BY id")).fetchall()
+
+
+def test_bad_sale_fails_alone_and_good_sale_is_answered(app):
+    def write(service):
+        if service.devotee_name == 'clash':
+            # Passes prepare, then breaks the batch's flush on the UNIQUE index
+            service.invoice_number = 'TA0001'
+        return app_module.write_sale(service)
+
+    group = committer(app, write)
+    try:
+        good = group.submit(1, SALE)
+        bad = group.submit(1, dict(SALE, devoteeName='clash'))
+        sale = good.result(10)
+        with pytest.raises(Exception):
+            bad.result(10)
+    finally:
+        group.shutdown(10)
+
+    assert sale['printData']['invoiceNumber'] == 'TA0001'
+    assert isinstance(sale['printData']['amount'], float)
+    assert services(app) == [(sale['id'], 'TA0001')]
+
+
+def test_mixed_requests_through_create_service(app, monkeypatch):
+    group = committer(app)
+    monkeypatch.setattr(app_module, 'group_committer', group)
+    responses = {}
+
+    def post(name, data):
+        client = app.test_client()
+        client.post('/login', data={'username': 'clerk', 'password': 'clerk123'})
+        responses[name] = client.post('/temple-management/services?serviceType=1', json=data)
+
+    missing_payment = {key: value for key, value in SALE.items() if key != 'paymentMethod'}
+    threads = [threading.Thread(target=post, args=('good', SALE)),
+               threading.Thread(target=post, args=('bad', missing_payment))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        group.shutdown(10)
+
+    assert responses['bad'].status_code == 400
+    assert 'paymentMethod' in responses['bad'].get_json()['message']
+    assert responses['good'].status_code == 200
+    assert [number for _, number in services(app)] == [responses['good'].get_json()['id']]
@@ -0,0 +1,142 @@
+import itertools
+import threading
+
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from extensions import db
+from models import Service
+from sequences import (BlockAllocator, MAX_ORDINAL, NUMBERS_PER_LETTER, allocate,
+                       format_invoice_number, get_block_allocator, parse_invoice_number)
+
+THREADS = 8
+
+
+def start_at(app, prefix, ordinal):
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO invoice_sequence (prefix, next_value) VALUES (:prefix, :value)"),
+                     {'prefix': prefix, 'value': ordinal})
+
+
+def run_threads(app, work, per_thread):
+    """Run work() per_thread times in each of THREADS threads; all results in one list"""
+    results, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                issued = [work() for _ in range(per_thread)]
+            except Exception as e:
+                errors.append(e)
+                return
+        with lock:
+            results.extend(issued)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    return results
+
+
+def test_format_rolls_over_series_letters():
+    assert format_invoice_number('T', 0) == 'TA0001'
+    assert format_invoice_number('T', NUMBERS_PER_LETTER - 1) == 'TA9999'
+    assert format_invoice_number('T', NUMBERS_PER_LETTER) == 'TB0001'
+    assert format_invoice_number('T', MAX_ORDINAL - 1) == 'TZ9999'
+    with pytest.raises(ValueError):
+        format_invoice_number('T', MAX_ORDINAL)
+    for ordinal in (0, NUMBERS_PER_LETTER - 1, NUMBERS_PER_LETTER, MAX_ORDINAL - 1):
+        assert parse_invoice_number(format_invoice_number('K1T', ordinal)) == ordinal
+
+
+def test_concurrent_allocate_is_unique_and_contiguous(app):
+    first = NUMBERS_PER_LETTER - 100
+    start_at(app, 'T', first)
+
+    def work():
+        with db.engine.begin() as conn:
+            return format_invoice_number('T', allocate(conn, 'T')[0])
+
+    numbers = run_threads(app, work, per_thread=50)
+    assert len(set(numbers)) == len(numbers)
+    ordinals = sorted(parse_invoice_number(number) for number in numbers)
+    assert ordinals == list(range(first, first + THREADS * 50))
+    assert 'TA9999' in numbers and 'TB0001' in numbers
+
+
+def test_concurrent_block_allocator_is_unique(app):
+    first = NUMBERS_PER_LETTER - 100
+    block_size = 7
+    start_at(app, 'R', first)
+    allocator = BlockAllocator(block_size)
+
+    numbers = run_threads(app, lambda: allocator.next_invoice_number('R'), per_thread=40)
+    assert len(set(numbers)) == len(numbers)
+    ordinals = sorted(parse_invoice_number(number) for number in numbers)
+    # One allocator shares its blocks, so only the last block is partly used
+    reserved = range(first, first + block_size * -(-len(numbers) // block_size))
+    assert ordinals == list(reserved)[:len(numbers)]
+    assert 'RA9999' in numbers and 'RB0001' in numbers
+
+
+def test_allocate_stops_after_last_series(app):
+    start_at(app, 'T', MAX_ORDINAL - THREADS)
+
+    def work():
+        with db.engine.begin() as conn:
+            return format_invoice_number('T', allocate(conn, 'T')[0])
+
+    numbers = run_threads(app, work, per_thread=1)
+    assert sorted(numbers) == [f"TZ{n:04d}" for n in range(9999 - THREADS + 1, 10000)]
+    with app.app_context(), db.engine.begin() as conn:
+        with pytest.raises(ValueError):
+            format_invoice_number('T', allocate(conn, 'T')[0])
+
+
+def test_separate_block_allocators_never_overlap(app):
+    # One allocator per thread stands in for one per server process
+    start_at(app, 'T', NUMBERS_PER_LETTER - 50)
+    allocators = threading.local()
+
+    def work():
+        if not hasattr(allocators, 'allocator'):
+            allocators.allocator = BlockAllocator(5)
+        return allocators.allocator.next_invoice_number('T')
+
+    numbers = run_threads(app, work, per_thread=23)
+    assert len(set(numbers)) == len(numbers)
+
+
+
+@pytest.mark.parametrize('block_size', [0, 10])
+def test_sale_path_issues_thousands_without_gaps(app, monkeypatch, block_size):
+    monkeypatch.setitem(app.config, 'INVOICE_BLOCK_SIZE', block_size)
+    if block_size:
+        # Blocks reserved against another test's database mean nothing here
+        get_block_allocator(block_size).reset()
+    invoice_types = itertools.cycle(('TOKEN', 'RECEIPT'))
+
+    def work():
+        # What create_service does for one sale
+        data = {'invoiceType': next(invoice_types), 'paymentMethod': 'CASH', 'frequency': 'SINGLE'}
+        service = app_module.save_service(app_module.build_service(1, data))
+        db.session.commit()
+        return service.invoice_number
+
+    numbers = run_threads(app, work, per_thread=400)
+    assert len(numbers) == THREADS * 400
+    assert len(set(numbers)) == len(numbers)
+    with app.app_context():
+        stored = [number for number, in db.session.execute(text("SELECT invoice_number FROM service"))]
+        prefixes = [Service.invoice_prefix(invoice_type) for invoice_type in ('TOKEN', 'RECEIPT')]
+    assert sorted(stored) == sorted(numbers)
+    for prefix in prefixes:
+        ordinals = sorted(parse_invoice_number(number) for number in numbers if number.startswith(prefix))
+        assert ordinals == list(range(len(ordinals)))
@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+
+import report_cache
+
+
+@pytest.fixture
+def reports_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_cache, 'REPORTS_DIR', str(tmp_path))
+    # One fixed data version per month; no database needed
+    monkeypatch.setattr(report_cache, 'data_version', lambda conn, year, month: f"{month}-{month}")
+    return tmp_path
+
+
+def write(year, month, output_file):
+    with open(output_file, 'w') as handle:
+        handle.write(f"{year}-{month}")
+
+
+def test_cache_hit_does_not_wait_for_another_months_build(reports_dir):
+    cached, _ = report_cache.get_report(None, write, 2025, 3)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(year, month, output_file):
+        started.set()
+        release.wait(10)
+        write(year, month, output_file)
+
+    builder = threading.Thread(target=report_cache.get_report, args=(None, slow, 2025, 4))
+    builder.start()
+    try:
+        assert started.wait(10)
+        hits = []
+        reader = threading.Thread(target=lambda: hits.append(report_cache.get_report(None, write, 2025, 3)))
+        reader.start()
+        reader.join(5)
+        assert hits == [(cached, os.path.basename(cached))]
+    finally:
+        release.set()
+        builder.join()
+
+
+def test_same_report_is_built_once(reports_dir):
+    builds = []
+    barrier = threading.Barrier(4)
+
+    def counted(year, month, output_file):
+        builds.append(month)
+        write(year, month, output_file)
+
+    def request():
+        barrier.wait()
+        report_cache.get_report(None, counted, 2025, 5)
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [5]
@@ -0,0 +1,48 @@
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+import analytics
+import app as app_module
+import rollups
+from extensions import db
+
+SALE = {'invoiceType': 'TOKEN', 'paymentMethod': 'CASH', 'frequency': 'SINGLE'}
+
+
+def sell_at(created_at):
+    service = app_module.build_service(1, SALE)
+    service.created_at = created_at
+    app_module.save_service(service)
+    db.session.commit()
+
+
+def rollup_days(conn):
+    return conn.execute(text(
+        "SELECT day, count FROM daily_rollup WHERE dimension = 'invoice_type' ORDER BY day"
+    )).fetchall()
+
+
+def test_sales_count_on_the_local_day(app):
+    with app.app_context():
+        # 23:59 IST on 31 December, 00:30 IST on 1 January, 01:30 IST on 2 January
+        for created_at in (datetime(2024, 12, 31, 18, 29), datetime(2024, 12, 31, 19, 0),
+                           datetime(2025, 1, 1, 20, 0)):
+            sell_at(created_at)
+        recorded = rollup_days(db.session)
+        assert recorded == [('2024-12-31', 1), ('2025-01-01', 1), ('2025-01-02', 1)]
+
+        with db.engine.begin() as conn:
+            assert rollups.verify(conn) == []
+            rollups.rebuild(conn)
+            assert rollup_days(conn) == recorded
+            assert rollups.verify(conn, date(2025, 1, 1), date(2025, 1, 2)) == []
+            assert rollups.totals(conn, date(2025, 1, 2), date(2025, 1, 3))['count'] == 1
+
+
+def test_trends_use_the_local_day(app):
+    with app.app_context():
+        sell_at(datetime(2025, 1, 1, 20, 0))
+    snapshot = analytics.Snapshot(app.config['DATABASE_PATH'])
+    snapshot.update()
+    assert snapshot.arrays['day'].tolist() == [(date(2025, 1, 2) - date(1970, 1, 1)).days]
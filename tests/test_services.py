@@ -0,0 +1,27 @@
+import pytest
+
+ADDRESS = {'address1': 'a', 'city': 'c', 'district': 'd', 'state': 's', 'pincode': '522001'}
+DEVOTEE = {'paymentMethod': 'CASH', 'devoteeName': 'A', 'gothram': 'g', 'pujaDetails': 'p',
+           'devoteeContactNum': '9876543211', 'address': ADDRESS}
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'clerk', 'password': 'clerk123'})
+    return client
+
+
+def test_bulk_amounts_match_single_sale(client):
+    single = client.post('/temple-management/services?serviceType=1',
+                         json=dict(DEVOTEE, invoiceType='TOKEN', frequency='SINGLE')).get_json()
+    bulk = client.post('/temple-management/services/bulk', json=dict(
+        DEVOTEE, items=[{'serviceType': 1, 'quantity': 2}, {'serviceType': 5, 'quantity': 1, 'frequency': 'WEEKLY'}]
+    )).get_json()
+
+    assert bulk['status'] == 'success'
+    assert isinstance(single['amount'], float)
+    assert [type(slip['amount']) for slip in bulk['printData']] == [float] * 3
+    assert bulk['printData'][0]['amount'] == single['amount']
+    assert isinstance(bulk['amount'], float)
+    assert bulk['amount'] == sum(slip['amount'] for slip in bulk['printData'])
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+import archive
+import sync
+from benchmarks.datagen import populate
+from benchmarks.harness import serve
+from benchmarks.loadtest import free_port, wait_until_ready
+from extensions import db
+
+DEVICE_ID = 'K1'
+
+
+@pytest.fixture
+def central(tmp_path):
+    """A second instance on its own database, serving /sync/push; yields (url, db path)"""
+    db_path = str(tmp_path / 'central' / 'temple.db')
+    os.makedirs(os.path.dirname(db_path))
+    port = free_port()
+    # Forked, so it shares this process's SYNC_TOKEN (conftest)
+    process = multiprocessing.get_context('fork').Process(target=serve, args=(db_path, port), daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(url)
+        yield url, db_path
+    finally:
+        process.terminate()
+        process.join()
+
+
+def central_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*), COUNT(DISTINCT invoice_number) FROM service").fetchone()
+    finally:
+        conn.close()
+
+
+def test_replayed_push_is_not_applied_twice(app, central):
+    url, central_db = central
+    token = os.environ['SYNC_TOKEN']
+    populate(app.config['DATABASE_PATH'], 120, datetime(2025, 1, 1), datetime(2025, 2, 1))
+
+    with app.app_context():
+        result = sync.push(db.engine, url, token, DEVICE_ID, batch_size=50)
+        assert (result['rows'], result['batches']) == (120, 3)
+        assert central_rows(central_db) == (120, 120)
+
+        # The acknowledgement got lost: the kiosk sends everything again
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM sync_state"))
+        result = sync.push(db.engine, url, token, DEVICE_ID, batch_size=50)
+        assert result['rows'] == 120
+        assert central_rows(central_db) == (120, 120)
+
+        # One batch delivered twice is acknowledged both times, applied once
+        with db.engine.connect() as conn:
+            last, rows = sync.pending(conn, 0, 10)
+        body = sync.encode_batch(DEVICE_ID, 0, last, rows)
+        answers = [sync._post(url, token, body, timeout=10) for _ in range(2)]
+        assert [(a['lastSeq'], a['inserted'], a['duplicates']) for a in answers] == [(last, 0, 10)] * 2
+        assert central_rows(central_db) == (120, 120)
+
+        with db.engine.connect() as conn:
+            assert sync.pending_count(conn, url) == 0
+
+
+def test_archive_waits_for_push(app):
+    db_path = app.config['DATABASE_PATH']
+    url = 'http://central.invalid:5000'
+    populate(db_path, 30, datetime(2020, 3, 1), datetime(2020, 4, 1))
+    now = datetime(2022, 1, 1)
+
+    with app.app_context():
+        with pytest.raises(ValueError, match="30 services of 2020 have not been pushed"):
+            archive.archive_year(2020, db_path, now=now, sync_targets=[url])
+
+        # Pushed up to all but the last service
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO sync_state (target, pushed_seq) "
+                              "SELECT :target, MAX(seq) - 1 FROM sync_log"), {'target': url})
+        with pytest.raises(ValueError, match="1 services of 2020"):
+            archive.archive_year(2020, db_path, now=now)
+
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE sync_state SET pushed_seq = pushed_seq + 1"))
+        assert archive.archive_year(2020, db_path, now=now, sync_targets=[url]) == 30
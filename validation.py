@@ -0,0 +1,85 @@
+import re
+from models import ServiceType, InvoiceType, PaymentMethod, Frequency
+import catalog
+
+# Field rules from SSCM_WEBDesign.txt for POST /temple-management/services
+
+DEVOTEE_FIELDS = {
+    'devoteeName': 'devotee name',
+    'gothram': 'gothram',
+    'pujaDetails': 'puja details',
+    'devoteeContactNum': 'contact number',
+}
+
+CONTACT_NUMBER = re.compile(r'\+?\d{10,14}')
+PINCODE = re.compile(r'\d{6}')
+
+INVOICE_TYPES = {invoice_type.value for invoice_type in InvoiceType}
+PAYMENT_METHODS = {payment_method.value for payment_method in PaymentMethod}
+FREQUENCIES = {frequency.value for frequency in Frequency}
+
+
+def details_optional(service_type, frequency):
+    """Devotee details are optional only for single Abhishekam and for Ashtothram"""
+    return (service_type == ServiceType.ABHISHEKAM.value and frequency == 'SINGLE') \
+        or service_type == ServiceType.ASHTOTHRAM.value
+
+
+def validate_sale(service_type, data):
+    """
+    Check the fields a service row cannot be written without.
+
+    Raises:
+        ValueError: With a message suitable for the counter clerk
+    """
+    # Anything in the catalog with a price today can be sold
+    if not catalog.get().is_sold(service_type):
+        raise ValueError("Invalid service type")
+
+    if data.get('invoiceType') not in INVOICE_TYPES:
+        raise ValueError("invoiceType must be TOKEN or RECEIPT")
+
+    if (data.get('frequency') or 'SINGLE') not in FREQUENCIES:
+        raise ValueError("frequency must be SINGLE, WEEKLY or MONTHLY")
+
+    if data.get('paymentMethod') not in PAYMENT_METHODS:
+        raise ValueError("paymentMethod must be UPI, CASH or CARD")
+
+
+def validate_service_data(service_type, data):
+    """
+    Check one service request against the design rules.
+
+    Raises:
+        ValueError: With a message suitable for the counter clerk
+    """
+    validate_sale(service_type, data)
+    invoice_type = data.get('invoiceType')
+    frequency = data.get('frequency') or 'SINGLE'
+
+    if service_type == ServiceType.ASHTOTHRAM.value:
+        if invoice_type != 'TOKEN' or frequency != 'SINGLE':
+            raise ValueError("Ashtothram is issued only as a single TOKEN")
+
+    if service_type == ServiceType.ABHISHEKAM.value and frequency != 'SINGLE':
+        # Weekly/monthly Abhishekam needs a receipt with name, gothram and
+        # puja details; contact number and address stay optional
+        if invoice_type != 'RECEIPT':
+            raise ValueError("Weekly and monthly Abhishekam need a RECEIPT")
+        required = ('devoteeName', 'gothram', 'pujaDetails')
+    elif details_optional(service_type, frequency):
+        required = ()
+    else:
+        required = tuple(DEVOTEE_FIELDS) + ('address',)
+
+    for field in required:
+        if not data.get(field):
+            raise ValueError(f"{DEVOTEE_FIELDS.get(field, field)} is required for this service")
+
+    contact_number = data.get('devoteeContactNum')
+    if contact_number and not CONTACT_NUMBER.fullmatch(contact_number):
+        raise ValueError("Contact number must be 10 to 14 digits")
+
+    pincode = (data.get('address') or {}).get('pincode')
+    if pincode and not PINCODE.fullmatch(pincode):
+        raise ValueError("Pincode must be 6 digits")